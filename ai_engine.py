@@ -1,26 +1,31 @@
-import aiohttp
+import asyncio
 import json
 import base64
 from datetime import datetime
-import pytz
-from config import GROQ_KEY, TIMEZONE, logger
-from utils import clean_json_response, get_weather, get_video_transcript
+from config import (GROQ_AUDIO_TIMEOUT, SUMMARY_EVERY_TURNS, SUMMARY_KEEP_RAW, YT_CACHE_TTL, YT_CACHE_MAX,
+                    YT_CHUNK_TOKENS, YT_MAP_CONCURRENCY, YT_MAX_CHUNKS, logger)
+from utils import clean_json_response, partial_json_string, get_video_transcript, split_text, user_tz
+from weather import weather
+from groq_client import groq
 from locales import t
 
 MODEL_TEXT = "llama-3.3-70b-versatile"
 MODEL_VISION = "llama-3.2-11b-vision-preview"
 MODEL_AUDIO = "whisper-large-v3"
+MODEL_SUMMARY = "llama-3.1-8b-instant"
+
+# Лічильник реплік з останнього підсумку і активні задачі підсумку (user_id -> Task)
+_turns_since_summary = {}
+_summary_tasks = {}
+# Підсумки відео, що генеруються зараз: (video_id, lang) -> Task; лічильники кешу для /stats
+_video_tasks = {}
+video_cache_stats = {"hits": 0, "misses": 0, "joined": 0}
+# Спільний ліміт одночасних map-запитів для всіх відео
+_map_semaphore = asyncio.Semaphore(YT_MAP_CONCURRENCY)
 
 async def groq_transcribe(file_path, lang="uk"):
-    url = "https://api.groq.com/openai/v1/audio/transcriptions"
     try:
-        with open(file_path, 'rb') as f:
-            data = aiohttp.FormData()
-            data.add_field('file', f)
-            data.add_field('model', MODEL_AUDIO)
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers={"Authorization": f"Bearer {GROQ_KEY}"}, data=data) as resp:
-                    return (await resp.json()).get('text', '')
+        return (await groq.transcribe(file_path, MODEL_AUDIO, GROQ_AUDIO_TIMEOUT)).get('text', '')
     except Exception as e:
         logger.error(f"Transcribe error: {e}")
         return ""
@@ -40,11 +45,30 @@ async def groq_analyze_image(text_prompt, image_path, is_toxic, lang="uk"):
         "max_tokens": 400
     }
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post("https://api.groq.com/openai/v1/chat/completions",
-                headers={"Authorization": f"Bearer {GROQ_KEY}"}, json=payload) as resp:
-                return (await resp.json())['choices'][0]['message']['content']
-    except: return "Error analyzing image."
+        return (await groq.chat(payload))['choices'][0]['message']['content']
+    except Exception as e:
+        logger.error(f"Vision error: {e}")
+        return t("ai_busy", lang)
+
+async def _complete(model, messages, max_tokens=None):
+    payload = {"model": model, "messages": messages}
+    if max_tokens:
+        payload["max_tokens"] = max_tokens
+    return (await groq.chat(payload))['choices'][0]['message']['content']
+
+async def _summarize_chunk(chunk, index, total, lang):
+    """Map-крок: стислі тези одного шматка субтитрів (швидка модель)"""
+    async with _map_semaphore:
+        try:
+            return await _complete(MODEL_SUMMARY, [
+                {"role": "system", "content": f"You summarize part {index} of {total} of a video transcript. "
+                                              f"List the key points, facts, numbers and names in 5-10 short bullets. "
+                                              f"No intro. Language: {lang}."},
+                {"role": "user", "content": chunk}
+            ], max_tokens=500)
+        except Exception as e:
+            logger.error(f"Summarize chunk {index}/{total} error: {e}")
+            return None
 
 async def groq_summarize_video(video_id, lang="uk"):
     transcript = await get_video_transcript(video_id, lang)
@@ -60,38 +84,82 @@ async def groq_summarize_video(video_id, lang="uk"):
     2. 🔑 Key Takeaways (3-5 bullet points).
     3. 💡 Interesting insight.
     """
-    
-    payload = {
-        "model": MODEL_TEXT,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Transcript: {transcript}"}
-        ]
-    }
+
+    chunks = split_text(transcript, YT_CHUNK_TOKENS)
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post("https://api.groq.com/openai/v1/chat/completions",
-                headers={"Authorization": f"Bearer {GROQ_KEY}"}, json=payload) as resp:
-                data = await resp.json()
-                return data['choices'][0]['message']['content']
+        if len(chunks) == 1:
+            content = f"Transcript: {transcript}"
+        else:
+            # Map-reduce: шматки підсумовуються паралельно (не більше YT_MAP_CONCURRENCY одночасно),
+            # потім одна фінальна відповідь у звичній структурі з усіх тез
+            if len(chunks) > YT_MAX_CHUNKS:
+                logger.warning(f"Video {video_id}: {len(chunks)} chunks, summarizing first {YT_MAX_CHUNKS}")
+                chunks = chunks[:YT_MAX_CHUNKS]
+            parts = await asyncio.gather(*(_summarize_chunk(c, i + 1, len(chunks), lang) for i, c in enumerate(chunks)))
+            notes = [f"Part {i + 1}/{len(chunks)}:\n{p}" for i, p in enumerate(parts) if p]
+            if not notes:
+                return None
+            content = "Notes on consecutive parts of the transcript:\n\n" + "\n\n".join(notes)
+        return await _complete(MODEL_TEXT, [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": content}
+        ])
     except Exception as e:
         logger.error(f"Summarize error: {e}")
         return None
 
-async def groq_text_brain(text, user_id, is_toxic, lat, lon, lang="uk", is_forwarded=False):
+async def get_video_summary(video_id, lang="uk"):
+    """Підсумок відео: з кешу в базі, інакше groq_summarize_video. Одночасні запити того ж відео
+    чекають одну задачу - один запит субтитрів і один виклик LLM"""
+    from database import Database
+
+    key = (video_id, lang)
+    if key not in _video_tasks:
+        summary = await Database.get_yt_summary(video_id, lang, YT_CACHE_TTL)
+        if summary:
+            video_cache_stats["hits"] += 1
+            return summary
+    # Задачу могли запустити й поки читали кеш
+    task = _video_tasks.get(key)
+    if task:
+        video_cache_stats["joined"] += 1
+    else:
+        video_cache_stats["misses"] += 1
+        task = asyncio.create_task(_summarize_and_cache(video_id, lang))
+        _video_tasks[key] = task
+        task.add_done_callback(lambda _: _video_tasks.pop(key, None))
+    # shield: користувач, що пішов, не скасовує підсумок для інших
+    return await asyncio.shield(task)
+
+async def _summarize_and_cache(video_id, lang):
+    from database import Database
+
+    summary = await groq_summarize_video(video_id, lang)
+    if summary:
+        try:
+            await Database.put_yt_summary(video_id, lang, summary, YT_CACHE_TTL, YT_CACHE_MAX)
+        except Exception as e:
+            logger.error(f"YouTube cache error: {e}")
+    return summary
+
+async def _brain_messages(text, user_id, is_toxic, lat, lon, lang, is_forwarded, tz_name):
     from database import Database
     
     notes = await Database.get_recent_notes(user_id)
-    history = await Database.get_context(user_id)
+    memory = await Database.get_memory(user_id)
+    # Старі репліки вже згорнуті в підсумок - сирими йдуть тільки новіші
+    history = await Database.get_context(user_id, after_seq=memory["upto"])
     
+    # Погоду в чаті не чекаємо: лише з кешу, при промаху кеш оновиться у фоні
     weather_info = "Unknown"
-    if lat and lon:
-        w = await get_weather(lat, lon)
-        if w: weather_info = f"{w['temp']}°C, Rain: {w['rain']}%"
+    w = weather.peek(lat, lon)
+    if w: weather_info = f"{w['temp']}°C, Rain: {w['rain']}%"
 
-    now = datetime.now(pytz.timezone(TIMEZONE))
+    # Час у поясі користувача: LLM рахує "завтра о 9" саме від нього
+    now = datetime.now(user_tz(tz_name))
     persona = t("ai_persona_toxic", lang) if is_toxic else t("ai_persona_nice", lang)
 
+    # "reply" першим: при стрімінгу текст відповіді видно, поки генеруються решта полів
     system_prompt = f"""
     {persona}. 
     User Language: {lang} (Strictly output in this language).
@@ -101,29 +169,106 @@ async def groq_text_brain(text, user_id, is_toxic, lat, lon, lang="uk", is_forwa
     INSTRUCTION: 
     1. If user asks to save something -> return "save_note": "text".
     2. If user asks to remind -> return "is_reminder": true, "task": "short desc", "time": "YYYY-MM-DD HH:MM:SS" (convert relative time to exact timestamp).
+       Repeating reminder -> "recurrence": alias or RRULE (every Monday -> "FREQ=WEEKLY;BYDAY=MO", every 3 days -> "FREQ=DAILY;INTERVAL=3"), "time" = first occurrence.
     3. Else -> just chat.
     
-    JSON OUTPUT ONLY:
+    JSON OUTPUT ONLY, keys in exactly this order, nothing before or after the object:
     {{
+        "reply": "string",
         "is_reminder": boolean,
         "task": "string|null",
         "time": "YYYY-MM-DD HH:MM:SS|null",
-        "recurrence": "daily"|"weekly"|null,
-        "save_note": "string|null",
-        "reply": "string"
+        "recurrence": "daily"|"weekly"|"weekdays"|"monthly"|"yearly"|"FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,TH"|null,
+        "save_note": "string|null"
     }}
     """
     
-    messages = [{"role": "system", "content": system_prompt}] + history + [{"role": "user", "content": text}]
-    
+    messages = [{"role": "system", "content": system_prompt}]
+    if memory["summary"]:
+        messages.append({"role": "system", "content": f"Summary of the earlier conversation: {memory['summary']}"})
+    return messages + history + [{"role": "user", "content": text}]
+
+async def groq_text_brain(text, user_id, is_toxic, lat, lon, lang="uk", is_forwarded=False, tz_name=None):
+    messages = await _brain_messages(text, user_id, is_toxic, lat, lon, lang, is_forwarded, tz_name)
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post("https://api.groq.com/openai/v1/chat/completions",
-                headers={"Authorization": f"Bearer {GROQ_KEY}"}, 
-                json={"model": MODEL_TEXT, "messages": messages, "response_format": {"type": "json_object"}}) as resp:
-                data = await resp.json()
-                content = data['choices'][0]['message']['content']
-                return json.loads(clean_json_response(content))
+        data = await groq.chat({"model": MODEL_TEXT, "messages": messages, "response_format": {"type": "json_object"}})
+        content = data['choices'][0]['message']['content']
+        return json.loads(clean_json_response(content))
     except Exception as e:
         logger.error(f"Brain error: {e}")
         return None
+
+async def groq_text_brain_stream(text, user_id, is_toxic, lat, lon, lang="uk", is_forwarded=False, tz_name=None, on_reply=None):
+    """Те саме, що groq_text_brain, але зі stream=true: on_reply(текст) отримує вже згенеровану частину "reply".
+    JSON mode Groq не стрімиться, тож формат тримає промпт, а весь об'єкт розбирається, коли він закрився"""
+    messages = await _brain_messages(text, user_id, is_toxic, lat, lon, lang, is_forwarded, tz_name)
+    content = ""
+    shown = None
+    try:
+        async with groq.chat_stream({"model": MODEL_TEXT, "messages": messages}) as resp:
+            # Server-sent events: "data: {chunk}" по рядку, в кінці "data: [DONE]"
+            async for line in resp.content:
+                line = line.strip()
+                if not line.startswith(b"data:"):
+                    continue
+                chunk = line[5:].strip()
+                if chunk == b"[DONE]":
+                    break
+                delta = json.loads(chunk)['choices'][0]['delta'].get('content')
+                if not delta:
+                    continue
+                content += delta
+                if on_reply:
+                    reply = partial_json_string(content, "reply")
+                    if reply and reply != shown:
+                        shown = reply
+                        on_reply(reply)
+        if "{" not in content:
+            # Модель відповіла просто текстом - це і є відповідь
+            return {"reply": content.strip()} if content.strip() else None
+        return json.loads(clean_json_response(content), strict=False)
+    except Exception as e:
+        logger.error(f"Brain stream error: {e}")
+        return None
+
+def schedule_summary(user_id, turns=2):
+    """Рахує нові репліки і раз на SUMMARY_EVERY_TURNS запускає підсумок у фоні"""
+    count = _turns_since_summary.get(user_id, 0) + turns
+    if count < SUMMARY_EVERY_TURNS or user_id in _summary_tasks:
+        _turns_since_summary[user_id] = count
+        return
+    _turns_since_summary[user_id] = 0
+    task = asyncio.create_task(summarize_history(user_id))
+    _summary_tasks[user_id] = task
+    task.add_done_callback(lambda _: _summary_tasks.pop(user_id, None))
+
+async def summarize_history(user_id):
+    """Згортає репліки, що випадають з вікна, у короткий підсумок у users.memory_json"""
+    from database import Database
+
+    try:
+        await Database.flush()
+        memory = await Database.get_memory(user_id)
+        upto = await Database.get_last_seq(user_id) - SUMMARY_KEEP_RAW
+        if upto <= memory["upto"]:
+            return
+        turns = await Database.get_context_range(user_id, memory["upto"], upto)
+        if not turns:
+            return
+
+        dialog = "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+        payload = {
+            "model": MODEL_SUMMARY,
+            "messages": [
+                {"role": "system", "content": "Update the running summary of a chat between a user and an assistant. "
+                                              "Keep facts, preferences, plans and open questions. Max 120 words. "
+                                              "Write in the language of the conversation. Output only the summary."},
+                {"role": "user", "content": f"Current summary: {memory['summary'] or '-'}\n\nNew messages:\n{dialog}"}
+            ],
+            "max_tokens": 300
+        }
+        data = await groq.chat(payload)
+        summary = data['choices'][0]['message']['content'].strip()
+        await Database.set_memory(user_id, summary, upto)
+    except Exception as e:
+        logger.error(f"Summary error: {e}")
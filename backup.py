@@ -0,0 +1,208 @@
+"""Онлайн-бекапи бази через SQLite backup API.
+
+Знімок робиться у фоновому потоці одним кроком backup API (у WAL бот при цьому пише далі),
+стискається zstd (якщо є) або gzip, поруч кладеться .sha256. Зберігаються останні BACKUP_KEEP знімків.
+У шардованому режимі (DB_SHARDS > 1) усі файли шардів пакуються в один .tar.gz.
+"""
+import os
+import gzip
+import shutil
+import sqlite3
+import asyncio
+import hashlib
+import tarfile
+import tempfile
+from datetime import datetime
+from config import DB_NAME, DB_SHARDS, BACKUP_DIR, BACKUP_KEEP, logger
+from database import shard_path
+
+try:
+    import zstandard
+except ImportError:  # опційна залежність
+    zstandard = None
+
+def _open_compressed(path, mode):
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("zstandard is not installed")
+        if "w" in mode:
+            return zstandard.ZstdCompressor(level=10).stream_writer(open(path, "wb"))
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"))
+    return gzip.open(path, mode)
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def read_checksum(path):
+    """Контрольна сума зі .sha256 поруч зі знімком (або None)"""
+    try:
+        with open(path + ".sha256", encoding="utf-8") as f:
+            return f.read().split()[0]
+    except (OSError, IndexError):
+        return None
+
+def list_snapshots():
+    """Знімки з BACKUP_DIR, найновіші першими"""
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    names = [n for n in os.listdir(BACKUP_DIR) if n.endswith((".db.gz", ".db.zst", ".tar.gz"))]
+    return [os.path.join(BACKUP_DIR, n) for n in sorted(names, reverse=True)]
+
+def _rotate():
+    for old in list_snapshots()[BACKUP_KEEP:]:
+        for path in (old, old + ".sha256"):
+            if os.path.exists(path):
+                os.remove(path)
+
+def _copy_db(src_path, dest_dir):
+    """Онлайн-копія однієї бази у тимчасовий файл"""
+    fd, raw = tempfile.mkstemp(suffix=".db", dir=dest_dir)
+    os.close(fd)
+    try:
+        src = sqlite3.connect(src_path)
+        dst = sqlite3.connect(raw)
+        try:
+            # Одним кроком: у WAL читач не блокує writer бота, а покрокове копіювання
+            # починалося б спочатку після кожного запису в базу і могло не закінчитись ніколи
+            src.backup(dst, pages=-1)
+        finally:
+            dst.close()
+            src.close()
+    except Exception:
+        os.remove(raw)
+        raise
+    return raw
+
+def _snapshot(tag=""):
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    sharded = DB_SHARDS > 1
+    ext = "tar.gz" if sharded else "db.zst" if zstandard else "db.gz"
+    name = f"jarvis_{datetime.now().strftime('%Y%m%d_%H%M%S')}{tag}"
+    path = os.path.join(BACKUP_DIR, f"{name}.{ext}")
+    n = 1
+    while os.path.exists(path):
+        path = os.path.join(BACKUP_DIR, f"{name}_{n}.{ext}")
+        n += 1
+    copies = {}
+    try:
+        for i in range(max(1, DB_SHARDS)):
+            copies[shard_path(i)] = _copy_db(shard_path(i), BACKUP_DIR)
+        if sharded:
+            with tarfile.open(path, "w:gz") as tar:
+                for db_path, raw in copies.items():
+                    tar.add(raw, arcname=os.path.basename(db_path))
+        else:
+            with open(copies[DB_NAME], "rb") as f_in, _open_compressed(path, "wb") as f_out:
+                shutil.copyfileobj(f_in, f_out, 1 << 20)
+    finally:
+        for raw in copies.values():
+            os.remove(raw)
+    checksum = _sha256(path)
+    with open(path + ".sha256", "w", encoding="utf-8") as f:
+        f.write(f"{checksum}  {os.path.basename(path)}\n")
+    _rotate()
+    return path
+
+async def create_snapshot(tag=""):
+    """Створює стиснений знімок бази. Повертає шлях або None"""
+    try:
+        return await asyncio.to_thread(_snapshot, tag)
+    except Exception as e:
+        logger.error(f"Backup error: {e}")
+        return None
+
+def _check_db(raw):
+    conn = sqlite3.connect(raw)
+    try:
+        if conn.execute("PRAGMA integrity_check").fetchone()[0] != "ok":
+            raise ValueError("integrity check failed")
+        conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    finally:
+        conn.close()
+
+def _verify(path, checksum=None):
+    """Перевіряє знімок і розпаковує бази у тимчасові файли поруч з робочими: {шлях бази: тимчасовий файл}"""
+    checksum = checksum or read_checksum(path)
+    if checksum and _sha256(path) != checksum:
+        raise ValueError("checksum mismatch")
+    target_dir = os.path.dirname(os.path.abspath(DB_NAME))
+    expected = {os.path.basename(shard_path(i)): shard_path(i) for i in range(max(1, DB_SHARDS))}
+    extracted = {}
+    try:
+        if path.endswith(".tar.gz"):
+            with tarfile.open(path, "r:gz") as tar:
+                for member in tar.getmembers():
+                    if member.name not in expected:
+                        raise ValueError(f"unexpected file {member.name}")
+                    fd, raw = tempfile.mkstemp(suffix=".db", dir=target_dir)
+                    os.close(fd)
+                    extracted[expected[member.name]] = raw
+                    with tar.extractfile(member) as f_in, open(raw, "wb") as f_out:
+                        shutil.copyfileobj(f_in, f_out, 1 << 20)
+        else:
+            fd, raw = tempfile.mkstemp(suffix=".db", dir=target_dir)
+            os.close(fd)
+            extracted[DB_NAME] = raw
+            with _open_compressed(path, "rb") as f_in, open(raw, "wb") as f_out:
+                shutil.copyfileobj(f_in, f_out, 1 << 20)
+        if set(extracted) != set(expected.values()):
+            raise ValueError("snapshot does not match DB_SHARDS")
+        for raw in extracted.values():
+            _check_db(raw)
+    except Exception:
+        for raw in extracted.values():
+            os.remove(raw)
+        raise
+    return extracted
+
+class DispatchGate:
+    """Outer middleware диспетчера: нові апдейти чекають, поки база підміняється"""
+
+    def __init__(self):
+        self.open = asyncio.Event()
+        self.open.set()
+
+    async def __call__(self, handler, event, data):
+        await self.open.wait()
+        return await handler(event, data)
+
+dispatch_gate = DispatchGate()
+
+def _swap_files(extracted):
+    for db_path, raw in extracted.items():
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        os.replace(raw, db_path)
+
+async def restore_snapshot(path, checksum=None):
+    """Перевіряє знімок і підміняє ним робочу базу. Поточна база спершу теж бекапиться.
+    На час підміни стоять нові апдейти і фонові воркери (outbox, розсилки, нагадування)"""
+    from database import Database
+    from outbox import outbox
+    from broadcast import broadcaster
+    from reminder_engine import engine
+
+    extracted = await asyncio.to_thread(_verify, path, checksum)
+    await create_snapshot("_pre_restore")
+    dispatch_gate.open.clear()
+    running = [worker for worker in (engine, broadcaster, outbox) if worker.task]
+    try:
+        for worker in running:
+            await worker.stop()
+        # Хендлери, що вже працюють, дочекаються нової бази на пулі з'єднань
+        await Database.reopen(lambda: _swap_files(extracted))
+    finally:
+        if outbox in running:
+            await outbox.start(outbox.bot)
+        if broadcaster in running:
+            await broadcaster.start()
+        if engine in running:
+            # start() заново звіряє купу таймерів з відновленою базою (catch_up + reconcile)
+            await engine.start(engine.bot)
+        dispatch_gate.open.set()
+    logger.info(f"Database restored from {path}")
@@ -7,10 +7,15 @@ from aiogram.enums import ParseMode
 from aiogram.types import BotCommand, BotCommandScopeDefault, BotCommandScopeChat
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
-from config import TOKEN, logger, ADMIN_IDS
+from config import TOKEN, logger, ADMIN_IDS, REMINDER_RECONCILE
 from database import Database
 from handlers import router
-from tasks import checker, background_maintenance, daily_morning_briefing
+from tasks import maintenance_job, backup_job, daily_morning_briefing
+from reminder_engine import engine as reminder_engine
+from outbox import outbox
+from broadcast import broadcaster
+from http_client import http
+from backup import dispatch_gate
 
 async def set_commands(bot: Bot):
     """Реєстрація команд для різних мов"""
@@ -22,6 +27,7 @@ async def set_commands(bot: Bot):
         BotCommand(command="note", description="📝 Додати нотатку"),
         BotCommand(command="search", description="🔍 Пошук у нотатках"),
         BotCommand(command="report", description="🆘 Написати адміну"),
+        BotCommand(command="timezone", description="🕰 Часовий пояс"),
     ]
     
     admin_commands_uk = user_commands_uk + [
@@ -30,7 +36,10 @@ async def set_commands(bot: Bot):
         BotCommand(command="ban", description="🚫 Забанити (ID)"),
         BotCommand(command="unban", description="🕊 Розбанити (ID)"),
         BotCommand(command="broadcast", description="📢 Розсилка всім"),
+        BotCommand(command="broadcast_status", description="📈 Стан розсилки"),
+        BotCommand(command="broadcast_cancel", description="⛔️ Скасувати розсилку"),
         BotCommand(command="backup", description="📦 Скачати базу даних"),
+        BotCommand(command="restore", description="♻️ Відновити базу з бекапу"),
         BotCommand(command="all_reminders", description="⏳ Всі активні нагадування"),
         BotCommand(command="all_notes", description="🕵️ Останні нотатки"),
         BotCommand(command="db_clean", description="🧹 Очистити старі дані"),
@@ -44,6 +53,7 @@ async def set_commands(bot: Bot):
         BotCommand(command="note", description="📝 Add note"),
         BotCommand(command="search", description="🔍 Search notes"),
         BotCommand(command="report", description="🆘 Contact support"),
+        BotCommand(command="timezone", description="🕰 Time zone"),
     ]
 
     admin_commands_en = user_commands_en + [
@@ -52,7 +62,10 @@ async def set_commands(bot: Bot):
         BotCommand(command="ban", description="🚫 Ban User (ID)"),
         BotCommand(command="unban", description="🕊 Unban User (ID)"),
         BotCommand(command="broadcast", description="📢 Broadcast message"),
+        BotCommand(command="broadcast_status", description="📈 Broadcast progress"),
+        BotCommand(command="broadcast_cancel", description="⛔️ Cancel broadcast"),
         BotCommand(command="backup", description="📦 Download Database"),
+        BotCommand(command="restore", description="♻️ Restore from backup"),
         BotCommand(command="all_reminders", description="⏳ All active reminders"),
         BotCommand(command="all_notes", description="🕵️ Recent notes"),
         BotCommand(command="db_clean", description="🧹 Clean old data"),
@@ -84,25 +97,45 @@ async def main():
     root.setLevel(logging.INFO)
 
     await Database.init()
+    # Один HTTP-клієнт (keep-alive пул) для Groq і Open-Meteo
+    await http.start()
     
     bot = Bot(token=TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN))
     dp = Dispatcher()
+    # /restore притримує нові апдейти, поки підміняє базу
+    dp.update.outer_middleware(dispatch_gate)
     dp.include_router(router)
     
     # Реєструємо команди
     await set_commands(bot)
     
+    # Черга вихідних повідомлень (outbox)
+    await outbox.start(bot)
+    # Розсилки: незавершені продовжуються з курсора
+    await broadcaster.start()
+    # Нагадування: купа таймерів у пам'яті + періодична звірка з базою
+    await reminder_engine.start(bot)
+    
     scheduler = AsyncIOScheduler()
-    scheduler.add_job(checker, 'interval', seconds=30, args=[bot])
-    # Ранковий бріфінг щодня о 08:00
-    scheduler.add_job(daily_morning_briefing, 'cron', hour=8, minute=0, args=[bot])
+    scheduler.add_job(reminder_engine.reconcile, 'interval', seconds=REMINDER_RECONCILE)
+    # Ранковий бріфінг: кожні 15 хвилин розсилається тим, у кого зараз BRIEFING_HOUR за їхнім поясом
+    scheduler.add_job(daily_morning_briefing, 'cron', minute='0,15,30,45', args=[bot])
+    # Обслуговування бази вночі, бекап раз на тиждень
+    scheduler.add_job(maintenance_job, 'cron', hour=4, minute=0)
+    scheduler.add_job(backup_job, 'cron', day_of_week='sun', hour=4, minute=30, args=[bot])
     scheduler.start()
     
-    asyncio.create_task(background_maintenance(bot))
-    
     logger.info("🤖 Бот запущено успішно!")
     await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        scheduler.shutdown(wait=False)
+        await reminder_engine.stop()
+        await broadcaster.stop()
+        await outbox.stop()
+        await http.close()
+        await Database.close()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,129 @@
+"""Розсилки як збережені завдання.
+
+/broadcast створює рядок у broadcast_jobs. Фоновий цикл іде курсором по user_id
+(за зростанням, злиттям по всіх шардах) і ставить сторінки по BROADCAST_BATCH у смугу
+BROADCAST outbox - тією ж транзакцією, що й зсув курсора, тож після рестарту розсилка
+продовжується з того ж місця: нікого не пропускаємо і нікому не шлемо двічі.
+Повідомлень розсилки в outbox одночасно не більше BROADCAST_WINDOW: темп задають
+воркери outbox і ліміти sender (ліміт Telegram), а інтерактивні відповіді не стоять
+у черзі за тисячами оголошень.
+Пауза переводить уже поставлені повідомлення в 'held', скасування їх видаляє.
+"""
+import time
+import asyncio
+from config import BROADCAST_BATCH, BROADCAST_WINDOW, logger
+from database import Database
+from outbox import outbox, BROADCAST
+
+FIELDS = ("id", "status", "total", "enqueued", "sent", "failed", "blocked", "created_at", "finished_at")
+BACKLOG_SQL = "SELECT COUNT(*) FROM outbox WHERE job_id=? AND status IN ('queued','sending','held')"
+
+class Broadcaster:
+    def __init__(self):
+        self.task = None
+        self.wakeup = asyncio.Event()
+
+    async def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try: await self.task
+            except asyncio.CancelledError: pass
+            self.task = None
+
+    async def create(self, text):
+        """Нове завдання розсилки (text - готовий HTML). Повертає id"""
+        total = await Database.count_broadcast_users()
+        async with Database.write() as db:
+            cursor = await db.execute("INSERT INTO broadcast_jobs (text, total, created_at) VALUES (?, ?, ?)",
+                                      (text, total, time.time()))
+            job_id = cursor.lastrowid
+        self.wakeup.set()
+        return job_id
+
+    async def get(self, job_id=None):
+        """Завдання (за замовчуванням останнє) як dict + скільки його повідомлень ще в outbox, або None"""
+        where, params = ("WHERE id=?", (job_id,)) if job_id else ("ORDER BY id DESC LIMIT 1", ())
+        async with Database.read() as db:
+            async with db.execute(f"SELECT {', '.join(FIELDS)} FROM broadcast_jobs {where}", params) as c:
+                row = await c.fetchone()
+            if row is None:
+                return None
+            job = dict(zip(FIELDS, row))
+            async with db.execute(BACKLOG_SQL, (job["id"],)) as c:
+                job["queued"] = (await c.fetchone())[0]
+        return job
+
+    async def _transition(self, job_id, allowed, status, outbox_sql):
+        job = await self.get(job_id)
+        if job is None:
+            return None
+        async with Database.write() as db:
+            marks = ",".join("?" * len(allowed))
+            finished = time.time() if status == "cancelled" else None
+            cursor = await db.execute(f"UPDATE broadcast_jobs SET status=?, finished_at=? WHERE id=? AND status IN ({marks})",
+                                      (status, finished, job["id"], *allowed))
+            if cursor.rowcount:
+                await db.execute(outbox_sql, (job["id"],))
+        outbox.notify()
+        self.wakeup.set()
+        return await self.get(job["id"])
+
+    async def pause(self, job_id=None):
+        return await self._transition(job_id, ("running",), "paused",
+                                      "UPDATE outbox SET status='held' WHERE job_id=? AND status='queued'")
+
+    async def resume(self, job_id=None):
+        return await self._transition(job_id, ("paused",), "running",
+                                      "UPDATE outbox SET status='queued' WHERE job_id=? AND status='held'")
+
+    async def cancel(self, job_id=None):
+        # Те, що вже у відправці ('sending'), дійде - решта видаляється
+        return await self._transition(job_id, ("running", "paused"), "cancelled",
+                                      "DELETE FROM outbox WHERE job_id=? AND status IN ('queued','held')")
+
+    async def _step(self, job_id, text, cursor):
+        """Один крок завдання: доливає сторінку в outbox або завершує. True - є що доливати одразу"""
+        async with Database.read() as db:
+            async with db.execute(BACKLOG_SQL, (job_id,)) as c:
+                backlog = (await c.fetchone())[0]
+        if BROADCAST_WINDOW - backlog < BROADCAST_BATCH:
+            return False
+        ids = await Database.get_broadcast_page(cursor, BROADCAST_BATCH)
+        async with Database.write() as db:
+            # Пауза/скасування могли прийти, поки читали сторінку
+            async with db.execute("SELECT status FROM broadcast_jobs WHERE id=?", (job_id,)) as c:
+                if (await c.fetchone())[0] != "running":
+                    return False
+            if not ids:
+                if backlog == 0:
+                    await db.execute("UPDATE broadcast_jobs SET status='done', finished_at=? WHERE id=?", (time.time(), job_id))
+                    logger.info(f"Broadcast {job_id} finished")
+                return False
+            await outbox.insert(db, [(user_id, text, {"parse_mode": "HTML"}) for user_id in ids], BROADCAST, job_id)
+            await db.execute("UPDATE broadcast_jobs SET cursor=?, enqueued=enqueued+? WHERE id=?", (ids[-1], len(ids), job_id))
+        outbox.notify()
+        return True
+
+    async def _run(self):
+        while True:
+            jobs = []
+            more = False
+            try:
+                async with Database.read() as db:
+                    async with db.execute("SELECT id, text, cursor FROM broadcast_jobs WHERE status='running' ORDER BY id") as c:
+                        jobs = await c.fetchall()
+                for job_id, text, cursor in jobs:
+                    more = await self._step(job_id, text, cursor) or more
+            except Exception as e:
+                logger.error(f"Broadcast error: {e}")
+            if more:
+                continue
+            self.wakeup.clear()
+            # Поки є активні розсилки - перевіряємо вікно щосекунди
+            try: await asyncio.wait_for(self.wakeup.wait(), 1 if jobs else 60)
+            except asyncio.TimeoutError: pass
+
+broadcaster = Broadcaster()
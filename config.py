@@ -10,13 +10,107 @@ TOKEN = os.getenv("BOT_TOKEN")
 GROQ_KEY = os.getenv("GROQ_API_KEY")
 TIMEZONE = os.getenv("TIMEZONE", "Europe/Kyiv")
 DB_NAME = "jarvis_db.db"
+# Пул з'єднань: скільки з'єднань на читання та розмір кешу підготовлених запитів
+DB_READERS = int(os.getenv("DB_READERS", "4"))
+DB_STATEMENT_CACHE = 256
+# Кількість файлів-шардів для даних користувачів (1 = все в DB_NAME). Змінювати - через reshard.py
+DB_SHARDS = int(os.getenv("DB_SHARDS", "1"))
+# Кеш профілів користувачів у пам'яті
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+PROFILE_CACHE_TTL = 300  # секунд
+# Групові коміти: як довго збирати вставки і максимум рядків в одній транзакції
+WRITE_QUEUE_DELAY = 0.01  # секунд
+WRITE_QUEUE_MAX_ROWS = 500
+# Пам'ять діалогу: кільце реплік на користувача і бюджет токенів історії для LLM
+CONTEXT_RING_SIZE = 20
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+# Фоновий підсумок діалогу: не частіше ніж раз на N реплік, останні K реплік лишаються сирими
+SUMMARY_EVERY_TURNS = 8
+SUMMARY_KEEP_RAW = 6
 
 # Читаємо рядок і перетворюємо його на список чисел
 admin_env = os.getenv("ADMIN_IDS", "")
 ADMIN_IDS = [int(x) for x in admin_env.split(",")] if admin_env else []
 
+# Планувальник нагадувань: горизонт завантаження в пам'ять, звірка з базою (сек)
+REMINDER_HORIZON = 6 * 3600
+REMINDER_RECONCILE = 300
+# Спам-режим: паузи між повторами (сек, останнє значення повторюється) і максимум повторів
+NAG_SCHEDULE = [30, 60, 120, 300, 600, 1800]
+NAG_MAX_ATTEMPTS = 10
+# Повторювані нагадування, прострочені довше (сек) під час простою бота, при старті не шлються, а переносяться
+RECURRENCE_GRACE = 3600
+# Ранковий бріфінг о цій годині за часом користувача (users.timezone, інакше TIMEZONE)
+BRIEFING_HOUR = 8
+
+# Відправка: ліміти Telegram (повідомлень/сек глобально, в особистий чат, у групу) і паралельність
+SEND_RATE = 30
+SEND_CHAT_RATE = 1
+SEND_GROUP_RATE = 20 / 60
+SEND_CONCURRENCY = 20
+SEND_RETRIES = 3
+# Черга вихідних (outbox): одночасних відправок, спроб до dead-letter, база backoff (сек),
+# скільки готових повідомлень вибирати за раз і як часто (сек) записувати результати відправок
+OUTBOX_WORKERS = 20
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_BACKOFF = 5
+OUTBOX_CLAIM_BATCH = 200
+OUTBOX_FLUSH_INTERVAL = 0.5
+# Відповіді LLM стрімом: повідомлення редагується по мірі генерації, не частіше ніж раз на STREAM_EDIT_INTERVAL сек
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "1") == "1"
+STREAM_EDIT_INTERVAL = 1.0
+# Розсилки: скільки користувачів брати за крок курсора і скільки повідомлень розсилки тримати в outbox одночасно
+BROADCAST_BATCH = 100
+BROADCAST_WINDOW = 500
+
+# Кеш підсумків YouTube: скільки живе запис (сек) і максимум записів (витісняються найдавніше використані)
+YT_CACHE_TTL = 30 * 86400
+YT_CACHE_MAX = 5000
+# Довгі субтитри: розмір шматка (токени), скільки шматків підсумовувати одночасно, максимум шматків на відео
+YT_CHUNK_TOKENS = 6000
+YT_MAP_CONCURRENCY = 8
+YT_MAX_CHUNKS = 40
+
+# HTTP-клієнт (Groq, Open-Meteo): з'єднань усього / на хост, кеш DNS і keep-alive (сек), таймаути (сек)
+HTTP_LIMIT = 100
+HTTP_LIMIT_PER_HOST = 30
+HTTP_DNS_TTL = 300
+HTTP_KEEPALIVE = 60
+HTTP_CONNECT_TIMEOUT = 5
+GROQ_TIMEOUT = 60
+GROQ_AUDIO_TIMEOUT = 120
+
+# Groq: адреса API (можна направити на fake_groq.py), стартовий/максимальний ліміт одночасних запитів,
+# повтори з паузою (сек, база і стеля) і запобіжник: мінімум збоїв і їх частка серед останніх відповідей,
+# скільки він відкритий (сек)
+GROQ_API_BASE = os.getenv("GROQ_API_BASE", "https://api.groq.com/openai/v1")
+GROQ_CONCURRENCY = int(os.getenv("GROQ_CONCURRENCY", "8"))
+GROQ_MAX_CONCURRENCY = 32
+GROQ_RETRIES = 3
+GROQ_BACKOFF = 0.5
+GROQ_BACKOFF_MAX = 20
+GROQ_BREAKER_FAILURES = 5
+GROQ_BREAKER_RATIO = 0.5
+GROQ_BREAKER_COOLDOWN = 30
+
+# Погода: крок сітки (градуси), час життя кешу (сек), вікно збору промахів у пакет і розмір пакета
+WEATHER_GRID = 0.1
+WEATHER_TTL = 1800
+WEATHER_BATCH_DELAY = 0.05
+WEATHER_BATCH_MAX = 100
+
+# Бекапи: папка, скільки знімків тримати
+BACKUP_DIR = "backups"
+BACKUP_KEEP = 7
+
 # Скільки днів зберігати старі дані
 RETENTION_DAYS = 7 
+# Політики очищення: контекст старше N днів; нотатки старше N днів -> архів (0 = вимкнено)
+CONTEXT_RETENTION_DAYS = 30
+NOTES_ARCHIVE_DAYS = int(os.getenv("NOTES_ARCHIVE_DAYS", "0"))
+RETENTION_BATCH = 500
+# Скільки вільних сторінок повертати ОС за один прохід retention (PRAGMA incremental_vacuum(N))
+RETENTION_VACUUM_PAGES = 2000
 
 # Перевірка ключів
 if not TOKEN or not GROQ_KEY:
@@ -1,166 +1,836 @@
+import os
+import re
+import json
+import asyncio
+import time
 import aiosqlite
-from config import DB_NAME
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from migrations import apply_migrations
+from config import (DB_NAME, DB_SHARDS, DB_READERS, DB_STATEMENT_CACHE, PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL,
+                    WRITE_QUEUE_DELAY, WRITE_QUEUE_MAX_ROWS, CONTEXT_RING_SIZE, CONTEXT_TOKEN_BUDGET, logger)
+from utils import estimate_tokens, local_to_epoch
+
+# Застосовуються до кожного з'єднання один раз при відкритті
+PRAGMAS = (
+    # Діє лише на новий файл (до WAL і першої таблиці); стару базу переводить `python migrations.py --vacuum`
+    "PRAGMA auto_vacuum=INCREMENTAL;",
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA synchronous=NORMAL;",
+    "PRAGMA busy_timeout=5000;",
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA mmap_size=268435456;",
+    "PRAGMA cache_size=-16000;",
+)
+
+class _Pool:
+    """Одне з'єднання на запис + N з'єднань на читання, відкриті один раз"""
+
+    def __init__(self, path, index=0, readers=DB_READERS):
+        self.path = path
+        self.index = index
+        self.size = max(1, readers)
+        self.writer = None
+        self.readers = asyncio.Queue()
+        self.lock = asyncio.Lock()
+        self.queue = None
+
+    async def _connect(self, readonly=False):
+        # cached_statements - кеш підготовлених запитів sqlite3 на з'єднання
+        db = await aiosqlite.connect(self.path, cached_statements=DB_STATEMENT_CACHE)
+        for pragma in PRAGMAS:
+            await db.execute(pragma)
+        if readonly:
+            await db.execute("PRAGMA query_only=1;")
+        return db
+
+    async def open(self):
+        # Спочатку writer: він вмикає WAL для файлу
+        self.writer = await self._connect()
+        for _ in range(self.size):
+            self.readers.put_nowait(await self._connect(readonly=True))
+        self.queue = _WriteQueue(self)
+        self.queue.start()
+
+    async def close(self):
+        if self.queue:
+            await self.queue.stop()
+            self.queue = None
+        while not self.readers.empty():
+            await self.readers.get_nowait().close()
+        if self.writer:
+            await self.writer.close()
+            self.writer = None
+
+    async def suspend(self):
+        """Дочікується поточних запитів і закриває з'єднання; нові запити чекають до resume()"""
+        await self.queue.stop()
+        await self.lock.acquire()
+        # Забираємо всі readers: ті, що зараз у роботі, повернуться після свого запиту
+        for _ in range(self.size):
+            await (await self.readers.get()).close()
+        await self.writer.close()
+        self.writer = None
+
+    async def resume(self):
+        try:
+            self.writer = await self._connect()
+            for _ in range(self.size):
+                self.readers.put_nowait(await self._connect(readonly=True))
+            await apply_migrations(self.writer)
+        finally:
+            self.lock.release()
+        self.queue.start()
+
+    @asynccontextmanager
+    async def read(self):
+        db = await self.readers.get()
+        try:
+            yield db
+        finally:
+            self.readers.put_nowait(db)
+
+    @asynccontextmanager
+    async def write(self):
+        # Один writer на всіх: транзакції серіалізуються локом
+        async with self.lock:
+            try:
+                yield self.writer
+                await self.writer.commit()
+            except BaseException:
+                await self.writer.rollback()
+                raise
+
+class _WriteQueue:
+    """Write-behind черга для вставок контексту/нотаток/нагадувань.
+
+    Записи з усіх хендлерів збираються і пишуться однією транзакцією кожні
+    WRITE_QUEUE_DELAY секунд або одразу після WRITE_QUEUE_MAX_ROWS рядків.
+    submit() повертає future, який завершується після COMMIT (для reminders - з id).
+    """
+
+    INSERTS = {
+        # context - кільце на CONTEXT_RING_SIZE слотів: нова репліка перезаписує найстарішу
+        "context": "INSERT OR REPLACE INTO context (user_id, slot, seq, role, content, tokens) VALUES (?,?,?,?,?,?)",
+        "note": "INSERT INTO notes (user_id, content) VALUES (?,?)",
+        "reminder": "INSERT INTO reminders (user_id, chat_id, remind_text, remind_time, recurrence, remind_at) VALUES (?,?,?,?,?,?)",
+    }
+
+    def __init__(self, pool, delay=WRITE_QUEUE_DELAY, max_rows=WRITE_QUEUE_MAX_ROWS):
+        self.pool = pool
+        self.delay = delay
+        self.max_rows = max_rows
+        self.pending = []  # (kind, params, future)
+        self.wakeup = asyncio.Event()
+        self.full = asyncio.Event()
+        self.stopping = False
+        self.task = None
+        # flush() по черзі: інакше другий виклик повернувся б, поки перший ще не закомітив свій батч
+        self.flushing = asyncio.Lock()
+
+    def start(self):
+        self.stopping = False
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Без cancel: перерваний посеред flush() батч втрачався б, а його future ніколи не завершились
+        if self.task:
+            self.stopping = True
+            self.wakeup.set()
+            self.full.set()
+            try: await self.task
+            except Exception as e: logger.error(f"Write queue stopped with error: {e}")
+            self.task = None
+        await self.flush()
+
+    def submit(self, kind, params):
+        fut = asyncio.get_running_loop().create_future()
+        # Для fire-and-forget записів помилку вже залогує flush()
+        fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.pending.append((kind, params, fut))
+        self.wakeup.set()
+        if len(self.pending) >= self.max_rows:
+            self.full.set()
+        return fut
+
+    async def _run(self):
+        while not self.stopping:
+            await self.wakeup.wait()
+            if len(self.pending) < self.max_rows and not self.stopping:
+                # Даємо іншим хендлерам докинути свої записи в цю ж транзакцію
+                try: await asyncio.wait_for(self.full.wait(), self.delay)
+                except asyncio.TimeoutError: pass
+            self.wakeup.clear()
+            self.full.clear()
+            await self.flush()
+
+    @staticmethod
+    async def _ring_rows(db, turns):
+        """(user_id, role, content) -> рядки кільця з наступним seq на користувача"""
+        users = list({t[0] for t in turns})
+        marks = ",".join("?" * len(users))
+        sql = f"SELECT user_id, MAX(seq) FROM context WHERE user_id IN ({marks}) GROUP BY user_id"
+        async with db.execute(sql, users) as c:
+            last_seq = dict(await c.fetchall())
+        rows = []
+        for user_id, role, content in turns:
+            seq = last_seq.get(user_id, 0) + 1
+            last_seq[user_id] = seq
+            rows.append((user_id, seq % CONTEXT_RING_SIZE, seq, role, content, estimate_tokens(content)))
+        return rows
+
+    async def flush(self):
+        async with self.flushing:
+            await self._flush()
+
+    async def _flush(self):
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+        results = [None] * len(batch)
+        try:
+            async with self.pool.write() as db:
+                notes = [params for kind, params, _ in batch if kind == "note"]
+                if notes:
+                    await db.executemany(self.INSERTS["note"], notes)
+                turns = [params for kind, params, _ in batch if kind == "context"]
+                if turns:
+                    await db.executemany(self.INSERTS["context"], await self._ring_rows(db, turns))
+                for i, (kind, params, _) in enumerate(batch):
+                    if kind == "reminder":
+                        cursor = await db.execute(self.INSERTS[kind], params)
+                        results[i] = cursor.lastrowid
+        except Exception as e:
+            logger.error(f"Write queue flush error ({len(batch)} rows): {e}")
+            for _, _, fut in batch:
+                if not fut.done(): fut.set_exception(e)
+            return
+        for (_, _, fut), result in zip(batch, results):
+            if not fut.done(): fut.set_result(result)
+
+# Маркери підсвітки у сніпетах пошуку (handlers перетворює їх на <b>)
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+
+# Найчастіші закінчення (uk/en): відкидаємо їх і шукаємо по префіксу,
+# щоб "хліба", "хлібом" і "хліб" знаходили одне одного
+_ENDINGS = sorted([
+    "ами", "ями", "ові", "еві", "ого", "ому", "ими", "іми", "ій", "их", "іх",
+    "ах", "ях", "ом", "ем", "ів", "ою", "ею", "ий", "ої", "ей",
+    "а", "я", "о", "е", "у", "ю", "і", "и", "ь", "ї",
+    "ing", "ed", "es", "s",
+], key=len, reverse=True)
+
+def fts_terms(query):
+    """Розбиває запит на префіксні терми FTS5: 'купити хліба' -> ['"купит"*', '"хліб"*']"""
+    terms = []
+    for word in re.findall(r"\w+", query.lower()):
+        stem = word
+        if len(word) > 4:
+            for ending in _ENDINGS:
+                if word.endswith(ending) and len(word) - len(ending) >= 3:
+                    stem = word[:-len(ending)]
+                    break
+        terms.append(f'"{stem}"*')
+    return terms
+
+# Параметри: початок/кінець підсвітки, MATCH з fts_terms, user_id, limit
+SEARCH_NOTES_SQL = """SELECT snippet(notes_fts, 0, ?, ?, '…', 16), n.created_at
+                      FROM notes_fts JOIN notes n ON n.id = notes_fts.rowid
+                      WHERE notes_fts MATCH ? AND n.user_id = ?
+                      ORDER BY bm25(notes_fts, 1.0, 0.0) LIMIT ?"""
+
+class UserProfile:
+    """Профіль користувача (замість позиційного кортежу u[0]..u[7])"""
+    __slots__ = ("user_id", "is_toxic", "lat", "lon", "memory_json", "spam_mode",
+                 "language", "morning_briefing", "is_banned", "timezone")
+
+    def __init__(self, user_id, is_toxic, lat, lon, memory_json, spam_mode, language, morning_briefing, is_banned, timezone):
+        self.user_id = user_id
+        self.is_toxic = is_toxic
+        self.lat = lat
+        self.lon = lon
+        self.memory_json = memory_json
+        self.spam_mode = spam_mode
+        self.language = language
+        self.morning_briefing = morning_briefing
+        self.is_banned = is_banned
+        self.timezone = timezone
+
+    def replace(self, **changes):
+        """Нова копія з оновленими полями (кешовані записи не мутуємо)"""
+        values = {f: getattr(self, f) for f in self.__slots__}
+        values.update(changes)
+        return UserProfile(**values)
+
+    def __repr__(self):
+        return f"UserProfile({', '.join(f'{f}={getattr(self, f)!r}' for f in self.__slots__)})"
+
+class _ProfileCache:
+    """LRU + TTL кеш профілів. Глобальне покоління (лічильник записів) не дає застарілому
+    читанню з БД перезаписати свіжий write-through з update_user: заповнення, під час якого
+    користувача записали, не кешується. Записи пам'ятаються лише поки є незавершені заповнення."""
+
+    def __init__(self, maxsize=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.items = OrderedDict()  # user_id -> (profile, expires_at)
+        self.generation = 0
+        self.written = {}  # user_id -> покоління останнього запису (тільки поки filling > 0)
+        self.filling = 0
+        self.cleared_at = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        item = self.items.get(user_id)
+        if item and item[1] > time.monotonic():
+            self.items.move_to_end(user_id)
+            self.hits += 1
+            return item[0]
+        if item:
+            del self.items[user_id]
+        self.misses += 1
+        return None
+
+    def begin_fill(self):
+        """Перед читанням профілю з БД: повертає покоління для end_fill()"""
+        self.filling += 1
+        return self.generation
+
+    def end_fill(self, profile, generation):
+        """Кешує прочитаний профіль (None - читання не вдалося), якщо відтоді його не записували"""
+        self.filling -= 1
+        if (profile is not None and generation >= self.cleared_at
+                and self.written.get(profile.user_id, -1) <= generation):
+            self.put(profile)
+        if self.filling <= 0:
+            self.filling = 0
+            self.written.clear()
+
+    def put(self, profile):
+        self.items[profile.user_id] = (profile, time.monotonic() + self.ttl)
+        self.items.move_to_end(profile.user_id)
+        while len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
+    def bump(self, user_id):
+        self.generation += 1
+        if self.filling:
+            self.written[user_id] = self.generation
+
+    def peek(self, user_id):
+        item = self.items.get(user_id)
+        return item[0] if item else None
+
+    def invalidate(self, user_id):
+        self.bump(user_id)
+        self.items.pop(user_id, None)
+
+    def clear(self):
+        # Заповнення, що почались до очищення, вже не кешуються
+        self.generation += 1
+        self.cleared_at = self.generation
+        self.items.clear()
+        self.written.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"size": len(self.items), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
+
+def shard_path(index):
+    """Файл шарду: 0 - основна база (DB_NAME), далі jarvis_db.s1.db, ..."""
+    if index == 0:
+        return DB_NAME
+    base, ext = os.path.splitext(DB_NAME)
+    return f"{base}.s{index}{ext}"
 
 class Database:
+    # Шард 0 - основна база: там же глобальні таблиці (не прив'язані до user_id)
+    _pool = None
+    _pools = []
+    _profiles = _ProfileCache()
+    # Підписники на зміни нагадувань: fn(rem_id, unix time наступної відправки або None, якщо більше не активне)
+    reminder_listeners = []
+
     @staticmethod
     async def init():
-        async with aiosqlite.connect(DB_NAME) as db:
-            await db.execute("PRAGMA journal_mode=WAL;")
-            
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS reminders (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, chat_id INTEGER, 
-                    remind_text TEXT, remind_time TEXT, recurrence TEXT DEFAULT NULL, status TEXT DEFAULT 'pending'
-                )""")
-            
-            # Оновлена структура користувача
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY, 
-                    is_toxic BOOLEAN DEFAULT 0, 
-                    spam_mode BOOLEAN DEFAULT 0,
-                    lat REAL DEFAULT NULL, 
-                    lon REAL DEFAULT NULL, 
-                    memory_json TEXT DEFAULT '[]',
-                    language TEXT DEFAULT 'uk',
-                    morning_briefing BOOLEAN DEFAULT 1,
-                    is_banned BOOLEAN DEFAULT 0
-                )""")
-                
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS notes (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, content TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )""")
-            
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS context (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, role TEXT, content TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )""")
-            await db.commit()
+        if not Database._pools:
+            count = max(1, DB_SHARDS)
+            # До першого відкриття: скільки файлів шардів уже є (база могла існувати до meta.shards)
+            existing = 0
+            while os.path.exists(shard_path(existing)):
+                existing += 1
+            pools = [_Pool(shard_path(i), i) for i in range(count)]
+            for pool in pools:
+                await pool.open()
+            Database._pools = pools
+            Database._pool = pools[0]
+            try:
+                # Схема ведеться версійними міграціями (migrations.py), однакова на всіх шардах
+                for pool in pools:
+                    async with pool.lock:
+                        await apply_migrations(pool.writer)
+                await Database._check_shards(count, existing)
+            except Exception:
+                await Database.close()
+                raise
+        else:
+            for pool in Database._pools:
+                async with pool.lock:
+                    await apply_migrations(pool.writer)
+
+    @staticmethod
+    async def _check_shards(count, existing):
+        """Користувачі розкладені по user_id % N: інший N без решардингу "губить" їхні дані
+        і перенумеровує id нагадувань. Кількість шардів зберігається в meta основної бази"""
+        async with Database._pool.read() as db:
+            async with db.execute("SELECT value FROM meta WHERE key='shards'") as c:
+                row = await c.fetchone()
+        if row is None:
+            # Нова база - поточне значення; стара (до meta) - скільки файлів шардів уже було
+            stored = existing or count
+            async with Database._pool.write() as db:
+                await db.execute("INSERT INTO meta (key, value) VALUES ('shards', ?)", (str(stored),))
+        else:
+            stored = int(row[0])
+        if stored != count:
+            raise RuntimeError(f"DB_SHARDS={count}, but the database is split into {stored} shard(s). "
+                               f"Stop the bot and run: python reshard.py {count}")
+
+    @staticmethod
+    async def close():
+        for pool in Database._pools:
+            await pool.close()
+        Database._pools = []
+        Database._pool = None
+
+    @staticmethod
+    async def reopen(swap):
+        """Закриває всі шарди, викликає swap() (у потоці) і відкриває їх знову.
+        Запити, що прийшли в цей час, чекають на пулі, а не падають на закритій базі"""
+        for pool in Database._pools:
+            await pool.suspend()
+        try:
+            await asyncio.to_thread(swap)
+        finally:
+            Database.clear_cache()
+            for pool in Database._pools:
+                await pool.resume()
+
+    @staticmethod
+    def pools():
+        return list(Database._pools)
+
+    @staticmethod
+    def _shard(user_id):
+        pools = Database._pools
+        return pools[int(user_id) % len(pools)]
+
+    # id нагадувань глобальні: local_id * N + номер шарду (при N=1 збігаються з локальними)
+    @staticmethod
+    def _rid(local_id, pool):
+        return local_id * len(Database._pools) + pool.index
+
+    @staticmethod
+    def _rid_local(rem_id):
+        rem_id = int(rem_id)
+        n = len(Database._pools)
+        return Database._pools[rem_id % n], rem_id // n
+
+    @staticmethod
+    async def _fan_out(sql, params=()):
+        """Виконує SELECT на всіх шардах паралельно: [(pool, rows), ...]"""
+        async def run(pool):
+            async with pool.read() as db:
+                async with db.execute(sql, params) as c:
+                    return pool, await c.fetchall()
+        return await asyncio.gather(*(run(pool) for pool in Database._pools))
+
+    @staticmethod
+    def read(user_id=None):
+        """Контекст з'єднання тільки для читання (шард користувача або основний)"""
+        pool = Database._pool if user_id is None else Database._shard(user_id)
+        return pool.read()
+
+    @staticmethod
+    def write(user_id=None):
+        """Контекст єдиного writer-з'єднання шарду; COMMIT при виході"""
+        pool = Database._pool if user_id is None else Database._shard(user_id)
+        return pool.write()
 
     @staticmethod
     async def get_user(user_id):
-        async with aiosqlite.connect(DB_NAME) as db:
-            # Створюємо користувача, якщо немає (default language='uk', morning=1)
-            await db.execute("INSERT OR IGNORE INTO users (user_id, language, morning_briefing) VALUES (?, 'uk', 1)", (user_id,))
-            await db.commit()
-            
-            # Вибираємо всі поля в чіткому порядку
-            query = """SELECT is_toxic, lat, lon, memory_json, spam_mode, language, morning_briefing, is_banned 
-                       FROM users WHERE user_id=?"""
-            async with db.execute(query, (user_id,)) as c:
-                return await c.fetchone()
-                # Індекси:
-                # 0: is_toxic
-                # 1: lat
-                # 2: lon
-                # 3: memory_json (unused legacy)
-                # 4: spam_mode
-                # 5: language
-                # 6: morning_briefing
-                # 7: is_banned
+        cached = Database._profiles.get(user_id)
+        if cached:
+            return cached
+
+        generation = Database._profiles.begin_fill()
+        profile = None
+        # Вибираємо всі поля в чіткому порядку (як у UserProfile)
+        query = """SELECT is_toxic, lat, lon, memory_json, spam_mode, language, morning_briefing, is_banned, timezone
+                   FROM users WHERE user_id=?"""
+        try:
+            async with Database.read(user_id) as db:
+                async with db.execute(query, (user_id,)) as c:
+                    row = await c.fetchone()
+            if row is None:
+                async with Database.write(user_id) as db:
+                    # Створюємо користувача, якщо немає (default language='uk', morning=1)
+                    await db.execute("INSERT OR IGNORE INTO users (user_id, language, morning_briefing) VALUES (?, 'uk', 1)", (user_id,))
+                    async with db.execute(query, (user_id,)) as c:
+                        row = await c.fetchone()
+            profile = UserProfile(user_id, *row)
+        finally:
+            Database._profiles.end_fill(profile, generation)
+        return profile
 
     @staticmethod
     async def update_user(user_id, **kwargs):
+        """Оновлює поля користувача і одразу кеш (write-through). Повертає свіжий профіль, якщо він був у кеші"""
         set_clause = ", ".join([f"{k}=?" for k in kwargs.keys()])
         values = list(kwargs.values()) + [user_id]
-        async with aiosqlite.connect(DB_NAME) as db:
+        async with Database.write(user_id) as db:
             await db.execute(f"UPDATE users SET {set_clause} WHERE user_id=?", values)
-            await db.commit()
+
+        cache = Database._profiles
+        cached = cache.peek(user_id)
+        if cached is None or not set(kwargs) <= set(UserProfile.__slots__):
+            cache.invalidate(user_id)
+            return None
+        cache.bump(user_id)
+        profile = cached.replace(**kwargs)
+        cache.put(profile)
+        return profile
 
     @staticmethod
-    async def add_reminder(user_id, chat_id, text, time, recurrence):
-        async with aiosqlite.connect(DB_NAME) as db:
-            await db.execute("INSERT INTO reminders (user_id, chat_id, remind_text, remind_time, recurrence) VALUES (?,?,?,?,?)",
-                             (user_id, chat_id, text, time, recurrence))
-            await db.commit()
+    def clear_cache():
+        """Скидає кеш профілів (після відновлення бази з бекапу)"""
+        Database._profiles.clear()
 
     @staticmethod
-    async def add_note(user_id, content):
-        async with aiosqlite.connect(DB_NAME) as db:
-            await db.execute("INSERT INTO notes (user_id, content) VALUES (?,?)", (user_id, content))
-            await db.commit()
+    def cache_stats():
+        """Лічильники кешу профілів (для /stats)"""
+        return Database._profiles.stats()
 
     @staticmethod
-    async def search_notes(user_id, query):
-        async with aiosqlite.connect(DB_NAME) as db:
-            sql = "SELECT content, created_at FROM notes WHERE user_id = ? AND content LIKE ? ORDER BY id DESC LIMIT 10"
-            async with db.execute(sql, (user_id, f"%{query}%")) as c:
+    async def add_reminder(user_id, chat_id, text, time, recurrence, wait=True):
+        """Ставить нагадування в чергу запису; time - локальний час користувача. З wait=True чекає COMMIT і повертає id"""
+        pool = Database._shard(user_id)
+        remind_at = local_to_epoch(time, (await Database.get_user(user_id)).timezone)
+        fut = pool.queue.submit("reminder", (user_id, chat_id, text, time, recurrence, remind_at))
+        fut.add_done_callback(lambda f: f.cancelled() or f.exception() or Database._notify_reminder(Database._rid(f.result(), pool), remind_at))
+        if wait:
+            return Database._rid(await fut, pool)
+
+    @staticmethod
+    async def add_note(user_id, content, wait=True):
+        fut = Database._shard(user_id).queue.submit("note", (user_id, content))
+        if wait:
+            await fut
+
+    @staticmethod
+    async def search_notes(user_id, query, limit=10):
+        """Повнотекстовий пошук (FTS5, bm25). Повертає (сніпет, created_at);
+        збіги у сніпеті обгорнуті в HIGHLIGHT_START/HIGHLIGHT_END"""
+        terms = fts_terms(query)
+        if not terms:
+            return []
+        match = f'user_id : "{int(user_id)}" AND content : ({" AND ".join(terms)})'
+        async with Database.read(user_id) as db:
+            async with db.execute(SEARCH_NOTES_SQL, (HIGHLIGHT_START, HIGHLIGHT_END, match, user_id, limit)) as c:
                 return await c.fetchall()
 
     @staticmethod
     async def get_recent_notes(user_id, limit=5):
-        async with aiosqlite.connect(DB_NAME) as db:
+        async with Database.read(user_id) as db:
             async with db.execute("SELECT content FROM notes WHERE user_id=? ORDER BY id DESC LIMIT ?", (user_id, limit)) as c:
                 return [row[0] for row in await c.fetchall()]
 
     @staticmethod
-    async def add_to_context(user_id, role, content):
-        async with aiosqlite.connect(DB_NAME) as db:
-            await db.execute("INSERT INTO context (user_id, role, content) VALUES (?,?,?)", (user_id, role, content))
-            await db.execute("DELETE FROM context WHERE id NOT IN (SELECT id FROM context WHERE user_id=? ORDER BY id DESC LIMIT 20) AND user_id=?", (user_id, user_id))
-            await db.commit()
+    async def _for_users(user_ids, sql, params=()):
+        """SELECT для набору користувачів: по запиту на шард, паралельно.
+        Список id передається першим параметром як JSON - у sql це json_each(?)"""
+        groups = {}
+        for user_id in user_ids:
+            groups.setdefault(Database._shard(user_id), []).append(user_id)
+        async def run(pool, ids):
+            async with pool.read() as db:
+                async with db.execute(sql, (json.dumps(ids), *params)) as c:
+                    return await c.fetchall()
+        return [r for rows in await asyncio.gather(*(run(pool, ids) for pool, ids in groups.items())) for r in rows]
+
+    @staticmethod
+    async def get_recent_notes_for_users(user_ids, limit=20):
+        """{user_id: [останні limit нотаток]} одним запитом на шард (віконна функція замість N запитів)"""
+        sql = """SELECT user_id, content FROM (
+                     SELECT user_id, content, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY id DESC) AS rn
+                     FROM notes WHERE user_id IN (SELECT value FROM json_each(?))
+                 ) WHERE rn <= ?"""
+        notes = {}
+        for user_id, content in await Database._for_users(user_ids, sql, (limit,)):
+            notes.setdefault(user_id, []).append(content)
+        return notes
+
+    @staticmethod
+    async def add_to_context(user_id, role, content, wait=False):
+        # Історію пишемо write-behind у кільце (див. _WriteQueue._ring_rows)
+        fut = Database._shard(user_id).queue.submit("context", (user_id, role, content))
+        if wait:
+            await fut
+
+    @staticmethod
+    async def flush():
+        """Чекає, поки всі поставлені в чергу записи будуть закомічені"""
+        await asyncio.gather(*(pool.queue.flush() for pool in Database._pools))
+
+    @staticmethod
+    async def get_context(user_id, limit=None, budget=None, after_seq=0):
+        """Найновіші репліки, що влазять у бюджет токенів (у хронологічному порядку).
+        after_seq відсікає репліки, які вже згорнуті в підсумок (див. get_memory)"""
+        limit = limit or CONTEXT_RING_SIZE
+        budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+        sql = "SELECT role, content, tokens FROM context WHERE user_id=? AND seq > ? ORDER BY seq DESC LIMIT ?"
+        async with Database.read(user_id) as db:
+            async with db.execute(sql, (user_id, after_seq, limit)) as c:
+                rows = await c.fetchall()
+        turns, used = [], 0
+        for role, content, tokens in rows:
+            if used + tokens > budget:
+                break
+            used += tokens
+            turns.append({"role": role, "content": content})
+        turns.reverse()
+        return turns
 
     @staticmethod
-    async def get_context(user_id, limit=6):
-        async with aiosqlite.connect(DB_NAME) as db:
-            async with db.execute("SELECT role, content FROM context WHERE user_id=? ORDER BY id ASC LIMIT ?", (user_id, limit)) as c:
+    async def get_context_range(user_id, after_seq, upto_seq):
+        """Репліки з seq у (after_seq, upto_seq] - для згортання в підсумок"""
+        sql = "SELECT role, content FROM context WHERE user_id=? AND seq > ? AND seq <= ? ORDER BY seq ASC"
+        async with Database.read(user_id) as db:
+            async with db.execute(sql, (user_id, after_seq, upto_seq)) as c:
                 return [{"role": r[0], "content": r[1]} for r in await c.fetchall()]
 
+    @staticmethod
+    async def get_last_seq(user_id):
+        async with Database.read(user_id) as db:
+            async with db.execute("SELECT COALESCE(MAX(seq), 0) FROM context WHERE user_id=?", (user_id,)) as c:
+                return (await c.fetchone())[0]
+
+    @staticmethod
+    async def get_memory(user_id):
+        """Підсумок старої частини діалогу з users.memory_json: {"summary": str, "upto": seq}"""
+        u = await Database.get_user(user_id)
+        try:
+            memory = json.loads(u.memory_json or "{}")
+        except ValueError:
+            memory = {}
+        if not isinstance(memory, dict):  # legacy '[]'
+            memory = {}
+        return {"summary": memory.get("summary", ""), "upto": memory.get("upto", 0)}
+
+    @staticmethod
+    async def set_memory(user_id, summary, upto):
+        await Database.update_user(user_id, memory_json=json.dumps({"summary": summary, "upto": upto}, ensure_ascii=False))
+
+    @staticmethod
+    def _notify_reminder(rem_id, remind_time):
+        for listener in Database.reminder_listeners:
+            try: listener(int(rem_id), remind_time)
+            except Exception as e: logger.error(f"Reminder listener error: {e}")
+
     @staticmethod
     async def get_active_reminders(user_id):
-        async with aiosqlite.connect(DB_NAME) as db:
-            query = "SELECT id, remind_time, remind_text FROM reminders WHERE user_id=? AND status IN ('pending','spamming') ORDER BY remind_time ASC"
+        pool = Database._shard(user_id)
+        async with pool.read() as db:
+            query = "SELECT id, remind_time, remind_text FROM reminders WHERE user_id=? AND status IN ('pending','spamming') ORDER BY remind_at ASC"
             async with db.execute(query, (user_id,)) as c:
-                return await c.fetchall()
+                return [(Database._rid(r[0], pool), *r[1:]) for r in await c.fetchall()]
 
     @staticmethod
     async def update_reminder_field(rem_id, field, value):
-        async with aiosqlite.connect(DB_NAME) as db:
-            await db.execute(f"UPDATE reminders SET {field}=? WHERE id=?", (value, rem_id))
-            await db.commit()
+        await Database.update_reminders([(rem_id, {field: value})])
 
     @staticmethod
-    async def delete_reminder(rem_id):
-        async with aiosqlite.connect(DB_NAME) as db:
-            await db.execute("DELETE FROM reminders WHERE id=?", (rem_id,))
-            await db.commit()
+    async def update_reminders(changes):
+        """Пакетне оновлення [(rem_id, {поле: значення}), ...] - одна транзакція на шард.
+        Новий remind_time (локальний) сам перераховується в remind_at за поясом власника"""
+        by_pool = {}
+        for rem_id, fields in changes:
+            pool, local_id = Database._rid_local(rem_id)
+            by_pool.setdefault(pool, []).append((local_id, fields))
+        for pool, items in by_pool.items():
+            async with pool.write() as db:
+                for local_id, fields in items:
+                    if "remind_time" in fields and "remind_at" not in fields:
+                        async with db.execute("SELECT u.timezone FROM reminders r LEFT JOIN users u ON u.user_id = r.user_id "
+                                              "WHERE r.id=?", (local_id,)) as c:
+                            row = await c.fetchone()
+                        fields["remind_at"] = local_to_epoch(fields["remind_time"], row[0] if row else None)
+                    set_clause = ", ".join(f"{k}=?" for k in fields)
+                    await db.execute(f"UPDATE reminders SET {set_clause} WHERE id=?", (*fields.values(), local_id))
+        for rem_id, fields in changes:
+            if fields.get("status") not in (None, "pending", "spamming"):
+                Database._notify_reminder(rem_id, None)
+            elif fields.get("next_nag_at"):
+                Database._notify_reminder(rem_id, fields["next_nag_at"])
+            elif "remind_at" in fields:
+                Database._notify_reminder(rem_id, fields["remind_at"])
 
     @staticmethod
-    async def get_stats():
-        async with aiosqlite.connect(DB_NAME) as db:
-            async with db.execute("SELECT COUNT(DISTINCT user_id) FROM users") as c:
-                users = (await c.fetchone())[0]
-            async with db.execute("SELECT COUNT(*) FROM reminders WHERE status = 'pending'") as c:
-                active_rems = (await c.fetchone())[0]
-            return users, active_rems
+    async def get_reminder(rem_id):
+        """(user_id, chat_id, remind_text, remind_time, recurrence, status, last_message_id) або None"""
+        pool, local_id = Database._rid_local(rem_id)
+        async with pool.read() as db:
+            async with db.execute("SELECT user_id, chat_id, remind_text, remind_time, recurrence, status, last_message_id "
+                                  "FROM reminders WHERE id=?", (local_id,)) as c:
+                return await c.fetchone()
+
+    @staticmethod
+    async def delete_reminder(rem_id, user_id):
+        """Видаляє нагадування, якщо воно належить user_id. True - видалено"""
+        pool, local_id = Database._rid_local(rem_id)
+        async with pool.write() as db:
+            cursor = await db.execute("DELETE FROM reminders WHERE id=? AND user_id=?", (local_id, user_id))
+        if not cursor.rowcount:
+            return False
+        Database._notify_reminder(rem_id, None)
+        return True
+
+    @staticmethod
+    async def get_due_reminders(now_ts, ids=None):
+        """Нагадування, які пора відправити на момент now_ts (з усіх шардів або тільки з ids)"""
+        sql = """SELECT id, chat_id, remind_text, user_id, status, recurrence, remind_time, nag_count, last_message_id
+                 FROM reminders WHERE ((status='pending' AND remind_at <= ?) OR (status='spamming' AND next_nag_at <= ?))"""
+        if ids is None:
+            return [(Database._rid(r[0], pool), *r[1:]) for pool, rows in await Database._fan_out(sql, (now_ts, now_ts)) for r in rows]
+        by_pool = {}
+        for rem_id in ids:
+            pool, local_id = Database._rid_local(rem_id)
+            by_pool.setdefault(pool, []).append(local_id)
+        result = []
+        for pool, local_ids in by_pool.items():
+            marks = ",".join("?" * len(local_ids))
+            async with pool.read() as db:
+                async with db.execute(f"{sql} AND id IN ({marks})", (now_ts, now_ts, *local_ids)) as c:
+                    result += [(Database._rid(r[0], pool), *r[1:]) for r in await c.fetchall()]
+        return result
+
+    @staticmethod
+    async def get_upcoming_reminders(until_ts):
+        """(id, unix time наступної відправки) активних нагадувань до until_ts - для планувальника"""
+        sql = """SELECT id, remind_at FROM reminders WHERE status='pending' AND remind_at <= ?
+                 UNION ALL
+                 SELECT id, next_nag_at FROM reminders WHERE status='spamming' AND next_nag_at <= ?"""
+        return [(Database._rid(r[0], pool), r[1]) for pool, rows in await Database._fan_out(sql, (until_ts, until_ts)) for r in rows]
 
     @staticmethod
-    async def clean_old_data(days=7):
-        async with aiosqlite.connect(DB_NAME) as db:
-            if days > 0:
-                await db.execute("DELETE FROM reminders WHERE status != 'pending' AND remind_time < datetime('now', ?)", (f'-{days} days',))
-            else:
-                await db.execute("DELETE FROM reminders WHERE status != 'pending'")
-            await db.commit()
+    async def get_overdue_recurring(before_ts):
+        """(id, remind_time, recurrence, timezone) повторюваних нагадувань, що мали спрацювати до before_ts"""
+        sql = """SELECT r.id, r.remind_time, r.recurrence, u.timezone FROM reminders r
+                 LEFT JOIN users u ON u.user_id = r.user_id
+                 WHERE r.status='pending' AND r.remind_at < ? AND r.recurrence IS NOT NULL"""
+        return [(Database._rid(r[0], pool), *r[1:]) for pool, rows in await Database._fan_out(sql, (before_ts,)) for r in rows]
+
+    @staticmethod
+    async def get_plans_for_users(user_ids, start_ts, end_ts):
+        """{user_id: [(remind_text, remind_time)]} на проміжок часу для набору користувачів"""
+        sql = """SELECT user_id, remind_text, remind_time FROM reminders
+                 WHERE user_id IN (SELECT value FROM json_each(?)) AND status='pending' AND remind_at BETWEEN ? AND ?
+                 ORDER BY remind_at"""
+        plans = {}
+        for user_id, text, remind_time in await Database._for_users(user_ids, sql, (start_ts, end_ts)):
+            plans.setdefault(user_id, []).append((text, remind_time))
+        return plans
+
+    @staticmethod
+    async def set_timezone(user_id, tz_name):
+        """Міняє пояс користувача; активні нагадування лишаються на тій самій локальній годині"""
+        await Database.update_user(user_id, timezone=tz_name)
+        async with Database.read(user_id) as db:
+            async with db.execute("SELECT id, remind_time FROM reminders WHERE user_id=? AND status='pending'", (user_id,)) as c:
+                rows = await c.fetchall()
+        pool = Database._shard(user_id)
+        await Database.update_reminders([(Database._rid(local_id, pool), {"remind_at": local_to_epoch(remind_time, tz_name)})
+                                         for local_id, remind_time in rows])
+
+    @staticmethod
+    async def get_stats():
+        users = active_rems = 0
+        for _, rows in await Database._fan_out("SELECT COUNT(*) FROM users"):
+            users += rows[0][0]
+        for _, rows in await Database._fan_out("SELECT COUNT(*) FROM reminders WHERE status = 'pending'"):
+            active_rems += rows[0][0]
+        return users, active_rems
 
     @staticmethod
     async def get_all_users():
-        async with aiosqlite.connect(DB_NAME) as db:
-            # Оновлено, щоб брати всі потрібні поля
-            async with db.execute("SELECT user_id, is_toxic, lat, lon, spam_mode, language, morning_briefing FROM users") as c:
-                return await c.fetchall()
+        # Оновлено, щоб брати всі потрібні поля
+        sql = "SELECT user_id, is_toxic, lat, lon, spam_mode, language, morning_briefing, timezone FROM users"
+        return sorted(r for _, rows in await Database._fan_out(sql) for r in rows)
+
+    @staticmethod
+    async def count_broadcast_users():
+        """Скільки користувачів отримають розсилку (без тих, хто заблокував бота)"""
+        return sum(rows[0][0] for _, rows in await Database._fan_out("SELECT COUNT(*) FROM users WHERE is_blocked=0"))
+
+    @staticmethod
+    async def get_broadcast_page(after_id, limit):
+        """Наступні limit user_id після курсора after_id, за зростанням (злиття по всіх шардах)"""
+        sql = "SELECT user_id FROM users WHERE user_id > ? AND is_blocked=0 ORDER BY user_id LIMIT ?"
+        ids = [r[0] for _, rows in await Database._fan_out(sql, (after_id, limit)) for r in rows]
+        return sorted(ids)[:limit]
+
+    @staticmethod
+    async def set_blocked(user_ids, blocked=True):
+        """Позначає користувачів, що заблокували (або розблокували) бота - одна транзакція на шард"""
+        by_shard = {}
+        for user_id in user_ids:
+            by_shard.setdefault(Database._shard(user_id), []).append((int(blocked), user_id))
+        for pool, rows in by_shard.items():
+            async with pool.write() as db:
+                await db.executemany("UPDATE users SET is_blocked=? WHERE user_id=?", rows)
+
+    @staticmethod
+    async def get_briefing_users():
+        """(user_id, is_toxic, lat, lon, language, timezone) тих, кому слати ранковий бріфінг"""
+        sql = ("SELECT user_id, is_toxic, lat, lon, language, timezone FROM users "
+               "WHERE morning_briefing=1 AND is_banned=0 AND is_blocked=0")
+        return [r for _, rows in await Database._fan_out(sql) for r in rows]
 
     @staticmethod
     async def get_all_active_reminders():
-        async with aiosqlite.connect(DB_NAME) as db:
-            sql = "SELECT id, user_id, remind_text, remind_time FROM reminders WHERE status = 'pending' ORDER BY remind_time ASC"
-            async with db.execute(sql) as c:
-                return await c.fetchall()
+        sql = "SELECT id, user_id, remind_text, remind_time, remind_at FROM reminders WHERE status = 'pending'"
+        rems = [(Database._rid(r[0], pool), *r[1:]) for pool, rows in await Database._fan_out(sql) for r in rows]
+        return [r[:4] for r in sorted(rems, key=lambda r: r[4])]
+
+    @staticmethod
+    async def get_yt_summary(video_id, lang, ttl):
+        """Підсумок відео з кешу, не старший за ttl сек, або None. Влучання оновлює last_used_at (LRU)"""
+        async with Database.read() as db:
+            async with db.execute("SELECT summary FROM yt_cache WHERE video_id=? AND lang=? AND created_at >= ?",
+                                  (video_id, lang, time.time() - ttl)) as c:
+                row = await c.fetchone()
+        if row:
+            async with Database.write() as db:
+                await db.execute("UPDATE yt_cache SET last_used_at=?, hits=hits+1 WHERE video_id=? AND lang=?",
+                                 (time.time(), video_id, lang))
+        return row[0] if row else None
+
+    @staticmethod
+    async def put_yt_summary(video_id, lang, summary, ttl, max_rows):
+        """Кладе підсумок у кеш; прострочені і зайві понад max_rows (найдавніше використані) видаляє"""
+        now = time.time()
+        async with Database.write() as db:
+            await db.execute("INSERT OR REPLACE INTO yt_cache (video_id, lang, summary, created_at, last_used_at) "
+                             "VALUES (?, ?, ?, ?, ?)", (video_id, lang, summary, now, now))
+            await db.execute("DELETE FROM yt_cache WHERE created_at < ?", (now - ttl,))
+            await db.execute("DELETE FROM yt_cache WHERE (video_id, lang) IN (SELECT video_id, lang FROM yt_cache "
+                             "ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)", (max_rows,))
 
     @staticmethod
     async def get_latest_notes(limit=10):
-        async with aiosqlite.connect(DB_NAME) as db:
-            sql = "SELECT user_id, content, created_at FROM notes ORDER BY id DESC LIMIT ?"
-            async with db.execute(sql, (limit,)) as c:
-                return await c.fetchall()
+        sql = "SELECT user_id, content, created_at FROM notes ORDER BY id DESC LIMIT ?"
+        notes = [r for _, rows in await Database._fan_out(sql, (limit,)) for r in rows]
+        return sorted(notes, key=lambda r: r[2], reverse=True)[:limit]
@@ -0,0 +1,184 @@
+"""Відправка повідомлень з урахуванням лімітів Telegram.
+
+Глобальний token bucket (SEND_RATE/сек) + окремий bucket на кожен чат
+(SEND_CHAT_RATE для особистих, SEND_GROUP_RATE для груп), не більше
+SEND_CONCURRENCY запитів одночасно. На RetryAfter на паузу (на вказаний Telegram час)
+ставиться лише той чат, що його отримав - решта чатів відправляються далі; потім повтор
+(до SEND_RETRIES разів).
+"""
+import re
+import time
+import asyncio
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest, TelegramNetworkError
+from config import SEND_RATE, SEND_CHAT_RATE, SEND_GROUP_RATE, SEND_CONCURRENCY, SEND_RETRIES, STREAM_EDIT_INTERVAL, logger
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def idle(self, now):
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity and now >= self.paused_until
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class Sender:
+    def __init__(self):
+        self.bucket = TokenBucket(SEND_RATE)
+        self.chats = {}  # chat_id -> TokenBucket
+        self.semaphore = asyncio.Semaphore(SEND_CONCURRENCY)
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chats.get(chat_id)
+        if bucket is None:
+            if len(self.chats) > 10000:
+                # Повні bucket'и нічого не пам'ятають - їх можна викинути
+                now = time.monotonic()
+                self.chats = {k: b for k, b in self.chats.items() if not b.idle(now)}
+            # Від'ємні id - групи/канали, там ліміт суворіший
+            bucket = TokenBucket(SEND_GROUP_RATE if chat_id < 0 else SEND_CHAT_RATE, capacity=1)
+            self.chats[chat_id] = bucket
+        return bucket
+
+    async def send(self, bot: Bot, chat_id, text, raise_errors=False, **kwargs):
+        """send_message з лімітами і повторами. Повертає Message або None (raise_errors - кинути останню помилку)"""
+        return await self._call(chat_id, lambda: bot.send_message(chat_id, text, **kwargs), raise_errors)
+
+    async def edit(self, bot: Bot, chat_id, message_id, text, raise_errors=False, **kwargs):
+        """edit_message_text під тими ж лімітами"""
+        return await self._call(chat_id, lambda: bot.edit_message_text(text, chat_id=chat_id, message_id=message_id, **kwargs),
+                                raise_errors)
+
+    async def _call(self, chat_id, request, raise_errors):
+        chat_bucket = self._chat_bucket(chat_id)
+        error = None
+        for attempt in range(SEND_RETRIES + 1):
+            # Спершу чекаємо свій чат, щоб не тримати глобальний токен і слот даремно
+            await chat_bucket.acquire()
+            await self.bucket.acquire()
+            async with self.semaphore:
+                try:
+                    msg = await request()
+                    self.sent += 1
+                    return msg
+                except TelegramRetryAfter as e:
+                    error = e
+                    logger.warning(f"Flood control: retry after {e.retry_after}s (chat {chat_id})")
+                    chat_bucket.pause(e.retry_after)
+                except TelegramNetworkError as e:
+                    error = e
+                    logger.warning(f"Send network error (chat {chat_id}): {e}")
+                    await asyncio.sleep(2 ** attempt)
+                except (TelegramForbiddenError, TelegramBadRequest) as e:
+                    error = e
+                    # Бот заблокований / чат не існує - повтор не допоможе
+                    logger.info(f"Send rejected (chat {chat_id}): {e}")
+                    break
+                except Exception as e:
+                    error = e
+                    logger.error(f"Send error (chat {chat_id}): {e}")
+                    break
+            self.retried += 1
+        self.failed += 1
+        if raise_errors:
+            raise error
+        return None
+
+    def stats(self):
+        return {"sent": self.sent, "failed": self.failed, "retried": self.retried, "chats": len(self.chats)}
+
+sender = Sender()
+
+# Символи Markdown: текст з ними треба перередагувати з розміткою, навіть якщо він уже показаний
+MARKUP = re.compile(r"[*_`\[]")
+
+class LiveMessage:
+    """Повідомлення, що дописується по мірі генерації (стрімінг LLM).
+
+    update() лише запам'ятовує текст і не чекає мережі; редагування йде у фоні не частіше
+    ніж раз на interval секунд і завжди з найсвіжішим текстом. Проміжні версії - без
+    parse_mode (незакрита розмітка ламає Markdown), фінальна - з розміткою за замовчуванням.
+    """
+
+    def __init__(self, bot: Bot, chat_id, interval=STREAM_EDIT_INTERVAL):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.interval = interval
+        self.message_id = None
+        self.text = None
+        self.shown = None
+        self.edited_at = 0
+        self.task = None
+
+    async def start(self, placeholder):
+        msg = await sender.send(self.bot, self.chat_id, placeholder)
+        if msg:
+            self.message_id = msg.message_id
+            self.shown = placeholder
+            self.edited_at = time.monotonic()
+        return msg
+
+    def update(self, text):
+        self.text = text
+        if self.message_id and (self.task is None or self.task.done()):
+            self.task = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        while self.text != self.shown:
+            await asyncio.sleep(max(0, self.edited_at + self.interval - time.monotonic()))
+            text = self.text
+            self.edited_at = time.monotonic()
+            if not await sender.edit(self.bot, self.chat_id, self.message_id, text, parse_mode=None):
+                break
+            self.shown = text
+
+    async def _stop(self):
+        if self.task:
+            self.task.cancel()
+            try: await self.task
+            except asyncio.CancelledError: pass
+
+    async def finish(self, text):
+        """Фінальний текст: редагує повідомлення (або шле нове, якщо заглушки немає)"""
+        await self._stop()
+        if not self.message_id:
+            return await sender.send(self.bot, self.chat_id, text)
+        if text == self.shown and not MARKUP.search(text):
+            return True
+        # Темп редагувань чату тримає bucket у sender. Markdown не розібрався - показуємо як є
+        return (await sender.edit(self.bot, self.chat_id, self.message_id, text)
+                or await sender.edit(self.bot, self.chat_id, self.message_id, text, parse_mode=None))
+
+    async def discard(self):
+        """Генерація не вдалась - прибираємо заглушку"""
+        await self._stop()
+        if self.message_id:
+            try:
+                await self.bot.delete_message(self.chat_id, self.message_id)
+            except Exception as e:
+                logger.info(f"Placeholder delete failed (chat {self.chat_id}): {e}")
@@ -0,0 +1,122 @@
+"""Локальний фейковий Groq API для перевірки groq_client без ключа і лімітів.
+
+    python fake_groq.py --port 8081 --rpm 30 --error-rate 0.1 --latency 0.5
+    GROQ_API_BASE=http://127.0.0.1:8081/openai/v1 python bot.py
+
+Відповідає на chat/completions (звичайно і stream=true, SSE), audio/transcriptions.
+Тримає ліміт запитів за хвилину: віддає x-ratelimit-* заголовки як Groq, а понад ліміт -
+429 з retry-after. --concurrency - скільки запитів одночасно "витримує" сервер (решта - 429),
+--error-rate - частка випадкових 503, --down - усі запити 503 (для запобіжника).
+Відповідь чату - JSON у форматі, який чекає groq_text_brain. GET /stats - лічильники.
+З нього ж працюють тести groq_client (tests/test_groq_client.py).
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+from aiohttp import web
+
+REPLY = {"reply": "Fake Groq reply", "is_reminder": False, "task": None, "time": None,
+         "recurrence": None, "save_note": None}
+
+class FakeGroq:
+    def __init__(self, args):
+        self.args = args
+        self.window_start = time.monotonic()
+        self.used = 0
+        self.inflight = 0
+        self.stats = {"requests": 0, "ok": 0, "throttled": 0, "errors": 0, "peak_inflight": 0}
+
+    def _window_left(self):
+        return max(0.0, 60 - (time.monotonic() - self.window_start))
+
+    def _limit_headers(self):
+        left = self._window_left()
+        return {"x-ratelimit-limit-requests": str(self.args.rpm),
+                "x-ratelimit-remaining-requests": str(max(0, self.args.rpm - self.used)),
+                "x-ratelimit-reset-requests": f"{left:.2f}s",
+                "x-ratelimit-limit-tokens": "1000000",
+                "x-ratelimit-remaining-tokens": "1000000",
+                "x-ratelimit-reset-tokens": "1s"}
+
+    def _admit(self):
+        """None - запит прийнято, інакше готова відповідь з помилкою"""
+        self.stats["requests"] += 1
+        if time.monotonic() - self.window_start >= 60:
+            self.window_start, self.used = time.monotonic(), 0
+        if self.args.down or random.random() < self.args.error_rate:
+            self.stats["errors"] += 1
+            return web.json_response({"error": {"message": "Service Unavailable"}}, status=503)
+        headers = self._limit_headers()
+        if self.used >= self.args.rpm or self.inflight >= self.args.concurrency:
+            self.stats["throttled"] += 1
+            retry_after = self._window_left() if self.used >= self.args.rpm else 1
+            headers["retry-after"] = str(max(1, round(retry_after)))
+            return web.json_response({"error": {"message": "Rate limit reached", "type": "requests"}},
+                                     status=429, headers=headers)
+        self.used += 1
+        self.inflight += 1
+        self.stats["peak_inflight"] = max(self.stats["peak_inflight"], self.inflight)
+        return None
+
+    async def chat(self, request):
+        error = self._admit()
+        if error:
+            return error
+        try:
+            payload = await request.json()
+            content = json.dumps(REPLY, ensure_ascii=False)
+            if not payload.get("stream"):
+                await asyncio.sleep(self.args.latency)
+                self.stats["ok"] += 1
+                return web.json_response({"choices": [{"message": {"role": "assistant", "content": content}}]},
+                                         headers=self._limit_headers())
+            resp = web.StreamResponse(headers={"Content-Type": "text/event-stream", **self._limit_headers()})
+            await resp.prepare(request)
+            for i in range(0, len(content), 8):
+                chunk = {"choices": [{"delta": {"content": content[i:i + 8]}}]}
+                await resp.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                await asyncio.sleep(self.args.latency / 10)
+            await resp.write(b"data: [DONE]\n\n")
+            self.stats["ok"] += 1
+            return resp
+        finally:
+            self.inflight -= 1
+
+    async def transcribe(self, request):
+        error = self._admit()
+        if error:
+            return error
+        try:
+            await request.post()
+            await asyncio.sleep(self.args.latency)
+            self.stats["ok"] += 1
+            return web.json_response({"text": "Fake transcription"}, headers=self._limit_headers())
+        finally:
+            self.inflight -= 1
+
+    async def get_stats(self, request):
+        return web.json_response(self.stats)
+
+FAKE = web.AppKey("fake", FakeGroq)
+
+def make_app(args):
+    fake = FakeGroq(args)
+    app = web.Application(client_max_size=50 * 1024 * 1024)
+    app.router.add_post("/openai/v1/chat/completions", fake.chat)
+    app.router.add_post("/openai/v1/audio/transcriptions", fake.transcribe)
+    app.router.add_get("/stats", fake.get_stats)
+    app[FAKE] = fake
+    return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Groq API for local testing")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--rpm", type=int, default=30, help="requests per minute before 429")
+    parser.add_argument("--concurrency", type=int, default=1000, help="concurrent requests before 429")
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of random 503 responses")
+    parser.add_argument("--down", action="store_true", help="answer every request with 503")
+    args = parser.parse_args()
+    web.run_app(make_app(args), host="127.0.0.1", port=args.port)
@@ -0,0 +1,255 @@
+"""Стійкий клієнт Groq API для чату, стрімінгу, розпізнавання голосу і зору.
+
+- Бюджет: після кожної відповіді читаються заголовки x-ratelimit-remaining-/reset-
+  (requests і tokens). Якщо запит не влазить у залишок, він чекає скидання вікна
+  замість того, щоб гарантовано отримати 429.
+- Конкурентність: одночасно не більше limit запитів. limit підлаштовується (AIMD):
+  +1/limit за кожну успішну відповідь, удвічі менше при 429 (не частіше раза на секунду),
+  в межах 1..GROQ_MAX_CONCURRENCY.
+- Повтори: 429, 5xx, таймаути і помилки з'єднання повторюються до GROQ_RETRIES разів
+  з експоненційною паузою і випадковим розкидом (поверх retry-after, якщо він є).
+- Запобіжник (circuit breaker): якщо серед останніх BREAKER_WINDOW відповідей щонайменше
+  GROQ_BREAKER_FAILURES збоїв (5xx/мережа) і вони складають не менше GROQ_BREAKER_RATIO,
+  запити GROQ_BREAKER_COOLDOWN секунд одразу падають з GroqUnavailable, потім пропускається
+  один пробний запит: успіх - запобіжник закривається, збій - знову відкривається.
+Адреса API - GROQ_API_BASE (для локальної перевірки - fake_groq.py).
+"""
+import os
+import re
+import time
+import random
+import asyncio
+import contextlib
+import aiohttp
+from collections import deque
+from http_client import http
+from utils import estimate_tokens
+from config import (GROQ_KEY, GROQ_API_BASE, GROQ_CONCURRENCY, GROQ_MAX_CONCURRENCY, GROQ_RETRIES, GROQ_BACKOFF,
+                    GROQ_BACKOFF_MAX, GROQ_BREAKER_FAILURES, GROQ_BREAKER_RATIO, GROQ_BREAKER_COOLDOWN, logger)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+UNITS = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+BREAKER_WINDOW = 20
+# Оцінка токенів на одне зображення: base64 з data URL у токени не рахується
+IMAGE_TOKENS = 1500
+
+class GroqError(Exception):
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+class GroqUnavailable(GroqError):
+    """Запобіжник відкритий - API зараз не викликаємо"""
+
+def parse_duration(value):
+    """'1m2.5s', '7.66s', '120ms', '3' -> секунди або None"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION.findall(value)
+    return sum(float(n) * UNITS[unit] for n, unit in parts) if parts else None
+
+class GroqClient:
+    def __init__(self):
+        self.limit = float(GROQ_CONCURRENCY)
+        self.inflight = 0
+        self.slots = asyncio.Condition()
+        self.last_decrease = 0.0
+        # Бюджет з заголовків: залишок і момент скидання (time.monotonic), None - ще невідомо
+        self.budget = {"requests": [None, 0.0], "tokens": [None, 0.0]}
+        self.outcomes = deque(maxlen=BREAKER_WINDOW)  # True - збій
+        self.opened_at = None
+        self.probing = False
+        self.counters = {"requests": 0, "retries": 0, "throttled": 0, "failed": 0, "rejected": 0}
+
+    def url(self, path):
+        return f"{GROQ_API_BASE.rstrip('/')}/{path}"
+
+    # --- запобіжник ---
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "open" if time.monotonic() - self.opened_at < GROQ_BREAKER_COOLDOWN else "half-open"
+
+    def _check_breaker(self):
+        state = self.state
+        if state == "open" or (state == "half-open" and self.probing):
+            self.counters["rejected"] += 1
+            raise GroqUnavailable("Groq circuit breaker is open")
+        if state == "half-open":
+            self.probing = True
+        return state == "half-open"
+
+    def _record(self, ok, probe):
+        if probe:
+            self.probing = False
+        if ok and probe:
+            logger.info("Groq circuit breaker closed")
+            self.outcomes.clear()
+            self.opened_at = None
+        self.outcomes.append(not ok)
+        failures = sum(self.outcomes)
+        if not ok and (probe or (self.opened_at is None and failures >= GROQ_BREAKER_FAILURES
+                                 and failures >= GROQ_BREAKER_RATIO * len(self.outcomes))):
+            logger.warning(f"Groq circuit breaker open for {GROQ_BREAKER_COOLDOWN}s "
+                           f"({failures} failures in last {len(self.outcomes)} responses)")
+            self.opened_at = time.monotonic()
+
+    # --- конкурентність (AIMD) ---
+    async def _acquire(self):
+        async with self.slots:
+            await self.slots.wait_for(lambda: self.inflight < int(self.limit))
+            self.inflight += 1
+
+    async def _release(self):
+        async with self.slots:
+            self.inflight -= 1
+            self.slots.notify_all()
+
+    def _on_success(self):
+        self.limit = min(GROQ_MAX_CONCURRENCY, self.limit + 1 / self.limit)
+
+    def _on_throttled(self):
+        self.counters["throttled"] += 1
+        now = time.monotonic()
+        # Відповіді на запити, відправлені ще до зменшення, не зменшують ліміт удруге
+        if now - self.last_decrease >= 1:
+            self.last_decrease = now
+            self.limit = max(1.0, self.limit / 2)
+
+    # --- бюджет з заголовків ---
+    async def _wait_budget(self, tokens):
+        for kind, need in (("requests", 1), ("tokens", tokens)):
+            remaining, reset_at = self.budget[kind]
+            if remaining is None:
+                continue
+            delay = reset_at - time.monotonic()
+            if delay <= 0:
+                self.budget[kind][0] = None
+                continue
+            if remaining < need:
+                await asyncio.sleep(min(delay, GROQ_BACKOFF_MAX))
+                self.budget[kind][0] = None
+            else:
+                # Резервуємо, щоб паралельні запити не розрахували на той самий залишок
+                self.budget[kind][0] = remaining - need
+
+    def _read_budget(self, headers):
+        now = time.monotonic()
+        for kind in ("requests", "tokens"):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+            if remaining is not None and reset is not None:
+                try:
+                    self.budget[kind] = [int(remaining), now + reset]
+                except ValueError:
+                    pass
+
+    def _backoff(self, attempt, retry_after=None):
+        # Розкид і поверх retry-after: інакше всі відкладені запити повернуться в ту саму мить
+        delay = random.uniform(0, min(GROQ_BACKOFF_MAX, GROQ_BACKOFF * 2 ** attempt))
+        return min(GROQ_BACKOFF_MAX, delay + (retry_after or 0))
+
+    @contextlib.asynccontextmanager
+    async def _open(self, path, tokens=0, json_body=None, form=None, timeout=None):
+        """Відповідь зі статусом 200 (після повторів) - тримає слот, поки її читають"""
+        for attempt in range(GROQ_RETRIES + 1):
+            if self.state == "open":
+                self.counters["rejected"] += 1
+                raise GroqUnavailable("Groq circuit breaker is open")
+            await self._wait_budget(tokens)
+            await self._acquire()
+            error = None
+            probe = yielded = False
+            try:
+                probe = self._check_breaker()
+                self.counters["requests"] += 1
+                kwargs = {"json": json_body} if form is None else {"data": form()}
+                if timeout:
+                    kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout)
+                async with http.session.post(self.url(path), headers={"Authorization": f"Bearer {GROQ_KEY}"}, **kwargs) as resp:
+                    self._read_budget(resp.headers)
+                    if resp.status == 200:
+                        self._on_success()
+                        self._record(True, probe)
+                        probe = False
+                        yielded = True
+                        yield resp
+                        return
+                    body = (await resp.text())[:200]
+                    error = GroqError(f"HTTP {resp.status}: {body}", resp.status,
+                                      parse_duration(resp.headers.get("retry-after")))
+                    if resp.status == 429:
+                        self._on_throttled()
+                    # 4xx (крім 429) - помилка запиту, а не збій API
+                    self._record(resp.status < 500, probe)
+                    probe = False
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if yielded:
+                    raise  # обрив під час читання відповіді - не повторюємо
+                error = GroqError(f"{type(e).__name__}: {e}")
+                self._record(False, probe)
+                probe = False
+            finally:
+                if probe:
+                    # Пробний запит скасували - не тримаємо запобіжник у half-open назавжди
+                    self.probing = False
+                await self._release()
+            if error.status not in RETRY_STATUSES and error.status is not None or attempt == GROQ_RETRIES:
+                self.counters["failed"] += 1
+                raise error
+            self.counters["retries"] += 1
+            await asyncio.sleep(self._backoff(attempt, error.retry_after))
+
+    @staticmethod
+    def _estimate(payload):
+        tokens = payload.get("max_tokens", 1024)
+        for message in payload.get("messages", []):
+            content = message.get("content")
+            if not isinstance(content, list):
+                tokens += estimate_tokens(content or "")
+                continue
+            for part in content:
+                if part.get("type") == "image_url":
+                    tokens += IMAGE_TOKENS
+                else:
+                    tokens += estimate_tokens(part.get("text") or "")
+        return tokens
+
+    async def chat(self, payload):
+        """chat/completions -> розібраний JSON відповіді"""
+        async with self._open("chat/completions", self._estimate(payload), json_body=payload) as resp:
+            return await resp.json()
+
+    @contextlib.asynccontextmanager
+    async def chat_stream(self, payload):
+        """chat/completions зі stream=true -> відповідь для читання SSE.
+        Повторюється лише до першого байта: показаний користувачу текст не дублюється"""
+        async with self._open("chat/completions", self._estimate(payload), json_body=dict(payload, stream=True)) as resp:
+            yield resp
+
+    async def transcribe(self, file_path, model, timeout=None):
+        """audio/transcriptions -> розібраний JSON відповіді"""
+        with open(file_path, "rb") as f:
+            content = f.read()
+
+        def form():
+            # FormData одноразова - на кожну спробу нова
+            data = aiohttp.FormData()
+            data.add_field("file", content, filename=os.path.basename(file_path))
+            data.add_field("model", model)
+            return data
+
+        async with self._open("audio/transcriptions", form=form, timeout=timeout) as resp:
+            return await resp.json()
+
+    def stats(self):
+        return dict(self.counters, limit=int(self.limit), inflight=self.inflight, state=self.state)
+
+groq = GroqClient()
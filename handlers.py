@@ -1,7 +1,9 @@
 import os
 import re
-import asyncio
+import html
+import time
 import sys
+import pytz
 from datetime import datetime
 from aiogram import Router, F, types
 from aiogram.filters import CommandStart, Command, StateFilter
@@ -10,23 +12,26 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton, ErrorEvent, FSInputFile
 from aiogram_calendar import SimpleCalendar, SimpleCalendarCallback
 
-from database import Database
-from config import ADMIN_IDS, logger
-from ai_engine import groq_text_brain, groq_transcribe, groq_analyze_image, groq_summarize_video
-from utils import create_backup, get_youtube_id
+from database import Database, HIGHLIGHT_START, HIGHLIGHT_END
+from config import ADMIN_IDS, BACKUP_DIR, STREAM_REPLIES, logger
+from ai_engine import groq_text_brain, groq_text_brain_stream, groq_transcribe, groq_analyze_image, get_video_summary, video_cache_stats, schedule_summary
+from utils import get_youtube_id, normalize_time, normalize_datetime, local_now, user_tz
+from weather import weather
+from groq_client import groq
+import retention
+import tasks
+from delivery import sender, LiveMessage
+from outbox import outbox, INTERACTIVE
+from broadcast import broadcaster
+from tasks import next_time
+from recurrence import normalize_rule
+import intents
+from intents import match_intent
+from backup import create_snapshot, restore_snapshot, list_snapshots, read_checksum
 from locales import t
 
 router = Router()
 
-def normalize_time(text_time):
-    clean_time = text_time.replace('.', ':').replace(',', ':').replace(' ', ':')
-    if re.match(r"^\d{1,2}:\d{2}$", clean_time):
-        parts = clean_time.split(':')
-        h, m = int(parts[0]), int(parts[1])
-        if 0 <= h <= 23 and 0 <= m <= 59:
-            return f"{h:02d}:{m:02d}"
-    return None
-
 class ReminderFSM(StatesGroup):
     waiting_for_text = State()
     waiting_for_date = State()
@@ -41,12 +46,12 @@ class EditFSM(StatesGroup):
 # --- ПЕРЕВІРКА НА БАН ---
 async def is_banned(user_id):
     u = await Database.get_user(user_id)
-    return u[7] # 7-й індекс це is_banned
+    return u.is_banned
 
 # --- КЛАВІАТУРИ ---
 async def get_kb(user_id):
     u = await Database.get_user(user_id)
-    lang = u[5]
+    lang = u.language
     kb = [
         [KeyboardButton(text=t("btn_create_rem", lang)), KeyboardButton(text=t("btn_list_rem", lang))],
         [KeyboardButton(text=t("btn_weather", lang), request_location=True)],
@@ -56,8 +61,7 @@ async def get_kb(user_id):
 
 async def get_settings_kb(user_id):
     u = await Database.get_user(user_id)
-    # 0=toxic, 4=spam, 5=lang, 6=morning
-    is_toxic, spam_mode, lang, morning = u[0], u[4], u[5], u[6]
+    is_toxic, spam_mode, lang, morning = u.is_toxic, u.spam_mode, u.language, u.morning_briefing
     
     kb = [
         [InlineKeyboardButton(text=t("mode_toxic", lang) if is_toxic else t("mode_nice", lang), callback_data="toggle_toxic")],
@@ -68,6 +72,30 @@ async def get_settings_kb(user_id):
     ]
     return InlineKeyboardMarkup(inline_keyboard=kb)
 
+def format_retention(report):
+    rows = ", ".join(f"{k}: {v}" for k, v in report.items() if k not in ("bytes", "at"))
+    return f"{rows} | звільнено {report['bytes'] / 1024:.0f} KB"
+
+def format_briefing(report):
+    stages = ", ".join(f"{k} {v:.2f}s" for k, v in report["stages"].items())
+    return f"{report['users']} за {report['total']:.1f}s ({stages})"
+
+def format_broadcast(job):
+    done = job["sent"] + job["failed"] + job["blocked"]
+    elapsed = (job["finished_at"] or time.time()) - job["created_at"]
+    rate = done / elapsed if elapsed > 0 else 0
+    msg = (f"📢 Розсилка #{job['id']}: *{job['status']}*\n"
+           f"✅ {job['sent']} | ❌ {job['failed']} | 🚫 {job['blocked']} з {job['total']}\n"
+           f"📬 У черзі: {job['queued']} | {rate:.1f} повід./с")
+    if job["status"] == "running" and rate > 0:
+        msg += f" | ~{max(0, job['total'] - done) / rate / 60:.0f} хв"
+    return msg
+
+def job_arg(m: types.Message):
+    """Необов'язковий id розсилки з тексту команди (без нього - остання)"""
+    args = m.text.split()
+    return int(args[1]) if len(args) > 1 and args[1].isdigit() else None
+
 def get_time_kb():
     buttons = [
         [InlineKeyboardButton(text="09:00", callback_data="time_09:00"), 
@@ -86,7 +114,25 @@ async def admin_stats(m: types.Message):
     if m.from_user.id not in ADMIN_IDS: return
     u, r = await Database.get_stats()
     db_size = os.path.getsize("jarvis_db.db") / (1024 * 1024) if os.path.exists("jarvis_db.db") else 0
-    await m.answer(f"📊 **Статус:**\n👥 Юзерів: `{u}`\n⏳ Активних планів: `{r}`\n💾 База: `{db_size:.2f} MB`", parse_mode="Markdown")
+    cache = Database.cache_stats()
+    sends = sender.stats()
+    w = weather.stats()
+    g = groq.stats()
+    queue = await outbox.stats()
+    lanes = ", ".join(f"{name} {n} ({lag:.0f}s)" for name, (n, lag) in queue["lanes"].items()) or "порожньо"
+    await m.answer(f"📊 **Статус:**\n👥 Юзерів: `{u}`\n⏳ Активних планів: `{r}`\n💾 База: `{db_size:.2f} MB`\n"
+                   f"🧠 Кеш профілів: `{cache['size']}` | hit `{cache['hits']}` / miss `{cache['misses']}` ({cache['hit_rate']:.0%})"
+                   f"\n📨 Відправлено: `{sends['sent']}` | помилок `{sends['failed']}` | повторів `{sends['retried']}`"
+                   f"\n📬 Черга: {lanes} | dead `{queue['dead']}`"
+                   f"\n🌦 Погода: клітинок `{w['cells']}` | запитів `{w['requests']}` | hit {w['hit_rate']:.0%}"
+                   f"\n⚡️ Без LLM: `{intents.stats['hits']}` з `{intents.stats['checked']}`"
+                   f" ({intents.stats['hits'] / max(1, intents.stats['checked']):.0%})"
+                   f"\n🤖 Groq: запитів `{g['requests']}` | повторів `{g['retries']}` | 429 `{g['throttled']}` | помилок `{g['failed']}`"
+                   f" | ліміт `{g['limit']}` | запобіжник `{g['state']}`"
+                   f"\n🎬 YouTube: з кешу `{video_cache_stats['hits']}` | спільних `{video_cache_stats['joined']}` | LLM `{video_cache_stats['misses']}`"
+                   + (f"\n🧹 Очищення {retention.last_report['at']}: {format_retention(retention.last_report)}" if retention.last_report else "")
+                   + (f"\n🌅 Бріфінг {tasks.last_briefing['at']}: {format_briefing(tasks.last_briefing)}" if tasks.last_briefing else ""),
+                   parse_mode="Markdown")
 
 @router.message(Command("users"))
 async def admin_users_list(m: types.Message):
@@ -124,27 +170,67 @@ async def admin_broadcast(m: types.Message):
     if m.from_user.id not in ADMIN_IDS: return
     text = m.text.replace("/broadcast", "").strip()
     if not text: return await m.answer("⚠️ Текст?")
-    users = await Database.get_all_users()
-    count = 0
-    await m.answer("🚀 Починаю розсилку...")
-    for u in users:
-        try:
-            await m.bot.send_message(u[0], f"📢 <b>Оголошення:</b>\n\n{text}", parse_mode="HTML")
-            count += 1
-            await asyncio.sleep(0.05)
-        except: continue
-    await m.answer(f"✅ Успішно: {count}")
+    job_id = await broadcaster.create(f"📢 <b>Оголошення:</b>\n\n{text}")
+    await m.answer(format_broadcast(await broadcaster.get(job_id)) + "\n\n/broadcast\\_status /broadcast\\_pause /broadcast\\_cancel",
+                   parse_mode="Markdown")
+
+@router.message(Command("broadcast_status"))
+async def admin_broadcast_status(m: types.Message):
+    if m.from_user.id not in ADMIN_IDS: return
+    job = await broadcaster.get(job_arg(m))
+    await m.answer(format_broadcast(job) if job else "Розсилок ще не було.", parse_mode="Markdown")
+
+@router.message(Command("broadcast_cancel", "broadcast_pause", "broadcast_resume"))
+async def admin_broadcast_control(m: types.Message):
+    if m.from_user.id not in ADMIN_IDS: return
+    action = m.text.split()[0].split("@")[0].removeprefix("/broadcast_")
+    job = await getattr(broadcaster, action)(job_arg(m))
+    await m.answer(format_broadcast(job) if job else "Розсилку не знайдено.", parse_mode="Markdown")
+
+@router.my_chat_member(F.chat.type == "private")
+async def bot_blocked(event: types.ChatMemberUpdated):
+    """Користувач заблокував бота (kicked) або розблокував - розсилки його пропускають / знову включають"""
+    await Database.set_blocked([event.from_user.id], event.new_chat_member.status == "kicked")
 
 @router.message(Command("backup"))
 async def cmd_backup(m: types.Message):
     if m.from_user.id not in ADMIN_IDS: return
-    backup_path = await create_backup()
+    backup_path = await create_snapshot()
     if backup_path:
-        await m.answer_document(FSInputFile(backup_path), caption=f"📦 Бекап від {datetime.now()}")
-        os.remove(backup_path)
+        await m.answer_document(FSInputFile(backup_path), caption=f"📦 Бекап від {datetime.now()}\nsha256: {read_checksum(backup_path)}")
     else:
         await m.answer("❌ Помилка створення бекапу.")
 
+@router.message(Command("restore"))
+async def cmd_restore(m: types.Message):
+    """/restore - список знімків; /restore <файл> - відновити; або reply на документ з бекапом"""
+    if m.from_user.id not in ADMIN_IDS: return
+    args = m.text.split(maxsplit=1)
+    doc = m.reply_to_message.document if m.reply_to_message else None
+    checksum = None
+    if doc:
+        path = os.path.join(BACKUP_DIR, os.path.basename(doc.file_name or "upload.db.gz"))
+        os.makedirs(BACKUP_DIR, exist_ok=True)
+        file = await m.bot.get_file(doc.file_id)
+        await m.bot.download_file(file.file_path, path)
+        # Контрольна сума лежить у підписі повідомлення з бекапом
+        match = re.search(r"sha256: ([0-9a-f]{64})", m.reply_to_message.caption or "")
+        checksum = match.group(1) if match else None
+    elif len(args) > 1:
+        path = os.path.join(BACKUP_DIR, os.path.basename(args[1].strip()))
+    else:
+        names = [os.path.basename(p) for p in list_snapshots()]
+        return await m.answer("📦 Знімки:\n" + ("\n".join(f"`{n}`" for n in names) or "—") + "\n\n`/restore <файл>`", parse_mode="Markdown")
+
+    if not os.path.exists(path):
+        return await m.answer("❌ Файл не знайдено.")
+    await m.answer("⏳ Перевіряю знімок...")
+    try:
+        await restore_snapshot(path, checksum)
+    except Exception as e:
+        return await m.answer(f"❌ Знімок не пройшов перевірку: {e}")
+    await m.answer("✅ Базу відновлено.")
+
 @router.message(Command("restart"))
 async def cmd_restart(m: types.Message):
     if m.from_user.id not in ADMIN_IDS: return
@@ -154,8 +240,8 @@ async def cmd_restart(m: types.Message):
 @router.message(Command("db_clean"))
 async def manual_clean(m: types.Message):
     if m.from_user.id not in ADMIN_IDS: return
-    await Database.clean_old_data(days=0)
-    await m.answer("🧹 База очищена.")
+    report = await retention.run_retention(reminder_days=0)
+    await m.answer(f"🧹 База очищена.\n{format_retention(report)}")
 
 # --- БАН СИСТЕМА ---
 
@@ -192,7 +278,7 @@ async def admin_reply_handler(m: types.Message):
         if user_id_match:
             user_id = int(user_id_match.group(1))
             u = await Database.get_user(user_id)
-            lang = u[5]
+            lang = u.language
             
             await m.bot.send_message(user_id, f"{t('got_admin_reply', lang)}\n{m.text}", parse_mode="HTML")
             await m.answer("✅ Відповідь доставлена.")
@@ -204,21 +290,14 @@ async def cmd_report(m: types.Message):
     if await is_banned(m.from_user.id): return
     text = m.text.replace("/report", "").strip()
     u = await Database.get_user(m.from_user.id)
-    lang = u[5]
+    lang = u.language
     
     if not text: return await m.answer("✍️ ...")
     
-    sent_count = 0
-    for admin_id in ADMIN_IDS:
-        try: 
-            await m.bot.send_message(
-                admin_id, 
-                f"📩 REPORT {m.from_user.id}:\nUser: @{m.from_user.username}\n\n{text}"
-            )
-            sent_count += 1
-        except: pass
+    report = f"📩 REPORT {m.from_user.id}:\nUser: @{m.from_user.username}\n\n{text}"
+    await outbox.put_many([(admin_id, report, {}) for admin_id in ADMIN_IDS], INTERACTIVE)
     
-    if sent_count > 0:
+    if ADMIN_IDS:
         await m.answer("✅", reply_markup=await get_kb(m.from_user.id))
 
 # --- НАЛАШТУВАННЯ (SETTINGS) ---
@@ -228,30 +307,30 @@ async def cmd_report(m: types.Message):
 async def open_settings(m: types.Message):
     if await is_banned(m.from_user.id): return
     u = await Database.get_user(m.from_user.id)
-    await m.answer(t("settings_title", u[5]), reply_markup=await get_settings_kb(m.from_user.id), parse_mode="HTML")
+    await m.answer(t("settings_title", u.language), reply_markup=await get_settings_kb(m.from_user.id), parse_mode="HTML")
 
 @router.callback_query(F.data == "toggle_toxic")
 async def settings_toggle_toxic(call: types.CallbackQuery):
     u = await Database.get_user(call.from_user.id)
-    await Database.update_user(call.from_user.id, is_toxic=not u[0])
+    await Database.update_user(call.from_user.id, is_toxic=not u.is_toxic)
     await call.message.edit_reply_markup(reply_markup=await get_settings_kb(call.from_user.id))
 
 @router.callback_query(F.data == "toggle_spam")
 async def settings_toggle_spam(call: types.CallbackQuery):
     u = await Database.get_user(call.from_user.id)
-    await Database.update_user(call.from_user.id, spam_mode=not u[4])
+    await Database.update_user(call.from_user.id, spam_mode=not u.spam_mode)
     await call.message.edit_reply_markup(reply_markup=await get_settings_kb(call.from_user.id))
 
 @router.callback_query(F.data == "toggle_morning")
 async def settings_toggle_morning(call: types.CallbackQuery):
     u = await Database.get_user(call.from_user.id)
-    await Database.update_user(call.from_user.id, morning_briefing=not u[6])
+    await Database.update_user(call.from_user.id, morning_briefing=not u.morning_briefing)
     await call.message.edit_reply_markup(reply_markup=await get_settings_kb(call.from_user.id))
 
 @router.callback_query(F.data == "toggle_lang")
 async def settings_toggle_lang(call: types.CallbackQuery):
     u = await Database.get_user(call.from_user.id)
-    new_lang = "en" if u[5] == "uk" else "uk"
+    new_lang = "en" if u.language == "uk" else "uk"
     await Database.update_user(call.from_user.id, language=new_lang)
     await call.message.delete()
     # Оновлюємо клавіатуру на нову мову
@@ -285,13 +364,13 @@ async def set_language_start(call: types.CallbackQuery):
 async def youtube_handler(m: types.Message):
     if await is_banned(m.from_user.id): return
     u = await Database.get_user(m.from_user.id)
-    lang = u[5]
+    lang = u.language
     
     video_id = get_youtube_id(m.text)
     if not video_id: return
     
     status_msg = await m.reply(t("yt_processing", lang))
-    summary = await groq_summarize_video(video_id, lang)
+    summary = await get_video_summary(video_id, lang)
     
     await status_msg.delete()
     if summary:
@@ -308,7 +387,7 @@ async def add_note_handler(m: types.Message):
     text = m.text.replace("/note", "").strip()
     if not text: return
     await Database.add_note(m.from_user.id, text)
-    await m.answer(t("saved_note", u[5]))
+    await m.answer(t("saved_note", u.language))
 
 @router.message(Command("search"))
 async def search_notes_handler(m: types.Message):
@@ -317,8 +396,9 @@ async def search_notes_handler(m: types.Message):
     query = m.text.replace("/search", "").strip()
     if not query: return
     res = await Database.search_notes(m.from_user.id, query)
-    if not res: return await m.answer(t("search_empty", u[5]))
-    msg = "<b>🔎 Found:</b>\n\n" + "\n".join([f"🔹 {n[0]}" for n in res])
+    if not res: return await m.answer(t("search_empty", u.language))
+    snippets = [html.escape(n[0]).replace(HIGHLIGHT_START, "<b>").replace(HIGHLIGHT_END, "</b>") for n in res]
+    msg = "<b>🔎 Found:</b>\n\n" + "\n".join([f"🔹 {n}" for n in snippets])
     await m.answer(msg, parse_mode="HTML")
 
 @router.message(F.text.in_({"📅 Створити нагадування", "📅 New Reminder"}))
@@ -355,7 +435,7 @@ async def process_time_text(m: types.Message, state: FSMContext):
     clean_time = normalize_time(m.text)
     u = await Database.get_user(m.from_user.id)
     if not clean_time:
-        return await m.answer(t("error_format", u[5]))
+        return await m.answer(t("error_format", u.language))
     await finalize_reminder(m, clean_time, state, m.from_user.id)
 
 async def finalize_reminder(message: types.Message, time_str: str, state: FSMContext, user_id: int):
@@ -363,7 +443,7 @@ async def finalize_reminder(message: types.Message, time_str: str, state: FSMCon
     u = await Database.get_user(user_id)
     full_datetime = f"{data['remind_date']} {time_str}:00"
     await Database.add_reminder(user_id, message.chat.id, data['remind_text'], full_datetime, recurrence=None)
-    await message.answer(f"{t('rem_created', u[5])}\n📌 {data['remind_text']}\n⏰ {full_datetime}", parse_mode="HTML", reply_markup=await get_kb(user_id))
+    await message.answer(f"{t('rem_created', u.language)}\n📌 {data['remind_text']}\n⏰ {full_datetime}", parse_mode="HTML", reply_markup=await get_kb(user_id))
     await state.clear()
 
 @router.message(F.text.in_({"📋 Список планів", "📋 My Plans"}))
@@ -371,10 +451,10 @@ async def show_list(m: types.Message):
     if await is_banned(m.from_user.id): return
     u = await Database.get_user(m.from_user.id)
     rows = await Database.get_active_reminders(m.from_user.id)
-    if not rows: return await m.answer(t("rem_list_empty", u[5]))
+    if not rows: return await m.answer(t("rem_list_empty", u.language))
     
-    today_str = datetime.now().strftime("%Y-%m-%d")
-    await m.answer(f"📋 **{t('btn_list_rem', u[5])}:**", parse_mode="Markdown")
+    today_str = local_now(u.timezone).strftime("%Y-%m-%d")
+    await m.answer(f"📋 **{t('btn_list_rem', u.language)}:**", parse_mode="Markdown")
     
     for r in rows:
         rid, r_time, r_text = r
@@ -388,10 +468,17 @@ async def show_list(m: types.Message):
         ]])
         await m.answer(f"📝 *{r_text}*\n⏰ {date_info}", parse_mode="Markdown", reply_markup=kb)
 
+async def owns_reminder(rid, user_id):
+    """Кнопки зі старими id (після решардингу) не мають чіпати чужі нагадування"""
+    rem = await Database.get_reminder(rid)
+    return rem is not None and rem[0] == user_id
+
 # --- РЕДАГУВАННЯ (загальна частина) ---
 @router.callback_query(F.data.startswith("edit_"))
 async def edit_start(call: types.CallbackQuery, state: FSMContext):
     rid = call.data.split("_")[1]
+    if not await owns_reminder(rid, call.from_user.id):
+        return await call.answer("❌")
     await state.update_data(edit_id=rid)
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="📝 Text", callback_data="edopt_text")],
@@ -420,6 +507,8 @@ async def edit_option_handler(call: types.CallbackQuery, state: FSMContext):
 @router.message(StateFilter(EditFSM.editing_text))
 async def save_new_text(m: types.Message, state: FSMContext):
     data = await state.get_data()
+    if not await owns_reminder(data['edit_id'], m.from_user.id):
+        return await state.clear()
     await Database.update_reminder_field(data['edit_id'], "remind_text", m.text)
     await m.answer("✅ Updated!", reply_markup=await get_kb(m.from_user.id))
     await state.clear()
@@ -436,29 +525,54 @@ async def edit_date_process(callback: types.CallbackQuery, callback_data: dict,
 @router.callback_query(F.data.startswith("time_"), StateFilter(EditFSM.editing_time))
 async def edit_time_btn(callback: types.CallbackQuery, state: FSMContext):
     time_val = callback.data.split("_")[1]
-    await save_new_time(callback.message, time_val, state)
+    await save_new_time(callback.message, time_val, state, callback.from_user.id)
 
 @router.message(StateFilter(EditFSM.editing_time))
 async def edit_time_text(m: types.Message, state: FSMContext):
     clean_time = normalize_time(m.text)
     if not clean_time:
         return await m.answer("⚠️ Format error.")
-    await save_new_time(m, clean_time, state)
+    await save_new_time(m, clean_time, state, m.from_user.id)
 
-async def save_new_time(message, time_val, state):
+async def save_new_time(message, time_val, state, user_id):
     data = await state.get_data()
+    if not await owns_reminder(data['edit_id'], user_id):
+        return await state.clear()
     full_dt = f"{data['new_date']} {time_val}:00"
-    await Database.update_reminder_field(data['edit_id'], "remind_time", full_dt)
+    # Новий час - нагадування знову чекає, лічильник спаму з нуля
+    await Database.update_reminders([(int(data['edit_id']), {"remind_time": full_dt, "status": "pending", "nag_count": 0,
+                                                             "next_nag_at": None, "last_message_id": None})])
     await message.answer(f"✅ {full_dt}", reply_markup=await get_kb(message.chat.id))
     await state.clear()
 
 @router.callback_query(F.data.startswith("del_"))
 async def del_rem(call: types.CallbackQuery):
     rid = call.data.split("_")[1]
-    await Database.delete_reminder(rid)
+    if not await Database.delete_reminder(rid, call.from_user.id):
+        return await call.answer("❌")
     await call.message.delete()
     await call.answer("Deleted")
 
+@router.callback_query(F.data.startswith("confirm_"))
+async def confirm_rem(call: types.CallbackQuery):
+    """Кнопка ✅ Done під спам-нагадуванням: зупиняє повтори"""
+    rid = int(call.data.split("_")[1])
+    rem = await Database.get_reminder(rid)
+    if not rem or rem[0] != call.from_user.id:
+        return await call.answer()
+    user_id, chat_id, text, r_time, recurrence, status, _ = rem
+    if status in ("pending", "spamming"):
+        u = await Database.get_user(user_id)
+        try:
+            fields = {"status": "pending", "remind_time": next_time(recurrence, r_time, u.timezone)} if recurrence else {"status": "done"}
+        except ValueError:
+            fields = {"status": "done"}
+        fields.update(nag_count=0, next_nag_at=None, last_message_id=None)
+        await Database.update_reminders([(rid, fields)])
+    try: await call.message.edit_text(f"✅ {html.escape(text)}", parse_mode="HTML")
+    except Exception: pass
+    await call.answer("✅")
+
 # --- ІНШІ ХЕНДЛЕРИ (ГОЛОС, ФОТО, ТЕКСТ) ---
 
 @router.message(F.voice)
@@ -468,8 +582,10 @@ async def voice_handler(m: types.Message):
     path = f"voice_{m.from_user.id}.ogg"
     await m.bot.download_file(file.file_path, path)
     u = await Database.get_user(m.from_user.id)
-    text = await groq_transcribe(path, u[5])
+    text = await groq_transcribe(path, u.language)
     if os.path.exists(path): os.remove(path)
+    if not text:
+        return await m.reply(t("ai_busy", u.language))
     await m.reply(f"🗣 {text}")
     await process_smart(m, text)
 
@@ -480,15 +596,36 @@ async def photo_handler(m: types.Message):
     path = f"photo_{m.from_user.id}.jpg"
     await m.bot.download_file(file.file_path, path)
     u = await Database.get_user(m.from_user.id)
-    ans = await groq_analyze_image(m.caption or "Describe", path, u[0], u[5])
+    ans = await groq_analyze_image(m.caption or "Describe", path, u.is_toxic, u.language)
     if os.path.exists(path): os.remove(path)
     await m.reply(ans)
 
 @router.message(F.location)
 async def location_handler(m: types.Message):
     await Database.update_user(m.from_user.id, lat=m.location.latitude, lon=m.location.longitude)
+    # Пояс беремо з тієї ж відповіді Open-Meteo (timezone=auto), якщо користувач не задав його сам
+    u = await Database.get_user(m.from_user.id)
+    w = await weather.get(m.location.latitude, m.location.longitude)
+    tz_name = w and w.get("timezone")
+    if not u.timezone and tz_name in pytz.all_timezones_set:
+        await Database.set_timezone(m.from_user.id, tz_name)
+        return await m.answer(f"📍 OK. {t('tz_set', u.language)} {tz_name}")
     await m.answer("📍 OK.")
 
+@router.message(Command("timezone"))
+async def cmd_timezone(m: types.Message):
+    """/timezone - поточний пояс; /timezone Europe/Berlin - змінити"""
+    if await is_banned(m.from_user.id): return
+    u = await Database.get_user(m.from_user.id)
+    args = m.text.split(maxsplit=1)
+    if len(args) < 2:
+        return await m.answer(f"{t('tz_current', u.language)} {user_tz(u.timezone).zone}\n{t('tz_hint', u.language)}")
+    tz_name = args[1].strip()
+    if tz_name not in pytz.all_timezones_set:
+        return await m.answer(f"{t('tz_unknown', u.language)}\n{t('tz_hint', u.language)}")
+    await Database.set_timezone(m.from_user.id, tz_name)
+    await m.answer(f"{t('tz_set', u.language)} {tz_name}")
+
 @router.message(F.text)
 async def text_handler(m: types.Message):
     ignored = ["📋 Список планів", "📋 My Plans", "📍 Погода", "📍 Weather", 
@@ -503,23 +640,47 @@ async def text_handler(m: types.Message):
 
 async def process_smart(m, text):
     u = await Database.get_user(m.from_user.id)
-    # u[0]=toxic, u[1]=lat, u[2]=lon, u[5]=lang
-    res = await groq_text_brain(text, m.from_user.id, u[0], u[1], u[2], u[5], bool(m.forward_origin))
+    live = None
+    # Прості "нагадай о 18:00 ..." / "запиши: ..." розбираються локально, без LLM (пересланий текст - не команда)
+    res = None if m.forward_origin else match_intent(text, u.language, u.timezone)
+    if res is None and STREAM_REPLIES:
+        # Заглушка одразу, далі вона дописується по мірі генерації "reply"
+        live = LiveMessage(m.bot, m.chat.id)
+        await live.start("💭")
+        res = await groq_text_brain_stream(text, m.from_user.id, u.is_toxic, u.lat, u.lon, u.language,
+                                           bool(m.forward_origin), u.timezone, on_reply=live.update)
+        if not res:
+            await live.discard()
+    elif res is None:
+        res = await groq_text_brain(text, m.from_user.id, u.is_toxic, u.lat, u.lon, u.language, bool(m.forward_origin), u.timezone)
     
     if res:
         reply = res.get('reply', '...')
-        await Database.add_to_context(m.from_user.id, "user", m.text)
+        await Database.add_to_context(m.from_user.id, "user", text)
         await Database.add_to_context(m.from_user.id, "assistant", reply)
+        schedule_summary(m.from_user.id)
         
         if res.get('save_note'):
             await Database.add_note(m.from_user.id, res['save_note'])
-            reply += f"\n\n{t('saved_note', u[5])}"
+            reply += f"\n\n{t('saved_note', u.language)}"
 
         if res.get('is_reminder') and res.get('time'):
-            await Database.add_reminder(m.from_user.id, m.chat.id, res['task'], res['time'], res['recurrence'])
-            reply += f"\n⏰ {res['time']}"
-
-        await m.answer(reply)
+            # LLM інколи віддає "2026-10-17 18:00" чи ISO з "T" - приводимо до формату бази
+            remind_time = normalize_datetime(res['time'])
+            if remind_time:
+                recurrence = normalize_rule(res.get('recurrence'), remind_time)
+                await Database.add_reminder(m.from_user.id, m.chat.id, res.get('task') or text, remind_time, recurrence)
+                reply += f"\n⏰ {remind_time}"
+            else:
+                logger.warning(f"Bad reminder time from LLM: {res['time']!r}")
+                reply += f"\n{t('error_format', u.language)}"
+
+        if live:
+            await live.finish(reply)
+        else:
+            await m.answer(reply)
+    else:
+        await m.answer(t("ai_busy", u.language))
 
 @router.error()
 async def error_handler(event: ErrorEvent):
@@ -0,0 +1,34 @@
+"""Спільний HTTP-клієнт для Groq і Open-Meteo.
+
+Одна aiohttp.ClientSession на весь бот: з'єднання з keep-alive перевикористовуються
+(без нового TCP+TLS рукостискання на кожен запит), кількість з'єднань обмежена
+загалом і на хост, DNS кешується. Створюється в bot.main(), закривається при зупинці.
+Таймаути за замовчуванням - HTTP_CONNECT_TIMEOUT на з'єднання і GROQ_TIMEOUT на весь запит,
+окремі виклики можуть передати свій timeout.
+"""
+import aiohttp
+from config import HTTP_LIMIT, HTTP_LIMIT_PER_HOST, HTTP_DNS_TTL, HTTP_KEEPALIVE, HTTP_CONNECT_TIMEOUT, GROQ_TIMEOUT
+
+class HttpClient:
+    def __init__(self):
+        self._session = None
+
+    async def start(self):
+        return self.session
+
+    @property
+    def session(self):
+        # Якщо start() ще не викликали (скрипти, міграції) - створюється при першому запиті
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=HTTP_LIMIT, limit_per_host=HTTP_LIMIT_PER_HOST,
+                                             ttl_dns_cache=HTTP_DNS_TTL, keepalive_timeout=HTTP_KEEPALIVE)
+            timeout = aiohttp.ClientTimeout(total=GROQ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    async def close(self):
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+http = HttpClient()
@@ -0,0 +1,179 @@
+"""Локальний розбір простих команд без LLM.
+
+"нагадай о 18:00 купити хліб", "remind me tomorrow at 9pm to call mom", "нагадай через 20 хв
+вимкнути плиту", "щодня о 8:00 нагадуй пити воду", "запиши: ...". Правила - скомпільовані
+регулярки для uk/en, час розбирається normalize_time. Якщо у фразі щось лишилось
+незрозумілим (немає години, два різні часи, зайві числа в тексті завдання) - повертається
+None, і повідомлення, як і раніше, йде в LLM.
+Результат має ту саму форму, що й відповідь groq_text_brain.
+"""
+import re
+from datetime import timedelta
+from utils import normalize_time, local_now, TIME_FORMAT
+from locales import t
+
+# Лічильники для /stats: скільки повідомлень перевірено і скільки розібрано без LLM
+stats = {"checked": 0, "hits": 0}
+
+FLAGS = re.IGNORECASE | re.DOTALL
+APOS = "['’ʼ]?"
+
+NOTE = re.compile(rf"^\s*(?:запиши|занотуй|запам{APOS}ятай|нотатка|note|save|write down)\s*[:\-–—]\s*(?P<text>\S.*)$", FLAGS)
+REMIND = re.compile(r"(?<!\w)(?:нагадай(?:те)?|нагадуй(?:те)?|remind)(?:\s+(?:мені|me))?(?!\w)", FLAGS)
+
+# Форми днів тижня (знахідний / родовий / множина "по понеділках") для uk і en
+WEEKDAY_NAMES = [
+    r"понеділ(?:ок|ка|ках)|mondays?",
+    r"вівтор(?:ок|ка|ках)|tuesdays?",
+    r"серед(?:у|а|и|ах)|wednesdays?",
+    r"четвер(?:га|гах)?|thursdays?",
+    rf"п{APOS}ятниц(?:ю|я|і|ях)|fridays?",
+    r"субот(?:у|а|и|ах)|saturdays?",
+    r"неділ(?:ю|я|і|ях)|sundays?",
+]
+WEEKDAY_RES = [re.compile(rf"^(?:{name})$", FLAGS) for name in WEEKDAY_NAMES]
+WEEKDAY = "|".join(WEEKDAY_NAMES)
+PLURAL = rf"(?=\w*(?:ах|ях|s)(?!\w))(?:{WEEKDAY})"
+DAYS = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+
+# (назва, регулярка). Кожне правило вирізає свій фрагмент, з решти складається завдання
+RULES = [
+    ("relative", re.compile(r"(?<!\w)(?:через|in)\s+(?:(?P<n>\d+)\s*)?(?:an?\s+|одну\s+|один\s+)?"
+                            r"(?P<unit>хвилин[уи]?|хв|min(?:ute)?s?|годин[уи]?|год|hours?|hrs?|h|днів|дні|день|days?)(?!\w)", FLAGS)),
+    ("repeat_weekday", re.compile(rf"(?<!\w)(?:(?:кож(?:ен|ного|ну)|щ[оа]|every)\s*(?P<wd>{WEEKDAY})|(?:по|on)\s+(?P<wd2>{PLURAL}))(?!\w)", FLAGS)),
+    ("repeat", re.compile(r"(?<!\w)(?P<rule>щодня|щоденно|кожен день|кожного дня|every day|daily|щотижня|every week|weekly|"
+                          r"щомісяця|every month|monthly|по буднях|у будні|в будні|weekdays|every weekday)(?!\w)", FLAGS)),
+    ("day", re.compile(r"(?<!\w)(?P<day>післязавтра|day after tomorrow|сьогодні|today|завтра|tomorrow)(?!\w)", FLAGS)),
+    ("weekday", re.compile(rf"(?<!\w)(?:(?:в|у|во|on)\s+)?(?P<wd>{WEEKDAY})(?!\w)", FLAGS)),
+    ("clock", re.compile(r"(?<!\w)(?:(?:о|об|на|в|у|at|@)\s*)?(?P<clock>\d{1,2}[:.]\d{2})"
+                         r"(?:\s*(?P<ampm>am|pm|ранку|вечора|дня|ночі))?(?!\w)", FLAGS)),
+    ("hour", re.compile(r"(?<!\w)(?:(?:о|об|at|@)\s*(?P<hour>\d{1,2})|(?P<hour2>\d{1,2})\s*(?=am|pm))"
+                        r"(?:\s*(?P<ampm>am|pm|ранку|вечора|дня|ночі))?(?!\w)", FLAGS)),
+]
+
+REPEAT_RULES = {
+    "щодня": "daily", "щоденно": "daily", "кожен день": "daily", "кожного дня": "daily", "every day": "daily", "daily": "daily",
+    "щотижня": "weekly", "every week": "weekly", "weekly": "weekly",
+    "щомісяця": "monthly", "every month": "monthly", "monthly": "monthly",
+    "по буднях": "weekdays", "у будні": "weekdays", "в будні": "weekdays", "weekdays": "weekdays", "every weekday": "weekdays",
+}
+UNITS = [(("хв", "min"), 60), (("год", "hour", "hr", "h"), 3600), (("дн", "ден", "day"), 86400)]
+DAY_OFFSETS = {"сьогодні": 0, "today": 0, "завтра": 1, "tomorrow": 1, "післязавтра": 2, "day after tomorrow": 2}
+# Заперечення ("не нагадуй", "don't remind") - локально не розбираємо
+NEGATION = re.compile(r"(?<!\w)(?:не|ні|не треба|don't|dont|do not|never|no need)(?!\w)", FLAGS)
+# Місце вирізаного фрагмента; прийменник поруч з ним - нерозпізнана частина часу ("at 9:00 on weekdays")
+CUT = "\x00"
+DANGLING_WORDS = r"(?:on|at|in|by|every|each|from|until|о|об|в|у|во|на|по|до|з|через|кожен|кожного|кожну|щодо)"
+DANGLING = re.compile(rf"(?<!\w){DANGLING_WORDS}\s*{CUT}|{CUT}\s*{DANGLING_WORDS}(?!\w)", FLAGS)
+# Сполучники між тригером/часом і завданням: "нагадай о 9 що ...", "remind me at 9 to ..."
+FILLER = re.compile(r"^(?:[\s,.:;!\-–—]|що\b|щоб\b|про\b|to\b|about\b|that\b)+|[\s,.:;\-–—]+$", FLAGS)
+
+def _weekday(match):
+    groups = match.groupdict()
+    name = groups.get("wd") or groups.get("wd2")
+    return next(i for i, day in enumerate(WEEKDAY_RES) if day.match(name))
+
+def _clock(match):
+    groups = match.groupdict()
+    if groups.get("clock"):
+        value = normalize_time(groups["clock"])
+    else:
+        hour = groups.get("hour") or groups.get("hour2")
+        value = normalize_time(f"{hour}:00") if hour else None
+    if value is None:
+        return None  # "о 25:00", "о 9.75" - нехай розбирається LLM
+    h, m = map(int, value.split(":"))
+    ampm = (match.group("ampm") or "").lower()
+    if ampm in ("pm", "вечора", "дня") and h < 12:
+        h += 12
+    elif ampm in ("am", "ранку", "ночі") and h == 12:
+        h = 0
+    return h, m
+
+def _parse_reminder(text, now):
+    trigger = REMIND.search(text)
+    if not trigger or NEGATION.search(text):
+        return None
+    rest = text[:trigger.start()] + CUT + text[trigger.end():]
+    found = {}
+    for name, rule in RULES:
+        matches = list(rule.finditer(rest))
+        if len(matches) > 1:
+            return None  # два часи/дні - нехай розбирається LLM
+        if matches:
+            found[name] = matches[0]
+            rest = rest[:matches[0].start()] + CUT + rest[matches[0].end():]
+
+    if DANGLING.search(rest):
+        return None
+    task = FILLER.sub("", rest.replace(CUT, " ").strip())
+    task = re.sub(r"\s{2,}", " ", task)
+    # Число в завданні - ймовірно нерозпізнаний час ("нагадай 5 числа ...")
+    if len(task) < 2 or re.search(r"\d", task):
+        return None
+
+    recurrence = None
+    if "repeat" in found:
+        recurrence = REPEAT_RULES.get(found["repeat"].group("rule").lower())
+    if "repeat_weekday" in found:
+        if recurrence:
+            return None
+        recurrence = f"FREQ=WEEKLY;BYDAY={DAYS[_weekday(found['repeat_weekday'])]}"
+
+    if "relative" in found:
+        if len(found) > 1:
+            return None
+        match = found["relative"]
+        unit = match.group("unit").lower()
+        seconds = next(s for prefixes, s in UNITS if unit.startswith(prefixes))
+        when = now + timedelta(seconds=int(match.group("n") or 1) * seconds)
+        return task, when.replace(second=0).strftime(TIME_FORMAT), None
+
+    clock = found.get("clock") or found.get("hour")
+    if clock is None or ("clock" in found and "hour" in found):
+        return None
+    hm = _clock(clock)
+    if hm is None:
+        return None
+    when = now.replace(hour=hm[0], minute=hm[1], second=0, microsecond=0)
+
+    weekday = found.get("weekday") or found.get("repeat_weekday")
+    if "weekday" in found and recurrence:
+        return None
+    if "day" in found:
+        if weekday or recurrence:
+            return None
+        when += timedelta(days=DAY_OFFSETS[found["day"].group("day").lower()])
+        if when <= now:
+            return None  # "сьогодні о 8", а вже 10 - незрозуміло, чого хочуть
+    elif weekday:
+        days = (_weekday(weekday) - now.weekday()) % 7
+        if days == 0 and when <= now:
+            days = 7
+        when += timedelta(days=days)
+    elif when <= now:
+        when += timedelta(days=1)
+    if recurrence == "weekdays":
+        # Перше спрацювання - найближчий будній день
+        while when.weekday() >= 5:
+            when += timedelta(days=1)
+    return task, when.strftime(TIME_FORMAT), recurrence
+
+def match_intent(text, lang="uk", tz_name=None):
+    """Проста команда -> результат у форматі groq_text_brain; None - потрібен LLM"""
+    stats["checked"] += 1
+    note = NOTE.match(text)
+    if note:
+        stats["hits"] += 1
+        content = note.group("text").strip()
+        return {"is_reminder": False, "save_note": content, "reply": f"📝 {content[:100]}"}
+
+    parsed = _parse_reminder(text, local_now(tz_name))
+    if parsed is None:
+        return None
+    task, when, recurrence = parsed
+    stats["hits"] += 1
+    reply = t("fast_reminder", lang) + task
+    if recurrence:
+        reply += f"\n{t('fast_repeat', lang)}{recurrence}"
+    return {"is_reminder": True, "task": task, "time": when, "recurrence": recurrence, "save_note": None, "reply": reply}
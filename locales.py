@@ -36,7 +36,14 @@ TEXTS = {
         "ai_persona_nice": "ТИ - МИЛА НЯШКА (ЕМОДЗІ, ДОБРОТА). Відповідай турботливо.",
         "banned": "🚫 <b>Ви заблоковані адміністратором.</b>",
         "user_banned": "🔨 Користувача забанено.",
-        "user_unbanned": "🕊 Користувача розбанено."
+        "user_unbanned": "🕊 Користувача розбанено.",
+        "tz_current": "🕰 Твій часовий пояс:",
+        "tz_set": "🕰 Часовий пояс:",
+        "tz_unknown": "⚠️ Не знаю такого поясу.",
+        "tz_hint": "Приклад: /timezone Europe/Kyiv (або надішли геолокацію)",
+        "fast_reminder": "👌 Нагадаю: ",
+        "fast_repeat": "🔁 Повтор: ",
+        "ai_busy": "🤯 ШІ зараз перевантажений. Спробуй за хвилину."
     },
     "en": {
         "welcome": "👋 Hi! I am Jarvis.",
@@ -75,7 +82,14 @@ TEXTS = {
         "ai_persona_nice": "YOU ARE A SWEET HELPFUL ASSISTANT.",
         "banned": "🚫 <b>You are banned by admin.</b>",
         "user_banned": "🔨 User banned.",
-        "user_unbanned": "🕊 User unbanned."
+        "user_unbanned": "🕊 User unbanned.",
+        "tz_current": "🕰 Your time zone:",
+        "tz_set": "🕰 Time zone:",
+        "tz_unknown": "⚠️ Unknown time zone.",
+        "tz_hint": "Example: /timezone Europe/London (or send your location)",
+        "fast_reminder": "👌 I'll remind you: ",
+        "fast_repeat": "🔁 Repeats: ",
+        "ai_busy": "🤯 The AI is overloaded right now. Try again in a minute."
     }
 }
 
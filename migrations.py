@@ -0,0 +1,310 @@
+"""Версійні міграції схеми БД.
+
+Кожна міграція - (версія, назва, кроки). Крок - SQL-рядок або async-функція(db).
+Застосовані версії записуються в schema_version, тому init() можна викликати скільки завгодно.
+
+Запуск вручну:
+    python migrations.py                      # створити/оновити базу
+    python migrations.py --import old.db      # перенести дані зі старої бази
+    python migrations.py --vacuum             # перевести старі файли в auto_vacuum=INCREMENTAL (бот зупинений)
+
+Плани гарячих запитів на мігрованій схемі перевіряє tests/test_query_plans.py.
+"""
+import os
+import sys
+import asyncio
+import sqlite3
+import pytz
+from datetime import datetime
+from config import TIMEZONE, CONTEXT_RING_SIZE, logger
+from utils import local_to_epoch
+
+async def _backfill_epochs(db):
+    # До v8 усі часи були локальними рядками в TIMEZONE
+    tz = pytz.timezone(TIMEZONE)
+    def epoch(value):
+        try:
+            return int(tz.localize(datetime.strptime(value, "%Y-%m-%d %H:%M:%S")).timestamp())
+        except (TypeError, ValueError):
+            return None
+    async with db.execute("SELECT id, remind_time, next_nag_at FROM reminders") as c:
+        rows = await c.fetchall()
+    await db.executemany("UPDATE reminders SET remind_at=?, nag_at=? WHERE id=?",
+                         [(epoch(remind_time), epoch(nag), rem_id) for rem_id, remind_time, nag in rows])
+
+MIGRATIONS = [
+    (1, "base tables", [
+        """CREATE TABLE IF NOT EXISTS reminders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, chat_id INTEGER,
+            remind_text TEXT, remind_time TEXT, recurrence TEXT DEFAULT NULL, status TEXT DEFAULT 'pending'
+        )""",
+        """CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            is_toxic BOOLEAN DEFAULT 0,
+            spam_mode BOOLEAN DEFAULT 0,
+            lat REAL DEFAULT NULL,
+            lon REAL DEFAULT NULL,
+            memory_json TEXT DEFAULT '[]',
+            language TEXT DEFAULT 'uk',
+            morning_briefing BOOLEAN DEFAULT 1,
+            is_banned BOOLEAN DEFAULT 0
+        )""",
+        """CREATE TABLE IF NOT EXISTS notes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, content TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )""",
+        """CREATE TABLE IF NOT EXISTS context (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, role TEXT, content TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )""",
+    ]),
+    (2, "hot path indexes", [
+        # checker: status='pending' AND remind_time <= ?
+        "CREATE INDEX IF NOT EXISTS idx_reminders_status_time ON reminders(status, remind_time)",
+        # get_active_reminders, ранковий бріфінг
+        "CREATE INDEX IF NOT EXISTS idx_reminders_user_status ON reminders(user_id, status, remind_time)",
+        "CREATE INDEX IF NOT EXISTS idx_notes_user ON notes(user_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_context_user ON context(user_id, id)",
+    ]),
+    (3, "notes full-text index", [
+        # External content FTS5: текст лежить у notes, тут тільки індекс.
+        # user_id індексується як токен, щоб MATCH одразу відсікав чужі нотатки.
+        """CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+            content, user_id, content='notes', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )""",
+        """CREATE TRIGGER IF NOT EXISTS notes_fts_ai AFTER INSERT ON notes BEGIN
+            INSERT INTO notes_fts(rowid, content, user_id) VALUES (new.id, new.content, new.user_id);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS notes_fts_ad AFTER DELETE ON notes BEGIN
+            INSERT INTO notes_fts(notes_fts, rowid, content, user_id) VALUES ('delete', old.id, old.content, old.user_id);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS notes_fts_au AFTER UPDATE ON notes BEGIN
+            INSERT INTO notes_fts(notes_fts, rowid, content, user_id) VALUES ('delete', old.id, old.content, old.user_id);
+            INSERT INTO notes_fts(rowid, content, user_id) VALUES (new.id, new.content, new.user_id);
+        END""",
+        # Бекфіл усіх наявних нотаток одним проходом
+        "INSERT INTO notes_fts(notes_fts) VALUES ('rebuild')",
+    ]),
+    (4, "context ring buffer", [
+        # Кільце: (user_id, slot) - ключ, seq росте монотонно, tokens рахується при записі
+        """CREATE TABLE context_ring (
+            user_id INTEGER NOT NULL, slot INTEGER NOT NULL, seq INTEGER NOT NULL,
+            role TEXT, content TEXT, tokens INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, slot)
+        ) WITHOUT ROWID""",
+        # Переносимо останні 20 реплік кожного користувача (ring size на момент міграції)
+        """INSERT INTO context_ring (user_id, slot, seq, role, content, tokens, created_at)
+           SELECT user_id, seq % 20, seq, role, content, (length(content) + 2) / 3, created_at FROM (
+               SELECT *, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY id) AS seq,
+                      ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY id DESC) AS age
+               FROM context
+           ) WHERE age <= 20""",
+        "DROP TABLE context",
+        "ALTER TABLE context_ring RENAME TO context",
+        "CREATE INDEX idx_context_seq ON context(user_id, seq)",
+    ]),
+    (5, "notes archive", [
+        # Сюди retention переносить старі нотатки, якщо NOTES_ARCHIVE_DAYS > 0 (FTS їх не індексує)
+        """CREATE TABLE IF NOT EXISTS notes_archive (
+            id INTEGER PRIMARY KEY, user_id INTEGER, content TEXT, created_at TIMESTAMP,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )""",
+    ]),
+    (6, "outbox", [
+        # Черга вихідних повідомлень (outbox.py). Час - unix epoch, priority - смуга (0 найвища)
+        """CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id INTEGER NOT NULL, text TEXT NOT NULL,
+            options TEXT, priority INTEGER NOT NULL, status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL,
+            created_at REAL NOT NULL, last_error TEXT
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_outbox_ready ON outbox(status, priority, next_attempt_at)",
+        # Голова черги кожного чату (порядок у межах чату)
+        "CREATE INDEX IF NOT EXISTS idx_outbox_chat ON outbox(chat_id, status, id)",
+    ]),
+    (7, "nag escalation", [
+        # Спам-режим: скільки разів нагадали, коли наступний раз (локальний час, як remind_time),
+        # і повідомлення, яке редагуємо замість нових
+        "ALTER TABLE reminders ADD COLUMN nag_count INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE reminders ADD COLUMN next_nag_at TEXT",
+        "ALTER TABLE reminders ADD COLUMN last_message_id INTEGER",
+        # Старі 'spamming' без розкладу - нагадати при першій нагоді
+        "UPDATE reminders SET next_nag_at = remind_time WHERE status = 'spamming'",
+        "CREATE INDEX IF NOT EXISTS idx_reminders_nag ON reminders(status, next_nag_at)",
+    ]),
+    (8, "epoch timestamps and user time zones", [
+        # NULL - config.TIMEZONE
+        "ALTER TABLE users ADD COLUMN timezone TEXT",
+        # remind_time лишається локальним часом користувача (показ, правила повторення),
+        # планування йде по remind_at / next_nag_at - UTC unix time
+        "ALTER TABLE reminders ADD COLUMN remind_at INTEGER",
+        "ALTER TABLE reminders ADD COLUMN nag_at INTEGER",
+        _backfill_epochs,
+        "DROP INDEX IF EXISTS idx_reminders_nag",
+        "DROP INDEX IF EXISTS idx_reminders_status_time",
+        "DROP INDEX IF EXISTS idx_reminders_user_status",
+        "ALTER TABLE reminders DROP COLUMN next_nag_at",
+        "ALTER TABLE reminders RENAME COLUMN nag_at TO next_nag_at",
+        "CREATE INDEX idx_reminders_due ON reminders(status, remind_at)",
+        "CREATE INDEX idx_reminders_nag ON reminders(status, next_nag_at)",
+        "CREATE INDEX idx_reminders_user_due ON reminders(user_id, status, remind_at)",
+    ]),
+    (9, "broadcast jobs", [
+        # Розсилка (broadcast.py): курсор - останній user_id, вже поставлений у outbox
+        """CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, text TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'running',
+            cursor INTEGER NOT NULL DEFAULT 0, total INTEGER NOT NULL DEFAULT 0, enqueued INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0, blocked INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL, finished_at REAL
+        )""",
+        "ALTER TABLE outbox ADD COLUMN job_id INTEGER",
+        "CREATE INDEX IF NOT EXISTS idx_outbox_job ON outbox(job_id, status)",
+        # Користувач заблокував бота: розсилки його пропускають
+        "ALTER TABLE users ADD COLUMN is_blocked BOOLEAN NOT NULL DEFAULT 0",
+    ]),
+    (10, "youtube summary cache", [
+        # Готові підсумки відео: TTL за created_at, витіснення найдавніше використаних (LRU) за last_used_at
+        """CREATE TABLE IF NOT EXISTS yt_cache (
+            video_id TEXT NOT NULL, lang TEXT NOT NULL, summary TEXT NOT NULL,
+            created_at REAL NOT NULL, last_used_at REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (video_id, lang)
+        ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS idx_yt_cache_used ON yt_cache(last_used_at)",
+    ]),
+    (11, "db meta", [
+        # Службові значення бази; 'shards' - на скільки файлів розкладені користувачі (DB_SHARDS)
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+    ]),
+    (12, "outbox claim index", [
+        # Вибірка йде в порядку ORDER BY priority, id прямо по індексу, без сортування всієї черги
+        "DROP INDEX IF EXISTS idx_outbox_ready",
+        "CREATE INDEX IF NOT EXISTS idx_outbox_claim ON outbox(status, priority, id)",
+        # Найближча повторна спроба (MIN(next_attempt_at))
+        "CREATE INDEX IF NOT EXISTS idx_outbox_next ON outbox(status, next_attempt_at)",
+    ]),
+]
+
+async def current_version(db):
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY, name TEXT, applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )""")
+    await db.commit()
+    async with db.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version") as c:
+        return (await c.fetchone())[0]
+
+async def apply_migrations(db):
+    """Застосовує всі нові міграції по черзі, кожну в окремій транзакції"""
+    version = await current_version(db)
+    for number, name, steps in MIGRATIONS:
+        if number <= version:
+            continue
+        await db.execute("BEGIN")
+        try:
+            for step in steps:
+                if callable(step):
+                    await step(db)
+                else:
+                    await db.execute(step)
+            await db.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (number, name))
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            logger.error(f"Migration {number} ({name}) failed")
+            raise
+        logger.info(f"DB migrated to v{number}: {name}")
+
+def import_legacy(old_db, new_db):
+    """Переносить дані зі старої бази (колишній migrate.py)"""
+    if not os.path.exists(old_db):
+        print(f"❌ Стара база {old_db} не знайдена!")
+        return
+    conn = sqlite3.connect(new_db)
+    cursor = conn.cursor()
+    cursor.execute("ATTACH DATABASE ? AS old_db", (old_db,))
+    print("🚀 Починаю міграцію даних...")
+    try:
+        last_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM reminders").fetchone()[0]
+        cursor.execute("INSERT INTO reminders (user_id, chat_id, remind_text, remind_time, recurrence, status) "
+                       "SELECT user_id, chat_id, remind_text, remind_time, recurrence, status FROM old_db.reminders")
+        print(f"✅ Нагадування перенесено: {cursor.rowcount}")
+
+        cursor.execute("INSERT INTO notes (user_id, content, created_at) "
+                       "SELECT user_id, content, created_at FROM old_db.notes")
+        print(f"✅ Нотатки перенесено: {cursor.rowcount}")
+
+        # Нові колонки (language, morning_briefing, is_banned) заповнюємо дефолтними значеннями
+        cursor.execute("""
+            INSERT OR IGNORE INTO users (user_id, is_toxic, spam_mode, lat, lon, language, morning_briefing, is_banned)
+            SELECT user_id, is_toxic, spam_mode, lat, lon, 'uk', 1, 0 FROM old_db.users
+        """)
+        print(f"✅ Користувачів перенесено: {cursor.rowcount}")
+
+        # Планувальник іде по remind_at (UTC) - рахуємо його з локального remind_time у поясі користувача
+        cursor.execute("SELECT r.id, r.remind_time, r.status, u.timezone FROM reminders r "
+                       "LEFT JOIN users u ON u.user_id = r.user_id WHERE r.id > ? AND r.remind_at IS NULL", (last_id,))
+        updates, broken = [], 0
+        for rem_id, remind_time, status, tz_name in cursor.fetchall():
+            try:
+                remind_at = local_to_epoch(remind_time, tz_name)
+            except (TypeError, ValueError):
+                broken += 1
+                continue
+            updates.append((remind_at, remind_at if status == "spamming" else None, rem_id))
+        cursor.executemany("UPDATE reminders SET remind_at=?, next_nag_at=? WHERE id=?", updates)
+        print(f"✅ Час нагадувань пораховано: {len(updates)}" + (f" (некоректний remind_time: {broken})" if broken else ""))
+
+        # Кільце: останні CONTEXT_RING_SIZE реплік кожного користувача, seq продовжує вже наявні
+        cursor.execute("""
+            INSERT OR REPLACE INTO context (user_id, slot, seq, role, content, tokens, created_at)
+            SELECT user_id, seq % :ring, seq, role, content, (length(content) + 2) / 3, created_at FROM (
+                SELECT o.*, COALESCE((SELECT MAX(c.seq) FROM context c WHERE c.user_id = o.user_id), 0)
+                            + ROW_NUMBER() OVER (PARTITION BY o.user_id ORDER BY o.id) AS seq,
+                       ROW_NUMBER() OVER (PARTITION BY o.user_id ORDER BY o.id DESC) AS age
+                FROM old_db.context o
+            ) WHERE age <= :ring
+        """, {"ring": CONTEXT_RING_SIZE})
+        print(f"✅ Контекст перенесено: {cursor.rowcount}")
+
+        conn.commit()
+        print("✨ Міграція успішно завершена!")
+    except Exception as e:
+        print(f"💥 Помилка під час міграції: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+def enable_incremental_vacuum(path):
+    """Одноразово переводить стару базу в auto_vacuum=INCREMENTAL. Потрібен повний VACUUM,
+    який переписує весь файл і тримає його заблокованим, тому тільки офлайн, а не з retention"""
+    conn = sqlite3.connect(path)
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return False
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+        print(f"✅ {path}: auto_vacuum=INCREMENTAL")
+        return True
+    finally:
+        conn.close()
+
+async def main(args):
+    from database import Database, shard_path
+    from config import DB_NAME
+
+    if "--vacuum" in args:
+        index = 0
+        while os.path.exists(shard_path(index)):
+            enable_incremental_vacuum(shard_path(index))
+            index += 1
+    await Database.init()
+    try:
+        if "--import" in args:
+            old_db = args[args.index("--import") + 1]
+            import_legacy(old_db, DB_NAME)
+    finally:
+        await Database.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1:])))
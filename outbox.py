@@ -0,0 +1,241 @@
+"""Стійка черга вихідних повідомлень.
+
+put_many() пише повідомлення в таблицю outbox (основна база), воркер
+розбирає її через delivery.sender. Порядок вибірки - смуга пріоритету
+(INTERACTIVE > REMINDER > BRIEFING > BROADCAST), далі id. У кожному чаті
+одночасно в роботі лише одне повідомлення - найстаріше з найвищої смуги: відповідь
+користувачу не чекає за розсилкою в тому ж чаті, а в межах смуги порядок зберігається.
+Невдала спроба -> експоненційний backoff; після OUTBOX_MAX_ATTEMPTS або якщо
+Telegram відмовив назавжди (бот заблокований) - status='dead'.
+Готові повідомлення вибираються пачками по OUTBOX_CLAIM_BATCH з'єднанням на читання
+(по індексу, у порядку priority, id) і тримаються в пам'яті; під writer іде лише коротке
+"UPDATE ... status='sending'" для тих, що реально йдуть у відправку, а результати
+відправок пишуться разом раз на OUTBOX_FLUSH_INTERVAL.
+Після рестарту повідомлення в статусі 'sending' повертаються в чергу.
+Повідомлення розсилок мають job_id: результати рахуються в broadcast_jobs тією ж
+транзакцією, а користувачі, що заблокували бота, позначаються users.is_blocked.
+"""
+import json
+import time
+import asyncio
+from aiogram import Bot
+from aiogram.types import InlineKeyboardMarkup
+from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
+from config import OUTBOX_WORKERS, OUTBOX_MAX_ATTEMPTS, OUTBOX_BACKOFF, OUTBOX_CLAIM_BATCH, OUTBOX_FLUSH_INTERVAL, logger
+from database import Database
+from delivery import sender
+
+INTERACTIVE, REMINDER, BRIEFING, BROADCAST = range(4)
+LANES = {INTERACTIVE: "interactive", REMINDER: "reminder", BRIEFING: "briefing", BROADCAST: "broadcast"}
+
+# "+next_attempt_at" - щоб планувальник ішов по idx_outbox_claim у порядку ORDER BY (без сортування)
+CLAIM_SQL = """SELECT id, chat_id, text, options, attempts, job_id FROM outbox o
+               WHERE status='queued' AND +next_attempt_at <= ?
+               AND NOT EXISTS (SELECT 1 FROM outbox p WHERE p.chat_id = o.chat_id
+                               AND p.status IN ('queued','sending')
+                               AND (p.status = 'sending' OR p.priority < o.priority
+                                    OR (p.priority = o.priority AND p.id < o.id)))
+               ORDER BY priority, id LIMIT ?"""
+
+def _dump_options(kwargs):
+    # reply_markup - pydantic-модель aiogram, решта (parse_mode тощо) - звичайні значення
+    if "reply_markup" in kwargs:
+        kwargs = dict(kwargs, reply_markup=kwargs["reply_markup"].model_dump(exclude_none=True))
+    return json.dumps(kwargs, ensure_ascii=False) if kwargs else None
+
+def _load_options(options):
+    kwargs = json.loads(options) if options else {}
+    if "reply_markup" in kwargs:
+        kwargs["reply_markup"] = InlineKeyboardMarkup.model_validate(kwargs["reply_markup"])
+    return kwargs
+
+class Outbox:
+    def __init__(self):
+        self.bot = None
+        self.task = None
+        self.wakeup = asyncio.Event()
+        self.inflight = set()
+        self.ready = []  # вибрані з бази рядки, ще не віддані у відправку (порядок priority, id)
+        self.chats = set()  # чати, чиє повідомлення у відправці або чекає запису результату
+        self.fresh = True  # варто перевибрати: нові повідомлення, записані результати або настав час повтору
+        self.flushed_at = 0.0
+        self.done = []   # (id, chat_id, job_id, підсумок, None або (status, attempts, next_at, error)); підсумок: sent/retry/failed/blocked
+        self.blocked = set()  # чати, де бот заблокований, - позначаються при наступному flush
+        self.sent = 0
+        self.dead = 0
+
+    async def start(self, bot: Bot):
+        self.bot = bot
+        self.ready, self.chats, self.fresh = [], set(), True
+        async with Database.write() as db:
+            await db.execute("UPDATE outbox SET status='queued' WHERE status='sending'")
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try: await self.task
+            except asyncio.CancelledError: pass
+            self.task = None
+        if self.inflight:
+            await asyncio.gather(*self.inflight, return_exceptions=True)
+        await self._flush_done()
+
+    @staticmethod
+    async def insert(db, messages, priority, job_id=None):
+        """Вставка в outbox у вже відкритій транзакції (розсилка пише разом з курсором)"""
+        now = time.time()
+        rows = [(chat_id, text, _dump_options(kwargs), priority, now, now, job_id) for chat_id, text, kwargs in messages]
+        await db.executemany("INSERT INTO outbox (chat_id, text, options, priority, next_attempt_at, created_at, job_id) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    async def put_many(self, messages, priority):
+        """[(chat_id, text, kwargs)] -> у чергу однією транзакцією"""
+        if not messages:
+            return
+        async with Database.write() as db:
+            await self.insert(db, messages, priority)
+        self.notify()
+
+    def notify(self):
+        """Черга змінилась в обхід put_many (розсилка, пауза/скасування) - перевибрати"""
+        self.fresh = True
+        self.wakeup.set()
+
+    async def _flush_done(self):
+        self.flushed_at = time.monotonic()
+        if self.done:
+            done, self.done = self.done, []
+            sent = [(msg_id,) for msg_id, _, _, _, result in done if result is None]
+            failed = [(*result, msg_id) for msg_id, _, _, _, result in done if result is not None]
+            # Лічильники розсилок: {job_id: {sent, failed, blocked}}
+            jobs = {}
+            for _, _, job_id, outcome, _ in done:
+                if job_id and outcome != "retry":
+                    counts = jobs.setdefault(job_id, {"sent": 0, "failed": 0, "blocked": 0})
+                    counts[outcome] += 1
+            try:
+                async with Database.write() as db:
+                    if sent:
+                        await db.executemany("DELETE FROM outbox WHERE id=?", sent)
+                    if failed:
+                        await db.executemany("UPDATE outbox SET status=?, attempts=?, next_attempt_at=?, last_error=? "
+                                             "WHERE id=?", failed)
+                    if jobs:
+                        await db.executemany("UPDATE broadcast_jobs SET sent=sent+?, failed=failed+?, blocked=blocked+? WHERE id=?",
+                                             [(c["sent"], c["failed"], c["blocked"], job_id) for job_id, c in jobs.items()])
+            except BaseException:
+                # Результати не записались - повторимо з наступним flush, інакше відправлене піде вдруге
+                self.done[:0] = done
+                raise
+            finally:
+                # Поки рядок у базі 'sending', наступні повідомлення чату й так не вибираються
+                self.chats.difference_update(chat_id for _, chat_id, _, _, _ in done)
+                self.fresh = True
+        if self.blocked:
+            blocked, self.blocked = self.blocked, set()
+            await Database.set_blocked(blocked)
+
+    async def _claim(self, limit):
+        """Голови черг чатів, готові до відправки (читання, без блокування writer)"""
+        async with Database.read() as db:
+            async with db.execute(CLAIM_SQL, (time.time(), limit)) as c:
+                return await c.fetchall()
+
+    async def _take(self, free):
+        """До free рядків з ready - по одному на чат - переводить у 'sending'"""
+        picked, rest, chats = [], [], set(self.chats)
+        for row in self.ready:
+            if len(picked) < free and row[1] not in chats:
+                picked.append(row)
+                chats.add(row[1])
+            else:
+                rest.append(row)
+        self.ready = rest
+        if not picked:
+            return []
+        marks = ",".join("?" * len(picked))
+        # Поки рядок лежав у ready, розсилку могли призупинити чи скасувати - такі пропускаємо
+        async with Database.write() as db:
+            async with db.execute(f"UPDATE outbox SET status='sending' WHERE status='queued' AND id IN ({marks}) RETURNING id",
+                                  [row[0] for row in picked]) as c:
+                claimed = {r[0] for r in await c.fetchall()}
+        rows = [row for row in picked if row[0] in claimed]
+        self.chats.update(row[1] for row in rows)
+        return rows
+
+    async def _next_delay(self):
+        async with Database.read() as db:
+            async with db.execute("SELECT MIN(next_attempt_at) FROM outbox WHERE status='queued'") as c:
+                next_at = (await c.fetchone())[0]
+        return 60 if next_at is None else min(60, max(0.05, next_at - time.time()))
+
+    async def _deliver(self, row):
+        msg_id, chat_id, text, options, attempts, job_id = row
+        try:
+            await sender.send(self.bot, chat_id, text, raise_errors=True, **_load_options(options))
+            self.sent += 1
+            self.done.append((msg_id, chat_id, job_id, "sent", None))
+        except Exception as e:
+            attempts += 1
+            # Forbidden в особистому чаті - користувач заблокував бота
+            blocked = isinstance(e, TelegramForbiddenError) and chat_id > 0
+            if blocked:
+                self.blocked.add(chat_id)
+            permanent = isinstance(e, (TelegramForbiddenError, TelegramBadRequest))
+            if permanent or attempts >= OUTBOX_MAX_ATTEMPTS:
+                self.dead += 1
+                logger.warning(f"Outbox message {msg_id} dead-lettered (chat {chat_id}): {e}")
+                self.done.append((msg_id, chat_id, job_id, "blocked" if blocked else "failed",
+                                  ("dead", attempts, time.time(), str(e)[:300])))
+            else:
+                next_at = time.time() + min(OUTBOX_BACKOFF * 2 ** attempts, 3600)
+                self.done.append((msg_id, chat_id, job_id, "retry", ("queued", attempts, next_at, str(e)[:300])))
+                # Наступні повідомлення чату чекають повтору цього - прибираємо їх з ready
+                self.ready = [row for row in self.ready if row[1] != chat_id]
+        finally:
+            self.wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                if self.done and (len(self.done) >= OUTBOX_CLAIM_BATCH
+                                  or time.monotonic() - self.flushed_at >= OUTBOX_FLUSH_INTERVAL):
+                    await self._flush_done()
+                free = OUTBOX_WORKERS - len(self.inflight)
+                if free > 0 and self.fresh:
+                    self.fresh = False
+                    self.ready = await self._claim(OUTBOX_CLAIM_BATCH)
+                rows = await self._take(free) if free > 0 else []
+            except Exception as e:
+                logger.error(f"Outbox error: {e}")
+                rows = []
+            for row in rows:
+                task = asyncio.create_task(self._deliver(row))
+                self.inflight.add(task)
+                task.add_done_callback(self.inflight.discard)
+            if rows and len(self.inflight) < OUTBOX_WORKERS:
+                continue
+            self.wakeup.clear()
+            if self.done:
+                # Результати запишемо трохи згодом, пачкою
+                delay = max(0.0, OUTBOX_FLUSH_INTERVAL - (time.monotonic() - self.flushed_at))
+            elif len(self.inflight) >= OUTBOX_WORKERS or self.ready:
+                delay = 60
+            else:
+                delay = await self._next_delay()
+            try: await asyncio.wait_for(self.wakeup.wait(), delay)
+            except asyncio.TimeoutError: self.fresh = True
+
+    async def stats(self):
+        """Глибина і затримка по смугах: {назва: (в черзі, lag сек)}, плюс dead / sent"""
+        now = time.time()
+        async with Database.read() as db:
+            async with db.execute("SELECT priority, COUNT(*), MIN(created_at) FROM outbox "
+                                  "WHERE status IN ('queued','sending') GROUP BY priority") as c:
+                lanes = {LANES.get(p, str(p)): (n, now - oldest) for p, n, oldest in await c.fetchall()}
+            async with db.execute("SELECT COUNT(*) FROM outbox WHERE status='dead'") as c:
+                dead = (await c.fetchone())[0]
+        return {"lanes": lanes, "dead": dead, "sent": self.sent, "inflight": len(self.inflight)}
+
+outbox = Outbox()
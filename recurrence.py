@@ -0,0 +1,110 @@
+"""Правила повторення нагадувань (підмножина RRULE).
+
+Колонка reminders.recurrence містить або псевдонім ("daily", "weekly", "weekdays",
+"monthly", "yearly"), або рядок у стилі RRULE: "FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,TH",
+"FREQ=MONTHLY;BYMONTHDAY=31".
+next_occurrence() рахує наступне спрацювання арифметикою від поточного remind_time,
+без перебору пропущених дат: скільки б не простояв бот, це O(1).
+Час - локальні рядки "YYYY-MM-DD HH:MM:SS" у поясі користувача, як і в remind_time.
+"""
+import calendar
+from datetime import datetime, timedelta
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+DAYS = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+FREQS = ("DAILY", "WEEKLY", "MONTHLY", "YEARLY")
+
+ALIASES = {
+    "daily": "FREQ=DAILY",
+    "weekly": "FREQ=WEEKLY",
+    "weekdays": "FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR",
+    "monthly": "FREQ=MONTHLY",
+    "yearly": "FREQ=YEARLY",
+}
+
+def parse_rule(rule):
+    """RRULE або псевдонім -> (freq, interval, {номери днів тижня}, день місяця або None). ValueError, якщо правило невалідне"""
+    text = ALIASES.get(str(rule).strip().lower(), str(rule).strip())
+    if text.upper().startswith("RRULE:"):
+        text = text[6:]
+    parts = {}
+    for part in text.upper().split(";"):
+        key, sep, value = part.partition("=")
+        if not sep:
+            raise ValueError(f"bad rule part: {part}")
+        parts[key.strip()] = value.strip()
+    freq = parts.get("FREQ")
+    if freq not in FREQS:
+        raise ValueError(f"unsupported FREQ: {freq}")
+    interval = int(parts.get("INTERVAL", "1"))
+    if interval < 1:
+        raise ValueError("INTERVAL must be positive")
+    byday = set()
+    if "BYDAY" in parts:
+        byday = {DAYS.index(d.strip()) for d in parts["BYDAY"].split(",")}
+    monthday = int(parts["BYMONTHDAY"]) if "BYMONTHDAY" in parts else None
+    if monthday is not None and not 1 <= monthday <= 31:
+        raise ValueError("BYMONTHDAY must be 1..31")
+    return freq, interval, byday, monthday
+
+def normalize_rule(rule, remind_time=None):
+    """Значення з LLM/користувача -> те, що пишемо в базу (псевдонім або RRULE), або None"""
+    if not rule:
+        return None
+    try:
+        freq, _, _, monthday = parse_rule(rule)
+    except (ValueError, TypeError):
+        return None
+    rule = str(rule).strip()
+    rule = rule.lower() if rule.lower() in ALIASES else rule.upper().removeprefix("RRULE:")
+    # remind_time з кожним спрацюванням зсувається, тому 29-31 число фіксуємо в правилі,
+    # інакше після лютого "щомісяця 31-го" стане "щомісяця 28-го"
+    if freq in ("MONTHLY", "YEARLY") and monthday is None and remind_time:
+        try:
+            day = datetime.strptime(remind_time, TIME_FORMAT).day
+        except (ValueError, TypeError):
+            day = 0
+        if day > 28:
+            rule = f"{ALIASES.get(rule, rule)};BYMONTHDAY={day}"
+    return rule
+
+def _add_months(dt, months, monthday=None):
+    # 31-ше у коротшому місяці -> останній день місяця
+    month = dt.month - 1 + months
+    year, month = dt.year + month // 12, month % 12 + 1
+    day = min(monthday or dt.day, calendar.monthrange(year, month)[1])
+    return dt.replace(year=year, month=month, day=day)
+
+def _next_weekly(start, interval, byday, now):
+    # Тижні рахуємо від понеділка тижня першого спрацювання
+    week0 = (start - timedelta(days=start.weekday())).replace(hour=0, minute=0, second=0)
+    weeks = max(0, (now - week0).days // 7)
+    k = weeks - weeks % interval
+    # Поточний "активний" тиждень або наступний - більше двох перевіряти не треба
+    for step in (k, k + interval):
+        monday = week0 + timedelta(weeks=step)
+        for day in sorted(byday):
+            candidate = (monday + timedelta(days=day)).replace(hour=start.hour, minute=start.minute, second=start.second)
+            if candidate > now and candidate > start:
+                return candidate
+    raise ValueError("no occurrence found")
+
+def next_occurrence(rule, remind_time, now=None):
+    """Перше спрацювання за правилом rule, строго пізніше за now (за замовчуванням - пізніше за remind_time)"""
+    freq, interval, byday, monthday = parse_rule(rule)
+    start = datetime.strptime(remind_time, TIME_FORMAT)
+    now = max(now or start, start)
+    if freq == "DAILY" or (freq == "WEEKLY" and not byday):
+        period = timedelta(days=interval * (7 if freq == "WEEKLY" else 1))
+        k = (now - start) // period + 1
+        return (start + k * period).strftime(TIME_FORMAT)
+    if freq == "WEEKLY":
+        return _next_weekly(start, interval, byday, now).strftime(TIME_FORMAT)
+    months = interval * (12 if freq == "YEARLY" else 1)
+    elapsed = (now.year - start.year) * 12 + now.month - start.month
+    k = max(0, elapsed // months)
+    candidate = _add_months(start, k * months, monthday)
+    while candidate <= now:
+        k += 1
+        candidate = _add_months(start, k * months, monthday)
+    return candidate.strftime(TIME_FORMAT)
@@ -0,0 +1,145 @@
+"""Планувальник нагадувань на купі таймерів замість опитування бази кожні 30 секунд.
+
+При старті в купу вантажаться нагадування на найближчі REMINDER_HORIZON секунд,
+далі цикл спить рівно до наступного дедлайну. add_reminder / update_reminder_field /
+delete_reminder оновлюють купу через Database.reminder_listeners. База лишається
+джерелом правди: перед відправкою рядки перечитуються, а reconcile() раз на
+REMINDER_RECONCILE секунд перебудовує купу з нуля. Повторювані нагадування, пропущені
+під час простою довше за RECURRENCE_GRACE, при старті переносяться одним пакетом (catch_up).
+"""
+import time
+import heapq
+import asyncio
+from aiogram import Bot
+from config import REMINDER_HORIZON, REMINDER_RECONCILE, RECURRENCE_GRACE, logger
+from database import Database
+from tasks import deliver_reminders, next_time
+
+class ReminderEngine:
+    def __init__(self):
+        self.heap = []   # (due_ts, rem_id)
+        self.due = {}    # rem_id -> актуальний due_ts; записи купи, що не збігаються, - застарілі
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.bot = None
+        self.changes = None  # зміни, що прийшли під час reconcile()
+        self.firing = set()
+        self.firing_ids = set()  # нагадування, що зараз відправляються в _fire
+
+    async def start(self, bot: Bot):
+        self.bot = bot
+        Database.reminder_listeners.append(self.on_change)
+        await self.catch_up()
+        await self.reconcile()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.on_change in Database.reminder_listeners:
+            Database.reminder_listeners.remove(self.on_change)
+        if self.task:
+            self.task.cancel()
+            try: await self.task
+            except asyncio.CancelledError: pass
+            self.task = None
+
+    def schedule(self, rem_id, due_ts):
+        if self.due.get(rem_id) == due_ts:
+            return
+        self.due[rem_id] = due_ts
+        heapq.heappush(self.heap, (due_ts, rem_id))
+        if self.heap[0] == (due_ts, rem_id):
+            self.wakeup.set()
+
+    def cancel(self, rem_id):
+        # Ліниве видалення: запис у купі пропуститься, бо його немає в self.due
+        self.due.pop(rem_id, None)
+
+    def on_change(self, rem_id, due_ts):
+        if self.changes is not None:
+            self.changes[rem_id] = due_ts
+        if due_ts is None:
+            self.cancel(rem_id)
+            return
+        if due_ts <= time.time() + REMINDER_HORIZON:
+            self.schedule(rem_id, due_ts)
+        else:
+            self.cancel(rem_id)
+
+    async def catch_up(self):
+        """Повторювані нагадування, пропущені за час простою, одним пакетом переносить на наступний раз"""
+        try:
+            rows = await Database.get_overdue_recurring(int(time.time() - RECURRENCE_GRACE))
+            updates = []
+            for rem_id, remind_time, recurrence, tz_name in rows:
+                try:
+                    updates.append((rem_id, {"remind_time": next_time(recurrence, remind_time, tz_name)}))
+                except ValueError:
+                    updates.append((rem_id, {"status": "fired"}))
+            if updates:
+                await Database.update_reminders(updates)
+                logger.info(f"Recurring reminders caught up: {len(updates)}")
+        except Exception as e:
+            logger.error(f"Reminder catch-up error: {e}")
+
+    async def reconcile(self):
+        """Перебудовує купу з бази (нагадування і повтори спаму на найближчий горизонт)"""
+        self.changes = {}
+        try:
+            rows = await Database.get_upcoming_reminders(int(time.time() + REMINDER_HORIZON))
+        except Exception as e:
+            logger.error(f"Reminder reconcile error: {e}")
+            return
+        finally:
+            changes, self.changes = self.changes, None
+        # Ті, що зараз відправляються, база ще бачить простроченими - інакше вони спрацювали б удруге
+        due = {rem_id: due_ts for rem_id, due_ts in rows if due_ts is not None and rem_id not in self.firing_ids}
+        self.due = due
+        self.heap = [(ts, rem_id) for rem_id, ts in due.items()]
+        heapq.heapify(self.heap)
+        # Те, що змінилось поки йшов запит, новіше за прочитане
+        for rem_id, due_ts in changes.items():
+            self.on_change(rem_id, due_ts)
+        self.wakeup.set()
+
+    def _pop_due(self, now):
+        ready = []
+        while self.heap and self.heap[0][0] <= now:
+            due_ts, rem_id = heapq.heappop(self.heap)
+            if self.due.get(rem_id) == due_ts:
+                del self.due[rem_id]
+                ready.append(rem_id)
+        return ready
+
+    async def _run(self):
+        while True:
+            # Прибираємо застарілі записи з вершини купи
+            while self.heap and self.due.get(self.heap[0][1]) != self.heap[0][0]:
+                heapq.heappop(self.heap)
+            delay = self.heap[0][0] - time.time() if self.heap else REMINDER_RECONCILE
+            if delay > 0:
+                self.wakeup.clear()
+                try: await asyncio.wait_for(self.wakeup.wait(), min(delay, REMINDER_RECONCILE))
+                except asyncio.TimeoutError: pass
+                continue
+            ready = self._pop_due(time.time())
+            if ready:
+                # Відправка йде окремою задачею, щоб не затримувати наступні дедлайни
+                self.firing_ids.update(ready)
+                task = asyncio.create_task(self._fire(ready))
+                self.firing.add(task)
+                task.add_done_callback(self.firing.discard)
+
+    async def _fire(self, rem_ids):
+        try:
+            rows = await Database.get_due_reminders(time.time(), ids=rem_ids)
+            # Наступні повтори спаму приходять через next_nag_at -> reminder_listeners
+            await deliver_reminders(self.bot, rows)
+        except Exception as e:
+            logger.error(f"Reminder delivery error: {e}")
+        finally:
+            self.firing_ids.difference_update(rem_ids)
+
+    def stats(self):
+        return {"scheduled": len(self.due), "heap": len(self.heap)}
+
+engine = ReminderEngine()
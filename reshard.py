@@ -0,0 +1,115 @@
+"""Перерозкладання користувачів по шардах при зміні DB_SHARDS.
+
+    python reshard.py 4        # бот зупинений; потім DB_SHARDS=4 у .env і запуск
+
+Кожен рядок таблиць з user_id переїжджає у файл шарду user_id % N. Перенос з одного
+файлу в інший - одна транзакція (копія + видалення), тож перерваний запуск можна просто
+повторити. Глобальні таблиці (outbox, broadcast_jobs, yt_cache) лишаються в основній базі.
+id нагадувань у новому шарді нові: кнопки Edit/Del/Done у старих повідомленнях більше
+не знаходять своє нагадування (обробники перевіряють власника і нічого не чіпають).
+Нова кількість записується в meta.shards - до цього бот з іншим DB_SHARDS не стартує.
+Перед запуском варто зробити /backup.
+"""
+import os
+import sys
+import asyncio
+import sqlite3
+import aiosqlite
+from migrations import apply_migrations
+from database import shard_path
+
+# Таблиці з даними користувачів; id (AUTOINCREMENT) у новому файлі призначається заново
+USER_TABLES = ["users", "reminders", "notes", "notes_archive", "context"]
+KEEP_IDS = {"users", "context"}
+
+def stored_shards():
+    """Кількість шардів з meta основної бази (для баз до meta - скільки файлів є)"""
+    if not os.path.exists(shard_path(0)):
+        return None
+    conn = sqlite3.connect(shard_path(0))
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key='shards'").fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    finally:
+        conn.close()
+    if row:
+        return int(row[0])
+    count = 0
+    while os.path.exists(shard_path(count)):
+        count += 1
+    return count
+
+async def _migrate(path):
+    async with aiosqlite.connect(path) as db:
+        await db.execute("PRAGMA journal_mode=WAL;")
+        await apply_migrations(db)
+
+def _columns(conn, table):
+    cols = [row[1] for row in conn.execute(f"PRAGMA main.table_info({table})")]
+    return [c for c in cols if table in KEEP_IDS or c != "id"]
+
+def _move(src, dst, shards):
+    """Переносить з файлу src у dst усе, що за user_id % shards належить dst. {таблиця: рядків}"""
+    conn = sqlite3.connect(shard_path(src), isolation_level=None)
+    moved = {}
+    try:
+        conn.execute("ATTACH DATABASE ? AS dst", (shard_path(dst),))
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for table in USER_TABLES:
+                cols = ", ".join(_columns(conn, table))
+                where = f"user_id % {shards} = {dst}"
+                cursor = conn.execute(f"INSERT OR REPLACE INTO dst.{table} ({cols}) SELECT {cols} FROM main.{table} WHERE {where}")
+                moved[table] = cursor.rowcount
+                conn.execute(f"DELETE FROM main.{table} WHERE {where}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("DETACH DATABASE dst")
+    finally:
+        conn.close()
+    return moved
+
+def _set_stored(shards):
+    conn = sqlite3.connect(shard_path(0))
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('shards', ?)", (str(shards),))
+    conn.close()
+
+async def reshard(shards):
+    """Розкладає дані з поточної кількості шардів на shards. Повертає {таблиця: перенесено рядків}"""
+    if shards < 1:
+        raise ValueError("shards must be >= 1")
+    old = stored_shards() or 1
+    # Схема в усіх файлах (і старих, і нових) має бути актуальною
+    for index in range(max(old, shards)):
+        await _migrate(shard_path(index))
+    total = {table: 0 for table in USER_TABLES}
+    if old != shards:
+        for src in range(old):
+            for dst in range(shards):
+                if dst == src:
+                    continue
+                for table, count in (await asyncio.to_thread(_move, src, dst, shards)).items():
+                    total[table] += count
+    _set_stored(shards)
+    return total
+
+async def main(args):
+    if len(args) != 1 or not args[0].isdigit():
+        print("Usage: python reshard.py <shards>")
+        return 2
+    shards = int(args[0])
+    old = stored_shards() or 1
+    print(f"🔀 Шардів: {old} -> {shards}")
+    moved = await reshard(shards)
+    print("✅ Перенесено: " + ", ".join(f"{table} {count}" for table, count in moved.items()))
+    if shards < old:
+        print("🗑 Файли " + ", ".join(shard_path(i) for i in range(shards, old)) + " тепер порожні, їх можна видалити.")
+    print(f"Тепер виставте DB_SHARDS={shards} і запустіть бота.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1:])))
@@ -0,0 +1,104 @@
+"""Очищення і компактизація бази за політиками на кожну таблицю.
+
+Ключі рядків під видалення збираються з'єднанням на читання, а видаляються
+порціями по RETENTION_BATCH, тому writer-лок ніколи не тримається довго.
+Після видалень - обмежений PRAGMA incremental_vacuum(N) і wal_checkpoint(TRUNCATE).
+Стару базу без auto_vacuum=INCREMENTAL переводить офлайн `python migrations.py --vacuum`.
+"""
+import os
+import time
+import asyncio
+import pytz
+from datetime import datetime
+from config import (TIMEZONE, RETENTION_DAYS, CONTEXT_RETENTION_DAYS,
+                    NOTES_ARCHIVE_DAYS, RETENTION_BATCH, RETENTION_VACUUM_PAGES, logger)
+from database import Database
+
+# Останній звіт для /stats
+last_report = None
+# Бази без auto_vacuum, про які вже попередили в лог
+_warned = set()
+
+def _db_size():
+    paths = [pool.path + suffix for pool in Database.pools() for suffix in ("", "-wal")]
+    return sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+
+def _policies(reminder_days):
+    """(назва, SELECT ключів, параметри, DELETE за ключем, архівний INSERT або None)"""
+    cutoff = int(time.time() - reminder_days * 86400)
+    policies = [
+        ("reminders",
+         "SELECT id FROM reminders WHERE status NOT IN ('pending','spamming') AND remind_at < ?", (cutoff,),
+         "DELETE FROM reminders WHERE id=?", None),
+    ]
+    policies.append((
+        "outbox",
+        # Відправлені з outbox видаляються одразу, тут - тільки dead-letter
+        "SELECT id FROM outbox WHERE status='dead' AND created_at < ?", (cutoff,),
+        "DELETE FROM outbox WHERE id=?", None))
+    if CONTEXT_RETENTION_DAYS:
+        policies.append((
+            "context",
+            # Останню репліку користувача лишаємо, щоб seq кільця не почався з нуля
+            "SELECT user_id, slot FROM context c WHERE created_at < datetime('now', ?) "
+            "AND seq < (SELECT MAX(seq) FROM context WHERE user_id = c.user_id)", (f"-{CONTEXT_RETENTION_DAYS} days",),
+            "DELETE FROM context WHERE user_id=? AND slot=?", None))
+    if NOTES_ARCHIVE_DAYS:
+        policies.append((
+            "notes",
+            "SELECT id FROM notes WHERE created_at < datetime('now', ?)", (f"-{NOTES_ARCHIVE_DAYS} days",),
+            "DELETE FROM notes WHERE id=?",
+            "INSERT OR IGNORE INTO notes_archive (id, user_id, content, created_at) "
+            "SELECT id, user_id, content, created_at FROM notes WHERE id=?"))
+    return policies
+
+async def _purge(pool, select_sql, params, delete_sql, archive_sql):
+    async with pool.read() as db:
+        async with db.execute(select_sql, params) as c:
+            keys = await c.fetchall()
+    for i in range(0, len(keys), RETENTION_BATCH):
+        batch = keys[i:i + RETENTION_BATCH]
+        async with pool.write() as db:
+            if archive_sql:
+                await db.executemany(archive_sql, batch)
+            await db.executemany(delete_sql, batch)
+        # Віддаємо writer іншим хендлерам між порціями
+        await asyncio.sleep(0)
+    return len(keys)
+
+async def _compact(pool):
+    async with pool.write() as db:
+        async with db.execute("PRAGMA auto_vacuum") as c:
+            mode = (await c.fetchone())[0]
+        if mode == 2:
+            # Порція сторінок, щоб не тримати writer-лок на весь файл
+            async with db.execute(f"PRAGMA incremental_vacuum({RETENTION_VACUUM_PAGES})") as c:
+                await c.fetchall()
+        elif pool.path not in _warned:
+            _warned.add(pool.path)
+            logger.warning(f"{pool.path}: auto_vacuum вимкнений, файл не стискається - "
+                           f"запустіть `python migrations.py --vacuum` при зупиненому боті")
+        async with db.execute("PRAGMA wal_checkpoint(TRUNCATE)") as c:
+            await c.fetchall()
+
+async def run_retention(reminder_days=RETENTION_DAYS):
+    """Застосовує всі політики і стискає файл. Повертає звіт {таблиця: рядків, bytes: звільнено}"""
+    global last_report
+    size_before = _db_size()
+    report = {}
+    for pool in Database.pools():
+        for name, select_sql, params, delete_sql, archive_sql in _policies(reminder_days):
+            try:
+                report[name] = report.get(name, 0) + await _purge(pool, select_sql, params, delete_sql, archive_sql)
+            except Exception as e:
+                logger.error(f"Retention error ({name}, {pool.path}): {e}")
+                report.setdefault(name, 0)
+        try:
+            await _compact(pool)
+        except Exception as e:
+            logger.error(f"Compaction error ({pool.path}): {e}")
+    report["bytes"] = max(0, size_before - _db_size())
+    report["at"] = datetime.now(pytz.timezone(TIMEZONE)).strftime("%Y-%m-%d %H:%M")
+    last_report = report
+    logger.info(f"Retention: {report}")
+    return report
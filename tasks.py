@@ -1,129 +1,199 @@
-import pytz
+import time
 import asyncio
-import aiosqlite
-import os
 import random
-from datetime import datetime, timedelta
 from aiogram import Bot
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile
-from config import TIMEZONE, DB_NAME, logger, RETENTION_DAYS, ADMIN_IDS
+from config import NAG_SCHEDULE, NAG_MAX_ATTEMPTS, BRIEFING_HOUR, logger, ADMIN_IDS
 from database import Database
-from utils import create_backup, get_weather
+from utils import local_now, local_to_epoch
+from weather import weather as weather_service
+from backup import create_snapshot, read_checksum
+from retention import run_retention
+from delivery import sender
+from outbox import outbox, REMINDER, BRIEFING
+from recurrence import next_occurrence
 from locales import t
 
-async def checker(bot: Bot):
-    try:
-        now = datetime.now(pytz.timezone(TIMEZONE))
-        now_str = now.strftime("%Y-%m-%d %H:%M:%S")
-        
-        async with aiosqlite.connect(DB_NAME) as db:
-            query = """SELECT id, chat_id, remind_text, user_id, status, recurrence, remind_time 
-                       FROM reminders WHERE (status='pending' AND remind_time <= ?) OR status='spamming'"""
-            async with db.execute(query, (now_str,)) as c:
-                rows = await c.fetchall()
-                
-            for r in rows:
-                rid, chat_id, text, user_id, status, recurrence, r_time = r
-                user = await Database.get_user(user_id)
-                # user: 0=toxic, 4=spam, 5=lang, 6=morning, 7=banned
-                is_toxic, spam_mode, is_banned = user[0], user[4], user[7]
-                
-                if is_banned: continue 
-
-                kb = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="✅ Done", callback_data=f"confirm_{rid}")]])
-                
-                if spam_mode:
-                    if status == 'pending':
-                        await db.execute("UPDATE reminders SET status='spamming' WHERE id=?", (rid,))
-                    msg = f"🤬 РОБИ ДАВАЙ: {text}" if is_toxic else f"🔔 Reminder: {text}"
-                    try: await bot.send_message(chat_id, msg, reply_markup=kb)
-                    except Exception as e: logger.error(f"Send error: {e}")
-                
-                else:
-                    if status == 'pending':
-                        prefix = "🔔" 
-                        try: await bot.send_message(chat_id, f"{prefix} {text}")
-                        except: pass
-                        
-                        if recurrence == 'daily':
-                            try:
-                                old_time = datetime.strptime(r_time, "%Y-%m-%d %H:%M:%S")
-                                new_time = (old_time + timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S")
-                                await db.execute("UPDATE reminders SET remind_time=?, status='pending' WHERE id=?", (new_time, rid))
-                            except:
-                                await db.execute("UPDATE reminders SET status='fired' WHERE id=?", (rid,))
-                        else:
-                            await db.execute("UPDATE reminders SET status='fired' WHERE id=?", (rid,))
+# Останній бріфінг (кількість, тривалість етапів) для /stats
+last_briefing = None
+
+def next_time(recurrence, r_time, tz_name=None):
+    """Наступне майбутнє спрацювання повторюваного нагадування (пропущені не відпрацьовуємо).
+    Рахується в локальному часі користувача, тож 08:00 лишається 08:00 і після переходу на літній час"""
+    return next_occurrence(recurrence, r_time, local_now(tz_name))
+
+def nag_text(text, is_toxic, count, final=False):
+    msg = f"🤬 РОБИ ДАВАЙ: {text}" if is_toxic else f"🔔 Reminder: {text}"
+    if count > 1:
+        msg += f" (×{count})"
+    if final:
+        msg += "\n⌛️ Більше не нагадую."
+    return msg
+
+async def _nag(bot: Bot, r, user):
+    """Один повтор спам-режиму: редагує попереднє повідомлення (або шле нове). Повертає поля для оновлення"""
+    rid, chat_id, text, user_id, status, recurrence, r_time, nag_count, last_message_id = r
+    count = nag_count + 1
+    final = count >= NAG_MAX_ATTEMPTS
+    kb = None if final else InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="✅ Done", callback_data=f"confirm_{rid}")]])
+    msg = nag_text(text, user.is_toxic, count, final)
+    sent = None
+    if last_message_id:
+        sent = await sender.edit(bot, chat_id, last_message_id, msg, reply_markup=kb)
+    if not sent:
+        sent = await sender.send(bot, chat_id, msg, reply_markup=kb)
+        if sent:
+            last_message_id = sent.message_id
+    fields = {"nag_count": count, "last_message_id": last_message_id}
+    if final:
+        # Без відповіді після NAG_MAX_ATTEMPTS: повторюване переходить на наступний раз, інше - expired
+        if recurrence:
+            try:
+                fields.update(status="pending", remind_time=next_time(recurrence, r_time, user.timezone), nag_count=0,
+                              next_nag_at=None, last_message_id=None)
+            except ValueError:
+                fields.update(status="expired", next_nag_at=None)
+        else:
+            fields.update(status="expired", next_nag_at=None)
+    else:
+        pause = NAG_SCHEDULE[min(nag_count, len(NAG_SCHEDULE) - 1)]
+        fields.update(status="spamming", next_nag_at=int(time.time() + pause))
+    return rid, fields
+
+async def deliver_reminders(bot: Bot, rows):
+    """Відправляє нагадування, що настали. Звичайні - через outbox, спам-режим - з ескалацією"""
+    users = await asyncio.gather(*(Database.get_user(r[3]) for r in rows))
+    messages = []
+    nags = []
+    updates = []
+    for r, user in zip(rows, users):
+        rid, chat_id, text, user_id, status, recurrence, r_time = r[:7]
+        if user.is_banned: continue 
+
+        if user.spam_mode:
+            nags.append(_nag(bot, r, user))
+
+        elif status == 'spamming':
+            # Спам-режим вимкнули, поки нагадування повторювалось - зупиняємо повтори;
+            # повторюване при цьому не гасне, а переходить на наступний раз
+            fields = {"status": "fired", "next_nag_at": None}
+            if recurrence:
+                try:
+                    fields = {"remind_time": next_time(recurrence, r_time, user.timezone), "status": "pending",
+                              "nag_count": 0, "next_nag_at": None, "last_message_id": None}
+                except ValueError:
+                    pass
+            updates.append((rid, fields))
+
+        elif status == 'pending':
+            messages.append((chat_id, f"🔔 {text}", {}))
             
-            await db.commit()
-    except Exception as e:
-        logger.error(f"Task error: {e}")
+            if recurrence:
+                try:
+                    updates.append((rid, {"remind_time": next_time(recurrence, r_time, user.timezone), "status": "pending"}))
+                except ValueError:
+                    updates.append((rid, {"status": "fired"}))
+            else:
+                updates.append((rid, {"status": "fired"}))
+
+    # Звичайні - однією транзакцією в outbox; повтори спаму - паралельно напряму (потрібен message_id)
+    await outbox.put_many(messages, REMINDER)
+    updates += await asyncio.gather(*nags)
+    # Статуси - однією транзакцією на шард
+    if updates:
+        await Database.update_reminders(updates)
+
+async def _timed(timings, stage, coro):
+    started = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        timings[stage] = round(time.perf_counter() - started, 3)
+
+def _render_briefing(lang, weather, plans, notes):
+    w_text = ""
+    if weather:
+        w_text = f"{t('morning_weather', lang)} {weather['temp']}°C, ☔ {weather['rain']}%\n"
+
+    plans_text = ""
+    if plans:
+        plans_text = t("morning_plans", lang)
+        for text, remind_time in plans:
+            time_only = remind_time.split(" ")[1][:5]
+            plans_text += f"▫️ {time_only} - {text}\n"
+    else:
+        plans_text = t("morning_no_plans", lang)
+
+    quote_text = ""
+    if notes:
+        random_note = random.choice(notes)
+        if len(random_note) > 10:
+            quote_text = f"\n{t('morning_quote', lang)}<i>\"{random_note[:100]}...\"</i>"
+
+    return f"{t('morning_title', lang)}{w_text}\n{plans_text}{quote_text}"
 
 async def daily_morning_briefing(bot: Bot):
-    """Розсилає ранкове повідомлення тим, у кого воно включено"""
-    users = await Database.get_all_users() # (user_id, is_toxic, lat, lon, spam_mode, language, morning_briefing)
-    
-    for user_data in users:
-        user_id = user_data[0]
-        lang = user_data[5]
-        morning_enabled = user_data[6]
-        
-        # Перевірка налаштування
-        if not morning_enabled: continue
-
-        lat, lon = user_data[2], user_data[3]
-        
-        w_text = ""
-        if lat and lon:
-            w = await get_weather(lat, lon)
-            if w:
-                w_text = f"{t('morning_weather', lang)} {w['temp']}°C, ☔ {w['rain']}%\n"
-        
-        async with aiosqlite.connect(DB_NAME) as db:
-            now = datetime.now(pytz.timezone(TIMEZONE))
-            today_start = now.strftime("%Y-%m-%d 00:00:00")
-            today_end = now.strftime("%Y-%m-%d 23:59:59")
-            query = "SELECT remind_text, remind_time FROM reminders WHERE user_id=? AND remind_time BETWEEN ? AND ? AND status='pending'"
-            async with db.execute(query, (user_id, today_start, today_end)) as c:
-                plans = await c.fetchall()
-        
-        plans_text = ""
-        if plans:
-            plans_text = t("morning_plans", lang)
-            for p in plans:
-                time_only = p[1].split(" ")[1][:5]
-                plans_text += f"▫️ {time_only} - {p[0]}\n"
-        else:
-            plans_text = t("morning_no_plans", lang)
+    """Розсилає ранкове повідомлення тим, у кого зараз BRIEFING_HOUR за їхнім часом.
+    Запускається кожні 15 хвилин, щоб покрити й пояси зі зсувом :30 / :45.
+    Дані вантажаться пакетно (кілька запитів на шард), погода - по клітинках, відправка - через outbox"""
+    global last_briefing
+    started = time.perf_counter()
+    timings = {}
+    users = await _timed(timings, "users", Database.get_briefing_users())  # (user_id, is_toxic, lat, lon, language, timezone)
+    # Бакети за поясом: локальний час рахуємо раз на пояс, а не на кожного користувача
+    buckets = {}
+    for tz_name in {u[5] for u in users}:
+        now = local_now(tz_name)
+        if now.hour == BRIEFING_HOUR and now.minute < 15:
+            buckets[tz_name] = now.strftime("%Y-%m-%d")
+    users = [u for u in users if u[5] in buckets]
+    if not users:
+        return
 
-        notes = await Database.get_recent_notes(user_id, limit=20)
-        quote_text = ""
-        if notes:
-            random_note = random.choice(notes)
-            if len(random_note) > 10:
-                quote_text = f"\n{t('morning_quote', lang)}<i>\"{random_note[:100]}...\"</i>"
+    async def load_plans():
+        plans = {}
+        for tz_name, today in buckets.items():
+            ids = [u[0] for u in users if u[5] == tz_name]
+            plans.update(await Database.get_plans_for_users(ids, local_to_epoch(f"{today} 00:00:00", tz_name),
+                                                            local_to_epoch(f"{today} 23:59:59", tz_name)))
+        return plans
 
-        msg = f"{t('morning_title', lang)}{w_text}\n{plans_text}{quote_text}"
-        
-        try:
-            await bot.send_message(user_id, msg, parse_mode="HTML")
-            await asyncio.sleep(0.1)
-        except: pass
+    # Три незалежні етапи - паралельно
+    plans, notes, weather = await asyncio.gather(
+        _timed(timings, "plans", load_plans()),
+        _timed(timings, "notes", Database.get_recent_notes_for_users([u[0] for u in users], limit=20)),
+        # Погода одна на клітинку сітки, промахи кешу - пакетними запитами
+        _timed(timings, "weather", weather_service.get_many([(u[2], u[3]) for u in users if u[2] and u[3]])),
+    )
+
+    render_started = time.perf_counter()
+    messages = []
+    for user_id, is_toxic, lat, lon, lang, tz_name in users:
+        cell_weather = weather.get(weather_service.cell(lat, lon)) if lat and lon else None
+        msg = _render_briefing(lang, cell_weather, plans.get(user_id), notes.get(user_id))
+        messages.append((user_id, msg, {"parse_mode": "HTML"}))
+    timings["render"] = round(time.perf_counter() - render_started, 3)
+
+    # Темп відправки і повтори - на боці outbox
+    await _timed(timings, "enqueue", outbox.put_many(messages, BRIEFING))
+    last_briefing = {"users": len(messages), "cells": len(weather), "total": round(time.perf_counter() - started, 3),
+                     "stages": timings, "at": local_now().strftime("%Y-%m-%d %H:%M")}
+    logger.info(f"Morning briefing: {last_briefing}")
+
+async def maintenance_job():
+    """Щоденне очищення за політиками (retention.py)"""
+    try:
+        await run_retention()
+    except Exception as e:
+        logger.error(f"Maintenance error: {e}")
 
-async def background_maintenance(bot: Bot):
-    days_counter = 0
-    while True:
+async def backup_job(bot: Bot):
+    """Щотижневий бекап адміну"""
+    if not ADMIN_IDS: return
+    backup_path = await create_snapshot()
+    if backup_path:
         try:
-            await Database.clean_old_data(days=RETENTION_DAYS)
-            if days_counter % 7 == 0 and ADMIN_IDS:
-                backup_path = await create_backup()
-                if backup_path:
-                    try:
-                        await bot.send_document(ADMIN_IDS[0], FSInputFile(backup_path), caption="📦 Auto Backup")
-                        os.remove(backup_path)
-                    except: pass
-            days_counter += 1
-            await asyncio.sleep(86400)
+            await bot.send_document(ADMIN_IDS[0], FSInputFile(backup_path),
+                                    caption=f"📦 Auto Backup\nsha256: {read_checksum(backup_path)}")
         except Exception as e:
-            logger.error(f"Maintenance error: {e}")
-            await asyncio.sleep(3600)
+            logger.error(f"Backup send error: {e}")
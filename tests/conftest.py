@@ -0,0 +1,64 @@
+import os
+import sys
+
+# config.py завершує процес без ключів - для тестів підставляємо фіктивні
+os.environ.setdefault("BOT_TOKEN", "test")
+os.environ.setdefault("GROQ_API_KEY", "test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+from aiohttp import web
+
+import fake_groq
+import groq_client
+from database import Database
+from http_client import http
+
+
+@pytest.fixture
+def db_dir(tmp_path, monkeypatch):
+    """Робоча тека тесту: файли бази (DB_NAME, шарди, backups) створюються в tmp_path"""
+    monkeypatch.chdir(tmp_path)
+    Database._profiles.clear()
+    yield tmp_path
+    Database._profiles.clear()
+
+
+@pytest.fixture
+def run_db(db_dir):
+    """run_db(scenario) - asyncio.run(scenario()) з відкритою базою (init до, close після)"""
+    def run(scenario):
+        async def main():
+            await Database.init()
+            try:
+                return await scenario()
+            finally:
+                await Database.close()
+        return asyncio.run(main())
+    return run
+
+
+@pytest.fixture
+def groq_server(monkeypatch):
+    """async with groq_server(**options) as fake - fake_groq на вільному порту, GROQ_API_BASE вказує на нього"""
+    @asynccontextmanager
+    async def serve(**options):
+        args = argparse.Namespace(**dict({"rpm": 1000, "concurrency": 1000, "latency": 0.0, "error_rate": 0.0,
+                                          "down": False}, **options))
+        app = fake_groq.make_app(args)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        monkeypatch.setattr(groq_client, "GROQ_API_BASE", f"http://127.0.0.1:{port}/openai/v1")
+        try:
+            yield app[fake_groq.FAKE]
+        finally:
+            await http.close()
+            await runner.cleanup()
+    return serve
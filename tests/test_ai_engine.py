@@ -0,0 +1,63 @@
+import asyncio
+
+import ai_engine
+
+
+def _fake_transcript(monkeypatch, text):
+    """Субтитри без YouTube; повертає список запитаних video_id"""
+    fetched = []
+
+    async def get_video_transcript(video_id, lang="uk"):
+        fetched.append(video_id)
+        await asyncio.sleep(0.01)
+        return text
+
+    monkeypatch.setattr(ai_engine, "get_video_transcript", get_video_transcript)
+    return fetched
+
+
+def test_concurrent_requests_share_one_summary(run_db, groq_server, monkeypatch):
+    fetched = _fake_transcript(monkeypatch, "short transcript")
+    monkeypatch.setattr(ai_engine, "video_cache_stats", {"hits": 0, "misses": 0, "joined": 0})
+
+    async def scenario():
+        async with groq_server(latency=0.05) as fake:
+            first, second = await asyncio.gather(ai_engine.get_video_summary("vid"),
+                                                 ai_engine.get_video_summary("vid"))
+            # Повторне посилання - з кешу в базі, без субтитрів і LLM
+            again = await ai_engine.get_video_summary("vid")
+            return first, second, again, fake.stats["ok"]
+
+    first, second, again, calls = run_db(scenario)
+    assert first and first == second == again
+    assert calls == 1
+    assert fetched == ["vid"]
+    assert ai_engine.video_cache_stats == {"hits": 1, "misses": 1, "joined": 1}
+
+
+def test_long_transcript_is_mapped_and_reduced(groq_server, monkeypatch):
+    transcript = " ".join(f"word{n}" for n in range(150))
+    monkeypatch.setattr(ai_engine, "YT_CHUNK_TOKENS", 100)
+    _fake_transcript(monkeypatch, transcript)
+    calls = []
+    complete = ai_engine._complete
+
+    async def recording_complete(model, messages, max_tokens=None):
+        calls.append((model, messages[-1]["content"]))
+        return await complete(model, messages, max_tokens)
+
+    monkeypatch.setattr(ai_engine, "_complete", recording_complete)
+
+    async def scenario():
+        async with groq_server():
+            return await ai_engine.groq_summarize_video("long")
+
+    assert asyncio.run(scenario())
+    chunks = ai_engine.split_text(transcript, 100)
+    assert len(chunks) == 4
+    # Map: кожен шматок окремо швидкою моделлю, reduce: одна відповідь з усіх тез
+    assert sorted(content for _, content in calls[:-1]) == sorted(chunks)
+    assert [model for model, _ in calls] == [ai_engine.MODEL_SUMMARY] * 4 + [ai_engine.MODEL_TEXT]
+    reduce_input = calls[-1][1]
+    assert reduce_input.startswith("Notes on consecutive parts")
+    assert all(f"Part {i}/4:" in reduce_input for i in range(1, 5))
@@ -0,0 +1,46 @@
+import asyncio
+
+import backup
+from database import Database
+
+
+def test_restore_keeps_database_usable(run_db):
+    async def scenario():
+        await Database.add_note(1, "before backup")
+        path = await backup.create_snapshot()
+        await Database.add_note(1, "after backup")
+
+        restore = asyncio.create_task(backup.restore_snapshot(path))
+        while Database._pool.writer is not None:
+            await asyncio.sleep(0.001)
+        # База закрита на підміну: запити чекають на пулі і читають уже відновлену
+        notes = [asyncio.create_task(Database.get_recent_notes(1)) for _ in range(10)]
+        await restore
+        assert all(n == ["before backup"] for n in await asyncio.gather(*notes))
+
+        await Database.add_note(1, "after restore")
+        assert await Database.get_recent_notes(1) == ["after restore", "before backup"]
+        assert backup.dispatch_gate.open.is_set()
+
+    run_db(scenario)
+
+
+def test_snapshot_finishes_under_writes(run_db):
+    async def scenario():
+        stop = asyncio.Event()
+
+        async def writer():
+            n = 0
+            while not stop.is_set():
+                await Database.add_note(1, f"note {n} " + "x" * 2000)
+                n += 1
+
+        for n in range(2000):
+            await Database.add_note(1, f"seed {n} " + "x" * 2000, wait=False)
+        task = asyncio.create_task(writer())
+        path = await asyncio.wait_for(backup.create_snapshot(), 30)
+        stop.set()
+        await task
+        assert path and backup.read_checksum(path)
+
+    run_db(scenario)
@@ -0,0 +1,56 @@
+import asyncio
+
+import broadcast
+from broadcast import Broadcaster
+from database import Database
+from outbox import outbox
+
+
+def test_resume_after_stop_enqueues_everyone_once(run_db, monkeypatch):
+    monkeypatch.setattr(broadcast, "BROADCAST_BATCH", 3)
+    insert = outbox.insert
+    stuck = None
+    pages = 0
+
+    async def insert_then_hang(db, messages, priority, job_id=None):
+        nonlocal pages
+        await insert(db, messages, priority, job_id)
+        pages += 1
+        if pages == 3:
+            # Третя сторінка вже в outbox, але транзакція з курсором ще не закомічена
+            stuck.set()
+            await asyncio.Event().wait()
+
+    monkeypatch.setattr(outbox, "insert", insert_then_hang)
+
+    async def scenario():
+        nonlocal stuck
+        stuck = asyncio.Event()
+        for user_id in range(1, 21):
+            await Database.get_user(user_id)
+        first = Broadcaster()
+        await first.start()
+        job_id = await first.create("hello")
+        await asyncio.wait_for(stuck.wait(), 5)
+        await first.stop()
+        stopped = await first.get(job_id)
+
+        # Перезапуск: нове завдання не створюємо, продовжується збережене
+        monkeypatch.setattr(outbox, "insert", insert)
+        second = Broadcaster()
+        await second.start()
+        try:
+            while (await second.get(job_id))["enqueued"] < stopped["total"]:
+                await asyncio.sleep(0.01)
+        finally:
+            await second.stop()
+        async with Database.read() as db:
+            async with db.execute("SELECT chat_id FROM outbox WHERE job_id=? ORDER BY id", (job_id,)) as c:
+                chats = [row[0] for row in await c.fetchall()]
+        return stopped, await second.get(job_id), chats
+
+    stopped, job, chats = run_db(scenario)
+    # Сторінка, на якій зупинили, відкотилась разом з курсором
+    assert stopped["enqueued"] == 6 and stopped["status"] == "running"
+    assert chats == list(range(1, 21))
+    assert job["total"] == job["enqueued"] == job["queued"] == 20
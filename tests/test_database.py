@@ -0,0 +1,141 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+import database
+from database import (HIGHLIGHT_END, HIGHLIGHT_START, Database, UserProfile, _ProfileCache, fts_terms,
+                      shard_path)
+
+
+def test_close_finishes_pending_writes(db_dir):
+    async def main():
+        await Database.init()
+        Database._shard(1).queue.max_rows = 10
+        tasks = [asyncio.create_task(Database.add_note(1, f"note {n}")) for n in range(50)]
+        # Черга вже пише перший батч, решта чекає
+        for _ in range(3):
+            await asyncio.sleep(0)
+        await Database.close()
+        await asyncio.wait_for(asyncio.gather(*tasks), 5)
+
+    asyncio.run(main())
+    conn = sqlite3.connect(shard_path(0))
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM notes").fetchone()[0] == 50
+    finally:
+        conn.close()
+
+
+def test_flush_waits_for_batch_in_progress(run_db):
+    async def scenario():
+        queue = Database._shard(1).queue
+        committing = asyncio.Event()
+        write = queue.pool.write
+
+        def slow_write():
+            # Батч фонового _run тримає транзакцію, поки ми викликаємо Database.flush()
+            committing.set()
+            return write()
+
+        queue.pool.write = slow_write
+        try:
+            await Database.add_to_context(1, "user", "latest turn", wait=False)
+            await committing.wait()
+            await Database.flush()
+        finally:
+            del queue.pool.write
+        return [turn["content"] for turn in await Database.get_context(1)]
+
+    assert run_db(scenario) == ["latest turn"]
+
+
+def _profile(user_id, language="uk"):
+    return UserProfile(user_id, 0, None, None, "[]", 0, language, 1, 0, None)
+
+
+def test_profile_cache_counts_hits_and_misses():
+    cache = _ProfileCache(maxsize=2, ttl=60)
+    assert cache.get(1) is None
+    cache.put(_profile(1))
+    assert cache.get(1).user_id == 1
+    cache.put(_profile(2))
+    cache.put(_profile(3))  # витісняє найдавніший - 1
+    assert cache.get(1) is None
+    assert cache.stats() == {"size": 2, "hits": 1, "misses": 2, "hit_rate": 1 / 3}
+
+
+def test_profile_cache_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(database.time, "monotonic", lambda: now[0])
+    cache = _ProfileCache(ttl=30)
+    cache.put(_profile(1))
+    now[0] += 29
+    assert cache.get(1) is not None
+    now[0] += 2
+    assert cache.get(1) is None
+    assert not cache.items
+
+
+def test_profile_cache_rejects_stale_fill():
+    cache = _ProfileCache(maxsize=1)
+    cache.put(_profile(1))
+    generation = cache.begin_fill()  # читання з БД почалось до запису
+    cache.put(_profile(2))           # 1 витіснено, поки читання в дорозі
+    cache.invalidate(1)              # update_user для некешованого користувача
+    cache.end_fill(_profile(1, "uk"), generation)
+    assert cache.peek(1) is None
+    # Без незавершених заповнень записи не накопичуються
+    assert not cache.written
+    for user_id in range(100):
+        cache.invalidate(user_id)
+    assert not cache.written
+
+
+def test_get_user_does_not_cache_stale_read(run_db):
+    async def scenario():
+        await Database.get_user(1)
+        Database.clear_cache()
+        read = asyncio.create_task(Database.get_user(1))
+        await asyncio.sleep(0)  # читання стартувало з мовою 'uk'
+        await Database.update_user(1, language="en")
+        await read
+        return (await Database.get_user(1)).language
+
+    assert run_db(scenario) == "en"
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("купити хліба", ['"купит"*', '"хліб"*']),
+    ("Хлібом", ['"хліб"*']),
+    ("buying milk", ['"buy"*', '"milk"*']),
+    ("кіт", ['"кіт"*']),
+    ("?!… -", []),
+    ("", []),
+])
+def test_fts_terms(query, expected):
+    assert fts_terms(query) == expected
+
+
+def test_search_notes(run_db):
+    async def scenario():
+        await Database.add_note(1, "купити хліб і молоко")
+        await Database.add_note(1, "хліб, хліб і ще раз хліб")
+        await Database.add_note(1, "зателефонувати мамі")
+        await Database.add_note(2, "хліб для сусіда")
+        return (await Database.search_notes(1, "хлібом"), await Database.search_notes(1, "молоком купити"),
+                await Database.search_notes(1, "?!"), await Database.search_notes(1, ""),
+                await Database.search_notes(2, "хліба"), await Database.search_notes(3, "хліб"))
+
+    by_stem, both_terms, punctuation, empty, other_user, nobody = run_db(scenario)
+    # bm25: нотатка, де "хліб" тричі, вище за ту, де він один раз; нотатки користувача 2 не потрапляють
+    assert [snippet for snippet, _ in by_stem] == [
+        f"{HIGHLIGHT_START}хліб{HIGHLIGHT_END}, {HIGHLIGHT_START}хліб{HIGHLIGHT_END} і ще раз "
+        f"{HIGHLIGHT_START}хліб{HIGHLIGHT_END}",
+        f"купити {HIGHLIGHT_START}хліб{HIGHLIGHT_END} і молоко",
+    ]
+    assert all(created_at for _, created_at in by_stem)
+    assert [snippet for snippet, _ in both_terms] == [
+        f"{HIGHLIGHT_START}купити{HIGHLIGHT_END} хліб і {HIGHLIGHT_START}молоко{HIGHLIGHT_END}"]
+    assert punctuation == empty == nobody == []
+    assert [snippet for snippet, _ in other_user] == [f"{HIGHLIGHT_START}хліб{HIGHLIGHT_END} для сусіда"]
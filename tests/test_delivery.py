@@ -0,0 +1,37 @@
+import asyncio
+import time
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from delivery import Sender
+
+
+class FloodBot:
+    """send_message: перший запит у чат 1 отримує RetryAfter"""
+
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        self.flooded = False
+        self.sent = {}
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if chat_id == 1 and not self.flooded:
+            self.flooded = True
+            raise TelegramRetryAfter(SendMessage(chat_id=chat_id, text=text), "Too Many Requests", self.retry_after)
+        self.sent[chat_id] = time.monotonic()
+        return text
+
+
+def test_retry_after_pauses_only_that_chat():
+    async def main():
+        bot, sender = FloodBot(retry_after=1), Sender()
+        start = time.monotonic()
+        flooded = asyncio.create_task(sender.send(bot, 1, "first"))
+        await asyncio.sleep(0.05)
+        assert await sender.send(bot, 2, "other") == "other"
+        assert bot.sent[2] - start < 0.5
+        assert await flooded == "first"
+        assert bot.sent[1] - start >= 1
+
+    asyncio.run(main())
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+import groq_client
+from groq_client import GroqClient, GroqError, GroqUnavailable, IMAGE_TOKENS
+
+PAYLOAD = {"model": "test", "messages": [{"role": "user", "content": "hi"}], "max_tokens": 10}
+
+
+def test_estimate_counts_image_as_fixed_cost():
+    text = {"role": "user", "content": "Що на фото?"}
+    photo = {"role": "user", "content": [
+        {"type": "text", "text": "Що на фото?"},
+        {"type": "image_url", "image_url": {"url": "data:image/jpeg;base64," + "A" * 300_000}},
+    ]}
+    base = GroqClient._estimate({"messages": [text], "max_tokens": 100})
+    assert GroqClient._estimate({"messages": [photo], "max_tokens": 100}) == base + IMAGE_TOKENS
+
+
+@pytest.fixture
+def fast(monkeypatch):
+    monkeypatch.setattr(groq_client, "GROQ_BACKOFF", 0.01)
+    monkeypatch.setattr(groq_client, "GROQ_BACKOFF_MAX", 0.05)
+
+
+def _with_fake(groq_server, scenario, **options):
+    """Запускає scenario(client, fake) з fake_groq на вільному порту"""
+    async def main():
+        async with groq_server(**options) as fake:
+            return await scenario(GroqClient(), fake)
+
+    return asyncio.run(main())
+
+
+def test_aimd_halves_limit_on_429(fast, groq_server):
+    async def scenario(client, fake):
+        client.limit = 8.0
+        replies = await asyncio.gather(*(client.chat(PAYLOAD) for _ in range(6)))
+        return client, fake, replies
+
+    client, fake, replies = _with_fake(groq_server, scenario, concurrency=2, latency=0.05)
+    assert len(replies) == 6
+    assert fake.stats["peak_inflight"] <= 2
+    assert client.counters["throttled"] > 0
+    assert client.limit < 8
+
+
+def test_retries_transient_errors(fast, groq_server):
+    async def scenario(client, fake):
+        admit, failures = fake._admit, [2]
+
+        def flaky():
+            if failures[0]:
+                failures[0] -= 1
+                fake.stats["requests"] += 1
+                return web.json_response({"error": {"message": "Service Unavailable"}}, status=503)
+            return admit()
+
+        fake._admit = flaky
+        reply = await client.chat(PAYLOAD)
+        return client, fake, reply
+
+    client, fake, reply = _with_fake(groq_server, scenario)
+    assert reply["choices"][0]["message"]["content"]
+    assert client.counters["retries"] == 2
+    assert fake.stats["requests"] == 3
+
+
+def test_breaker_opens_and_recovers(fast, groq_server, monkeypatch):
+    monkeypatch.setattr(groq_client, "GROQ_RETRIES", 0)
+    monkeypatch.setattr(groq_client, "GROQ_BREAKER_COOLDOWN", 0.2)
+
+    async def scenario(client, fake):
+        for _ in range(groq_client.GROQ_BREAKER_FAILURES):
+            with pytest.raises(GroqError):
+                await client.chat(PAYLOAD)
+        assert client.state == "open"
+        with pytest.raises(GroqUnavailable):
+            await client.chat(PAYLOAD)
+        assert fake.stats["requests"] == groq_client.GROQ_BREAKER_FAILURES
+        fake.args.down = False
+        await asyncio.sleep(0.25)
+        assert client.state == "half-open"
+        await client.chat(PAYLOAD)
+        assert client.state == "closed"
+
+    _with_fake(groq_server, scenario, down=True)
@@ -0,0 +1,68 @@
+from datetime import datetime
+
+import pytest
+
+import intents
+from intents import _parse_reminder, match_intent
+
+# Субота, полудень
+NOW = datetime(2026, 10, 17, 12, 0)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("нагадай о 18:00 купити хліб", ("купити хліб", "2026-10-17 18:00:00", None)),
+    ("нагадай о 9 ранку купити хліб", ("купити хліб", "2026-10-18 09:00:00", None)),
+    ("нагадай завтра о 9 подзвонити мамі", ("подзвонити мамі", "2026-10-18 09:00:00", None)),
+    ("remind me tomorrow at 9pm to call mom", ("call mom", "2026-10-18 21:00:00", None)),
+    ("нагадай через 20 хв вимкнути плиту", ("вимкнути плиту", "2026-10-17 12:20:00", None)),
+    ("remind me in 2 hours to stretch", ("stretch", "2026-10-17 14:00:00", None)),
+    ("щодня о 8:00 нагадуй пити воду", ("пити воду", "2026-10-18 08:00:00", "daily")),
+    ("нагадай в середу о 10:00 здати звіт", ("здати звіт", "2026-10-21 10:00:00", None)),
+    ("remind me every monday at 9am to call mom", ("call mom", "2026-10-19 09:00:00", "FREQ=WEEKLY;BYDAY=MO")),
+    # Перше спрацювання "по буднях" у суботу - понеділок
+    ("нагадай по буднях о 7:30 зарядка", ("зарядка", "2026-10-19 07:30:00", "weekdays")),
+])
+def test_parse_reminder(text, expected):
+    assert _parse_reminder(text, NOW) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "нагадай о 25:00 щось",
+    "нагадай о 9.75 щось",
+    "remind me at 13:70 to run",
+    "нагадай купити хліб",                     # немає часу
+    "нагадай о 9:00 і о 10:00 поїсти",         # два часи
+    "нагадай сьогодні о 8:00 поснідати",       # вже минуло
+    "нагадай 5 числа о 9:00 заплатити",        # число в завданні
+    "нагадай через 5 хв завтра поїсти",        # відносний час разом з іншим
+    "не нагадуй о 9:00 про зустріч",
+    "don't remind me at 9 to eat",
+    "remind me at 9:00 on weekdays to run",    # "on" лишився від нерозпізнаного фрагмента
+    "нагадай о 9 в магазині купити молоко",
+    "привіт, як справи?",
+])
+def test_parse_reminder_falls_back_to_llm(text):
+    assert _parse_reminder(text, NOW) is None
+
+
+def test_match_intent_note():
+    res = match_intent("запиши: код від під'їзду 1234")
+    assert res["save_note"] == "код від під'їзду 1234"
+    assert res["is_reminder"] is False
+
+
+def test_match_intent_reminder_shape():
+    res = match_intent("нагадай через 10 хв вимкнути плиту", "en")
+    assert res["is_reminder"] is True
+    assert res["task"] == "вимкнути плиту"
+    assert res["recurrence"] is None
+    assert res["reply"].startswith("👌 I'll remind you: ")
+    datetime.strptime(res["time"], "%Y-%m-%d %H:%M:%S")
+
+
+def test_match_intent_counts_hits():
+    before = dict(intents.stats)
+    assert match_intent("як справи?") is None
+    assert match_intent("note - купити батарейки") is not None
+    assert intents.stats["checked"] == before["checked"] + 2
+    assert intents.stats["hits"] == before["hits"] + 1
@@ -0,0 +1,74 @@
+import asyncio
+import sqlite3
+
+import aiosqlite
+import pytest
+
+from config import CONTEXT_RING_SIZE
+from migrations import apply_migrations, import_legacy
+
+LEGACY_SCHEMA = """
+CREATE TABLE reminders (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, chat_id INTEGER,
+                        remind_text TEXT, remind_time TEXT, recurrence TEXT DEFAULT NULL, status TEXT DEFAULT 'pending');
+CREATE TABLE users (user_id INTEGER PRIMARY KEY, is_toxic BOOLEAN DEFAULT 0, spam_mode BOOLEAN DEFAULT 0,
+                    lat REAL, lon REAL, memory_json TEXT DEFAULT '[]');
+CREATE TABLE notes (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, content TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+CREATE TABLE context (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, role TEXT, content TEXT,
+                      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+"""
+
+
+async def _migrate(path):
+    async with aiosqlite.connect(path) as db:
+        await apply_migrations(db)
+
+
+@pytest.fixture
+def legacy(tmp_path):
+    """(стара база, нова мігрована база)"""
+    old, new = str(tmp_path / "old.db"), str(tmp_path / "new.db")
+    conn = sqlite3.connect(old)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.executemany("INSERT INTO users (user_id) VALUES (?)", [(1,), (2,)])
+    conn.execute("INSERT INTO notes (user_id, content) VALUES (1, 'note')")
+    conn.executemany("INSERT INTO context (user_id, role, content) VALUES (?, 'user', ?)",
+                     [(1, f"m{i}") for i in range(CONTEXT_RING_SIZE + 5)] + [(2, "hi"), (2, "there")])
+    conn.commit()
+    conn.close()
+    asyncio.run(_migrate(new))
+    return old, new
+
+
+def test_import_context_fills_ring(legacy):
+    old, new = legacy
+    import_legacy(old, new)
+    conn = sqlite3.connect(new)
+    rows = conn.execute("SELECT user_id, COUNT(*), MIN(seq), MAX(seq), COUNT(DISTINCT slot) FROM context "
+                        "GROUP BY user_id ORDER BY user_id").fetchall()
+    # Лишаються останні CONTEXT_RING_SIZE реплік, seq - порядок у старій базі
+    assert rows == [(1, CONTEXT_RING_SIZE, 6, CONTEXT_RING_SIZE + 5, CONTEXT_RING_SIZE), (2, 2, 1, 2, 2)]
+    newest = conn.execute("SELECT content FROM context WHERE user_id=1 ORDER BY seq DESC LIMIT 1").fetchone()
+    assert newest == (f"m{CONTEXT_RING_SIZE + 4}",)
+    assert conn.execute("SELECT COUNT(*) FROM notes").fetchone() == (1,)
+
+
+def test_import_reminders_get_remind_at(legacy):
+    old, new = legacy
+    conn = sqlite3.connect(old)
+    conn.executemany("INSERT INTO reminders (user_id, chat_id, remind_text, remind_time, status) VALUES (?,?,?,?,?)",
+                     [(1, 1, "a", "2030-01-01 09:00:00", "pending"), (2, 2, "b", "2030-06-01 10:00:00", "spamming"),
+                      (2, 2, "c", "not a time", "pending")])
+    conn.commit()
+    conn.close()
+    conn = sqlite3.connect(new)
+    # Користувач 2 уже є в новій базі зі своїм поясом
+    conn.execute("INSERT INTO users (user_id, timezone) VALUES (2, 'America/New_York')")
+    conn.commit()
+    import_legacy(old, new)
+    rows = conn.execute("SELECT remind_text, remind_at, next_nag_at FROM reminders ORDER BY id").fetchall()
+    assert rows == [
+        ("a", 1893481200, None),          # 2030-01-01 09:00 Europe/Kyiv (UTC+2)
+        ("b", 1906552800, 1906552800),    # 2030-06-01 10:00 America/New_York (UTC-4)
+        ("c", None, None),
+    ]
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+import outbox as outbox_module
+from database import Database
+from outbox import Outbox, INTERACTIVE, BROADCAST
+
+
+def _run_outbox(run_db, monkeypatch, scenario, delay=0.0):
+    sent = []
+    sending = set()
+
+    async def send(bot, chat_id, text, raise_errors=False, **kwargs):
+        # Одночасно не більше одного повідомлення на чат
+        assert chat_id not in sending
+        sending.add(chat_id)
+        await asyncio.sleep(delay)
+        sending.discard(chat_id)
+        sent.append((chat_id, text))
+
+    monkeypatch.setattr(outbox_module.sender, "send", send)
+
+    async def main():
+        box = Outbox()
+        await scenario(box)
+        await box.start(bot=None)
+        for _ in range(200):
+            await asyncio.sleep(0.02)
+            async with Database.read() as db:
+                async with db.execute("SELECT COUNT(*) FROM outbox WHERE status!='sent'") as c:
+                    if (await c.fetchone())[0] == 0 and not box.inflight:
+                        break
+        await box.stop()
+
+    run_db(main)
+    return sent
+
+
+def test_delivers_every_chat_in_order(run_db, monkeypatch):
+    async def scenario(box):
+        await box.put_many([(chat, f"{chat}-{n}", {}) for n in range(5) for chat in range(1, 31)], INTERACTIVE)
+
+    sent = _run_outbox(run_db, monkeypatch, scenario, delay=0.001)
+    assert len(sent) == 150
+    for chat in range(1, 31):
+        assert [text for chat_id, text in sent if chat_id == chat] == [f"{chat}-{n}" for n in range(5)]
+
+
+def test_interactive_goes_before_broadcast(run_db, monkeypatch):
+    async def scenario(box):
+        await box.put_many([(chat, "news", {}) for chat in range(100, 400)], BROADCAST)
+        await box.put_many([(1, "answer", {})], INTERACTIVE)
+
+    sent = _run_outbox(run_db, monkeypatch, scenario)
+    assert sent[0] == (1, "answer")
+    assert len(sent) == 301
+
+
+def test_chat_head_follows_priority(run_db, monkeypatch):
+    async def scenario(box):
+        await box.put_many([(1, f"news-{n}", {}) for n in range(3)], BROADCAST)
+        await box.put_many([(1, "answer-1", {}), (1, "answer-2", {})], INTERACTIVE)
+
+    sent = _run_outbox(run_db, monkeypatch, scenario)
+    assert [text for _, text in sent] == ["answer-1", "answer-2", "news-0", "news-1", "news-2"]
+
+
+def test_flush_failure_keeps_results(run_db, monkeypatch):
+    async def scenario():
+        box = Outbox()
+        await box.put_many([(1, "hello", {})], INTERACTIVE)
+        box.ready = await box._claim(10)
+        (msg_id, *_), = await box._take(1)
+        box.done.append((msg_id, 1, None, "sent", None))
+        write = Database.write
+
+        def broken():
+            raise OSError("disk I/O error")
+
+        monkeypatch.setattr(Database, "write", broken)
+        with pytest.raises(OSError):
+            await box._flush_done()
+        # Результат лишився для наступного flush, а чат не завис
+        assert box.done == [(msg_id, 1, None, "sent", None)]
+        assert 1 not in box.chats
+        monkeypatch.setattr(Database, "write", write)
+        await box._flush_done()
+        async with Database.read() as db:
+            async with db.execute("SELECT COUNT(*) FROM outbox") as c:
+                return (await c.fetchone())[0], box.done
+
+    assert run_db(scenario) == (0, [])
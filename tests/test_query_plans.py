@@ -0,0 +1,69 @@
+import asyncio
+
+import aiosqlite
+import pytest
+
+from database import SEARCH_NOTES_SQL
+from migrations import apply_migrations
+from outbox import CLAIM_SQL
+
+# Гарячі запити бота: на мігрованій схемі жоден не має падати у full scan
+HOT_QUERIES = [
+    ("checker", "SELECT id, chat_id, remind_text, user_id, status, recurrence, remind_time, nag_count, last_message_id "
+                "FROM reminders WHERE (status='pending' AND remind_at <= ?) OR (status='spamming' AND next_nag_at <= ?)", (0, 0)),
+    ("upcoming", "SELECT id, remind_at FROM reminders WHERE status='pending' AND remind_at <= ? UNION ALL "
+                 "SELECT id, next_nag_at FROM reminders WHERE status='spamming' AND next_nag_at <= ?", (0, 0)),
+    ("overdue_recurring", "SELECT r.id, r.remind_time, r.recurrence, u.timezone FROM reminders r "
+                          "LEFT JOIN users u ON u.user_id = r.user_id "
+                          "WHERE r.status='pending' AND r.remind_at < ? AND r.recurrence IS NOT NULL", (0,)),
+    ("get_active_reminders", "SELECT id, remind_time, remind_text FROM reminders WHERE user_id=? "
+                             "AND status IN ('pending','spamming') ORDER BY remind_at ASC", (1,)),
+    ("briefing_plans", "SELECT user_id, remind_text, remind_time FROM reminders WHERE user_id IN "
+                       "(SELECT value FROM json_each(?)) AND status='pending' AND remind_at BETWEEN ? AND ? "
+                       "ORDER BY remind_at", ("[1,2]", 0, 0)),
+    ("briefing_notes", "SELECT user_id, content FROM (SELECT user_id, content, ROW_NUMBER() OVER "
+                       "(PARTITION BY user_id ORDER BY id DESC) AS rn FROM notes WHERE user_id IN "
+                       "(SELECT value FROM json_each(?))) WHERE rn <= ?", ("[1,2]", 20)),
+    ("get_stats", "SELECT COUNT(*) FROM reminders WHERE status = 'pending'", ()),
+    ("get_recent_notes", "SELECT content FROM notes WHERE user_id=? ORDER BY id DESC LIMIT ?", (1, 5)),
+    ("search_notes", SEARCH_NOTES_SQL, ("[", "]", 'user_id : "1" AND content : ("a"*)', 1, 10)),
+    ("get_context", "SELECT role, content, tokens FROM context WHERE user_id=? ORDER BY seq DESC LIMIT ?", (1, 20)),
+    ("outbox_claim", CLAIM_SQL, (0, 10)),
+    ("outbox_next", "SELECT MIN(next_attempt_at) FROM outbox WHERE status='queued'", ()),
+    ("broadcast_page", "SELECT user_id FROM users WHERE user_id > ? AND is_blocked=0 ORDER BY user_id LIMIT ?", (0, 100)),
+    ("broadcast_backlog", "SELECT COUNT(*) FROM outbox WHERE job_id=? AND status IN ('queued','sending','held')", (1,)),
+    ("yt_cache", "SELECT summary FROM yt_cache WHERE video_id=? AND lang=? AND created_at >= ?", ("x", "uk", 0)),
+    ("yt_cache_evict", "DELETE FROM yt_cache WHERE (video_id, lang) IN (SELECT video_id, lang FROM yt_cache "
+                       "ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)", (1000,)),
+    ("context_seq", "SELECT user_id, MAX(seq) FROM context WHERE user_id IN (?, ?) GROUP BY user_id", (1, 2)),
+]
+
+# Запити з ORDER BY, порядок яких має давати індекс (без сортування у temp B-tree)
+ORDERED = {"outbox_claim", "get_context", "get_recent_notes", "broadcast_page"}
+
+
+async def _plan(path, sql, params):
+    async with aiosqlite.connect(path) as db:
+        await apply_migrations(db)
+        async with db.execute(f"EXPLAIN QUERY PLAN {sql}", params) as c:
+            return [row[3] for row in await c.fetchall()]
+
+
+@pytest.mark.parametrize("name, sql, params", HOT_QUERIES, ids=[q[0] for q in HOT_QUERIES])
+def test_hot_query_uses_index(tmp_path, name, sql, params):
+    details = asyncio.run(_plan(str(tmp_path / "plan.db"), sql, params))
+    # "SCAN t" - повний прохід; "SCAN t USING INDEX", "VIRTUAL TABLE INDEX" (FTS MATCH, json_each)
+    # і "SCAN (subquery-N)" (прохід по вже відібраному підзапиту) - це ок
+    full_scans = [d for d in details if d.startswith("SCAN") and "USING" not in d
+                  and "VIRTUAL TABLE" not in d and not d.startswith("SCAN (subquery")]
+    assert not full_scans, "; ".join(details)
+    if name in ORDERED:
+        assert not any("TEMP B-TREE" in d for d in details), "; ".join(details)
+
+
+def test_search_notes_driven_by_fts(tmp_path):
+    params = ("[", "]", 'user_id : "1" AND content : ("a"*)', 1, 10)
+    details = asyncio.run(_plan(str(tmp_path / "plan.db"), SEARCH_NOTES_SQL, params))
+    # Відбір робить FTS-індекс, нотатки дочитуються по rowid, а не перебором нотаток користувача
+    assert details[0].startswith("SCAN notes_fts VIRTUAL TABLE INDEX"), "; ".join(details)
+    assert "SEARCH n USING INTEGER PRIMARY KEY (rowid=?)" in details, "; ".join(details)
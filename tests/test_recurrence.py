@@ -0,0 +1,63 @@
+from datetime import datetime
+
+import pytest
+
+from recurrence import next_occurrence, normalize_rule, parse_rule
+
+
+@pytest.mark.parametrize("rule, remind_time, now, expected", [
+    ("daily", "2026-01-01 09:00:00", None, "2026-01-02 09:00:00"),
+    ("daily", "2026-01-01 09:00:00", datetime(2026, 3, 10, 8, 0), "2026-03-10 09:00:00"),
+    ("daily", "2026-01-01 09:00:00", datetime(2026, 3, 10, 10, 0), "2026-03-11 09:00:00"),
+    # Бот простояв десятиліття - одним кроком, без перебору пропущених дат
+    ("daily", "2026-01-01 09:00:00", datetime(2100, 1, 1, 12, 0), "2100-01-02 09:00:00"),
+    ("FREQ=DAILY;INTERVAL=3", "2026-01-01 09:00:00", datetime(2026, 1, 5), "2026-01-07 09:00:00"),
+    ("weekly", "2026-01-05 09:00:00", None, "2026-01-12 09:00:00"),
+    ("weekdays", "2026-01-09 18:00:00", None, "2026-01-12 18:00:00"),
+    ("FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,TH", "2026-01-05 09:00:00", None, "2026-01-08 09:00:00"),
+    # Тиждень 12-18 січня пропускається (INTERVAL=2)
+    ("FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,TH", "2026-01-05 09:00:00", datetime(2026, 1, 9), "2026-01-19 09:00:00"),
+    ("monthly", "2026-01-15 10:00:00", None, "2026-02-15 10:00:00"),
+    ("FREQ=MONTHLY;BYMONTHDAY=31", "2026-01-31 10:00:00", None, "2026-02-28 10:00:00"),
+    # Після короткого місяця повертаємось на 31-ше, а не лишаємось на 28-му
+    ("FREQ=MONTHLY;BYMONTHDAY=31", "2026-02-28 10:00:00", None, "2026-03-31 10:00:00"),
+    ("FREQ=MONTHLY;INTERVAL=3", "2026-01-10 10:00:00", datetime(2026, 5, 1), "2026-07-10 10:00:00"),
+    ("yearly", "2028-02-29 07:30:00", None, "2029-02-28 07:30:00"),
+    ("RRULE:FREQ=YEARLY", "2026-06-01 07:30:00", None, "2027-06-01 07:30:00"),
+])
+def test_next_occurrence(rule, remind_time, now, expected):
+    assert next_occurrence(rule, remind_time, now) == expected
+
+
+def test_parse_rule():
+    assert parse_rule("weekdays") == ("WEEKLY", 1, {0, 1, 2, 3, 4}, None)
+    assert parse_rule("freq=monthly;interval=2;bymonthday=30") == ("MONTHLY", 2, set(), 30)
+
+
+@pytest.mark.parametrize("rule", [
+    "hourly", "FREQ=HOURLY", "FREQ=DAILY;INTERVAL=0", "FREQ=MONTHLY;BYMONTHDAY=32",
+    "FREQ=WEEKLY;BYDAY=XX", "every day", "FREQ=DAILY;INTERVAL=x",
+])
+def test_parse_rule_rejects_invalid(rule):
+    with pytest.raises(ValueError):
+        parse_rule(rule)
+
+
+@pytest.mark.parametrize("rule, remind_time, expected", [
+    (None, None, None),
+    ("", None, None),
+    ("every day", None, None),
+    ("Weekly", None, "weekly"),
+    ("rrule:freq=weekly;byday=mo", None, "FREQ=WEEKLY;BYDAY=MO"),
+    ("monthly", "2026-01-15 10:00:00", "monthly"),
+    ("monthly", "2026-01-31 10:00:00", "FREQ=MONTHLY;BYMONTHDAY=31"),
+    ("yearly", "2026-03-30 10:00:00", "FREQ=YEARLY;BYMONTHDAY=30"),
+    ("FREQ=MONTHLY;BYMONTHDAY=5", "2026-01-31 10:00:00", "FREQ=MONTHLY;BYMONTHDAY=5"),
+])
+def test_normalize_rule(rule, remind_time, expected):
+    assert normalize_rule(rule, remind_time) == expected
+
+
+def test_normalize_rule_ignores_malformed_time():
+    assert normalize_rule("monthly", "2026-10-31 18:00") == "monthly"
+    assert normalize_rule("monthly", "2026-10-31 18:00:00") == "FREQ=MONTHLY;BYMONTHDAY=31"
@@ -0,0 +1,38 @@
+import asyncio
+
+import reminder_engine
+from database import Database
+from reminder_engine import ReminderEngine
+
+
+def test_reconcile_skips_reminders_being_sent(run_db, monkeypatch):
+    release = None
+    delivered = []
+
+    async def deliver(bot, rows):
+        delivered.extend(row[0] for row in rows)
+        await release.wait()
+
+    monkeypatch.setattr(reminder_engine, "deliver_reminders", deliver)
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        engine = ReminderEngine()
+        try:
+            await engine.start(bot=None)
+            rid = await Database.add_reminder(1, 1, "overdue", "2020-01-01 09:00:00", None)
+            while not delivered:
+                await asyncio.sleep(0.01)
+            # Відправка ще триває, а в базі нагадування досі pending і прострочене
+            await engine.reconcile()
+            assert rid not in engine.due
+            release.set()
+            await asyncio.gather(*engine.firing)
+            assert not engine.firing_ids
+            assert delivered == [rid]
+        finally:
+            release.set()
+            await engine.stop()
+
+    run_db(scenario)
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+import database
+import reshard
+from database import Database, shard_path
+
+USERS = range(1, 13)
+
+
+async def _start(shards, monkeypatch):
+    monkeypatch.setattr(database, "DB_SHARDS", shards)
+    Database._profiles.clear()
+    await Database.init()
+
+
+async def _fill():
+    for user_id in USERS:
+        await Database.get_user(user_id)
+        await Database.update_user(user_id, language="en")
+        await Database.add_reminder(user_id, user_id, f"task {user_id}", "2030-01-01 09:00:00", None)
+        await Database.add_note(user_id, f"note {user_id}")
+        await Database.add_to_context(user_id, "user", f"hello {user_id}", wait=True)
+
+
+async def _snapshot():
+    result = {}
+    for user_id in USERS:
+        user = await Database.get_user(user_id)
+        rems = [r[2] for r in await Database.get_active_reminders(user_id)]
+        notes = await Database.get_recent_notes(user_id)
+        context = [turn["content"] for turn in await Database.get_context(user_id)]
+        result[user_id] = (user.language, rems, notes, context)
+    return result
+
+
+def test_shard_count_change_requires_reshard(db_dir, monkeypatch):
+    async def scenario():
+        await _start(1, monkeypatch)
+        await _fill()
+        before = await _snapshot()
+        await Database.close()
+
+        with pytest.raises(RuntimeError, match="reshard.py 3"):
+            await _start(3, monkeypatch)
+
+        moved = await reshard.reshard(3)
+        assert moved["users"] == sum(1 for u in USERS if u % 3)
+        await _start(3, monkeypatch)
+        assert await _snapshot() == before
+        for pool in Database.pools():
+            async with pool.read() as db:
+                async with db.execute("SELECT user_id FROM users") as c:
+                    assert all(row[0] % 3 == pool.index for row in await c.fetchall())
+        await Database.close()
+
+        await reshard.reshard(2)
+        await _start(2, monkeypatch)
+        assert await _snapshot() == before
+        await Database.close()
+
+    asyncio.run(scenario())
+    assert (db_dir / shard_path(2)).exists()
+
+
+def test_legacy_single_file_is_detected(db_dir, monkeypatch):
+    async def scenario():
+        await _start(1, monkeypatch)
+        async with Database.write() as db:
+            await db.execute("DELETE FROM meta")
+        await Database.close()
+        # База до meta: один файл - значить, шард був один
+        with pytest.raises(RuntimeError):
+            await _start(2, monkeypatch)
+
+    asyncio.run(scenario())
+
+
+def test_delete_reminder_checks_owner(db_dir, monkeypatch):
+    async def scenario():
+        await _start(1, monkeypatch)
+        rid = await Database.add_reminder(1, 1, "mine", "2030-01-01 09:00:00", None)
+        assert await Database.delete_reminder(rid, 2) is False
+        assert await Database.get_reminder(rid) is not None
+        assert await Database.delete_reminder(rid, 1) is True
+        assert await Database.get_reminder(rid) is None
+        await Database.close()
+
+    asyncio.run(scenario())
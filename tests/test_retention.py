@@ -0,0 +1,111 @@
+import sqlite3
+from contextlib import asynccontextmanager
+
+import retention
+from database import Database, shard_path
+from migrations import enable_incremental_vacuum
+
+
+async def _execute(sql, params=()):
+    async with Database._pool.write() as db:
+        await db.execute(sql, params)
+
+
+def test_purge_deletes_in_batches(run_db, monkeypatch):
+    monkeypatch.setattr(retention, "RETENTION_BATCH", 2)
+
+    async def scenario():
+        pool = Database._pool
+        for n in range(5):
+            await Database.add_note(1, f"note {n}")
+        await Database.add_note(2, "keep")
+        transactions = 0
+        write = pool.write
+
+        @asynccontextmanager
+        async def counting_write():
+            nonlocal transactions
+            transactions += 1
+            async with write() as db:
+                yield db
+
+        pool.write = counting_write
+        try:
+            purged = await retention._purge(pool, "SELECT id FROM notes WHERE user_id=?", (1,),
+                                            "DELETE FROM notes WHERE id=?", None)
+        finally:
+            del pool.write
+        return purged, transactions, await Database.get_recent_notes(1), await Database.get_recent_notes(2)
+
+    # 5 ключів порціями по 2 - три окремі транзакції
+    assert run_db(scenario) == (5, 3, [], ["keep"])
+
+
+def test_notes_are_archived_before_delete(run_db, monkeypatch):
+    monkeypatch.setattr(retention, "NOTES_ARCHIVE_DAYS", 30)
+
+    async def scenario():
+        await Database.add_note(1, "old note")
+        await Database.add_note(1, "fresh note")
+        await _execute("UPDATE notes SET created_at=datetime('now', '-60 days') WHERE content='old note'")
+        report = await retention.run_retention()
+        async with Database._pool.read() as db:
+            async with db.execute("SELECT user_id, content FROM notes_archive") as c:
+                archived = await c.fetchall()
+        return report["notes"], archived, await Database.get_recent_notes(1)
+
+    assert run_db(scenario) == (1, [(1, "old note")], ["fresh note"])
+
+
+def test_run_retention_report(run_db):
+    async def scenario():
+        fired = await Database.add_reminder(1, 1, "done", "2020-01-01 09:00:00", None)
+        await Database.add_reminder(1, 1, "still pending", "2020-01-01 09:00:00", None)
+        await _execute("UPDATE reminders SET status='fired' WHERE id=?", (fired,))
+        await _execute("INSERT INTO outbox (chat_id, text, priority, status, next_attempt_at, created_at) "
+                       "VALUES (1, 'lost', 1, 'dead', 0, 0)")
+        for n in range(3):
+            await Database.add_to_context(1, "user", f"turn {n}", wait=True)
+        await _execute("UPDATE context SET created_at=datetime('now', '-90 days')")
+        report = await retention.run_retention(reminder_days=0)
+        assert retention.last_report is report
+        return report
+
+    report = run_db(scenario)
+    # Остання репліка контексту лишається, навіть якщо вона стара
+    assert {k: report[k] for k in ("reminders", "outbox", "context")} == {"reminders": 1, "outbox": 1, "context": 2}
+    assert report["bytes"] >= 0 and report["at"]
+
+
+def test_compact_leaves_legacy_file_to_offline_vacuum(run_db):
+    # Файл створений до auto_vacuum=INCREMENTAL
+    conn = sqlite3.connect(shard_path(0))
+    conn.execute("CREATE TABLE legacy (x)")
+    conn.close()
+
+    async def scenario():
+        await retention._compact(Database._pool)
+
+    run_db(scenario)
+    conn = sqlite3.connect(shard_path(0))
+    try:
+        assert conn.execute("PRAGMA auto_vacuum").fetchone() == (0,)
+    finally:
+        conn.close()
+    assert enable_incremental_vacuum(shard_path(0))
+    assert not enable_incremental_vacuum(shard_path(0))
+    conn = sqlite3.connect(shard_path(0))
+    try:
+        assert conn.execute("PRAGMA auto_vacuum").fetchone() == (2,)
+    finally:
+        conn.close()
+
+
+def test_new_database_uses_incremental_vacuum(run_db):
+    async def scenario():
+        await retention._compact(Database._pool)
+        async with Database._pool.read() as db:
+            async with db.execute("PRAGMA auto_vacuum") as c:
+                return (await c.fetchone())[0]
+
+    assert run_db(scenario) == 2
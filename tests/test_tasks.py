@@ -0,0 +1,29 @@
+import time
+
+import tasks
+from database import Database
+from utils import local_now
+
+
+def test_spam_off_keeps_recurring_reminder(run_db):
+    async def scenario():
+        await Database.get_user(1)
+        daily = await Database.add_reminder(1, 1, "daily", "2020-01-01 09:00:00", "daily")
+        once = await Database.add_reminder(1, 1, "once", "2020-01-01 09:00:00", None)
+        # Обидва повторювались у спам-режимі, а потім користувач його вимкнув
+        await Database.update_reminders([(rid, {"status": "spamming", "nag_count": 2, "last_message_id": 77,
+                                                "next_nag_at": int(time.time()) - 1}) for rid in (daily, once)])
+        rows = await Database.get_due_reminders(time.time())
+        assert {r[0] for r in rows} == {daily, once}
+        await tasks.deliver_reminders(None, rows)
+        async with Database.read(1) as db:
+            async with db.execute("SELECT nag_count, next_nag_at FROM reminders WHERE remind_text='daily'") as c:
+                nag = await c.fetchone()
+        return await Database.get_reminder(daily), nag, await Database.get_reminder(once)
+
+    (_, _, _, remind_time, _, status, last_message_id), nag, once = run_db(scenario)
+    assert status == "pending"
+    assert nag == (0, None)
+    assert remind_time.endswith(" 09:00:00") and remind_time > local_now().strftime("%Y-%m-%d %H:%M:%S")
+    assert last_message_id is None
+    assert once[5] == "fired"
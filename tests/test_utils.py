@@ -0,0 +1,55 @@
+import pytest
+
+from utils import estimate_tokens, normalize_datetime, normalize_time, partial_json_string, split_text
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2026-10-17 18:00:00", "2026-10-17 18:00:00"),
+    ("2026-10-17 18:00", "2026-10-17 18:00:00"),
+    ("2026-10-17T18:00:00", "2026-10-17 18:00:00"),
+    ("2026-10-17T18:00:00Z", "2026-10-17 18:00:00"),
+    ("2026-10-17 8:05", None),
+    ("2026-10-17", None),
+    ("2026-02-30 10:00:00", None),
+    ("завтра о 9", None),
+    (None, None),
+])
+def test_normalize_datetime(value, expected):
+    assert normalize_datetime(value) == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("18:00", "18:00"), ("9.30", "09:30"), ("9 30", "09:30"), ("24:00", None), ("9:75", None), ("abc", None),
+])
+def test_normalize_time(value, expected):
+    assert normalize_time(value) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"reply": "Приві', "Приві"),
+    ('{"reply": "', ""),
+    ('{"reply": "done", "is_reminder": false}', "done"),
+    ('{"is_reminder": false, "reply": "ok', "ok"),
+    ('{"reply": "say \\"hi\\" now', 'say "hi" now'),
+    ('{"reply": "line\\nnext', "line\nnext"),
+    # Обірвана escape-послідовність у кінці чанка відкидається
+    ('{"reply": "line\\', "line"),
+    ('{"reply": "Це \\u04', "Це "),
+    ('{"reply": "smile \\ud83d', "smile "),
+    ('{"reply": "smile \\ud83d\\ude00', "smile 😀"),
+    ('{"reply"', None),
+    ('{"is_reminder": true', None),
+    ('', None),
+])
+def test_partial_json_string(text, expected):
+    assert partial_json_string(text, "reply") == expected
+
+
+def test_split_text_cuts_on_word_boundaries():
+    text = " ".join(f"word{n}" for n in range(100))
+    chunks = split_text(text, 20)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 20 for chunk in chunks)
+    assert " ".join(chunks) == text
+    assert split_text("short", 20) == ["short"]
+    assert split_text("", 20) == []
@@ -0,0 +1,80 @@
+import asyncio
+
+import weather
+from http_client import http
+from weather import WeatherService
+
+
+class FakeResponse:
+    status = 200
+
+    def __init__(self, data, latency):
+        self.data = data
+        self.latency = latency
+
+    async def json(self):
+        return self.data
+
+    async def __aenter__(self):
+        await asyncio.sleep(self.latency)
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeSession:
+    """Замість Open-Meteo: запам'ятовує запити, на кожну точку повертає temp = latitude"""
+    closed = False
+
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.calls = []
+
+    def get(self, url, params, timeout):
+        self.calls.append(params)
+        lats = [float(lat) for lat in params["latitude"].split(",")]
+        items = [{"current": {"temperature_2m": lat}, "daily": {"precipitation_probability_max": [10]},
+                  "timezone": "Europe/Kyiv"} for lat in lats]
+        return FakeResponse(items if len(items) > 1 else items[0], self.latency)
+
+
+def _run(monkeypatch, scenario):
+    session = FakeSession()
+    monkeypatch.setattr(http, "_session", session)
+    monkeypatch.setattr(weather, "WEATHER_BATCH_DELAY", 0.01)
+    return asyncio.run(scenario(WeatherService())), session
+
+
+def test_concurrent_lookups_share_one_fetch(monkeypatch):
+    async def scenario(service):
+        return await asyncio.gather(*(service.get(50.47, 30.52) for _ in range(20)))
+
+    results, session = _run(monkeypatch, scenario)
+    assert len(session.calls) == 1
+    assert results == [{"temp": 50.5, "rain": 10, "timezone": "Europe/Kyiv"}] * 20
+
+
+def test_nearby_coordinates_share_a_cell(monkeypatch):
+    assert WeatherService.cell(50.46, 30.523) == WeatherService.cell(50.48, 30.47) == (50.5, 30.5)
+    assert WeatherService.cell(50.44, 30.52) != WeatherService.cell(50.46, 30.52)
+
+    async def scenario(service):
+        first = await service.get(50.46, 30.523)
+        # Сусідня точка в тій самій клітинці - з кешу, без нового запиту
+        second = await service.get(50.48, 30.47)
+        return first, second, service.stats()
+
+    (first, second, stats), session = _run(monkeypatch, scenario)
+    assert first == second
+    assert len(session.calls) == 1
+    assert stats == {"cells": 1, "requests": 1, "hit_rate": 0.5}
+
+
+def test_misses_are_batched_into_one_request(monkeypatch):
+    async def scenario(service):
+        return await service.get_many([(50.47, 30.52), (49.84, 24.03), (50.53, 30.48)])
+
+    result, session = _run(monkeypatch, scenario)
+    assert set(result) == {(50.5, 30.5), (49.8, 24.0)}
+    assert len(session.calls) == 1 and session.calls[0]["latitude"] == "50.5,49.8"
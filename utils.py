@@ -1,9 +1,9 @@
 import re
-import aiohttp
-import shutil
-import os
+import json
+import asyncio
+import pytz
 from datetime import datetime
-from config import logger, DB_NAME
+from config import TIMEZONE, logger
 from youtube_transcript_api import YouTubeTranscriptApi
 
 def clean_json_response(text):
@@ -13,47 +13,93 @@ def clean_json_response(text):
         return match.group(1) if match else text
     except: return text
 
-async def get_weather(lat, lon):
-    """Отримує погоду по координатах"""
-    if not lat or not lon: return None
-    url = f"https://api.open-meteo.com/v1/forecast?latitude={lat}&longitude={lon}&current=temperature_2m&daily=precipitation_probability_max&timezone=auto"
+def partial_json_string(text, key):
+    """Вже згенерована частина рядкового поля key з незавершеного JSON (стрімінг LLM):
+    '{"reply": "Приві' -> 'Приві'. None, якщо поле ще не почалось"""
+    match = re.search(r'"%s"\s*:\s*"' % re.escape(key), text)
+    if not match:
+        return None
+    # До першої неекранованої лапки; незавершену escape-послідовність у кінці відкидаємо
+    body = re.match(r'(?:[^"\\]|\\.)*', text[match.end():], re.DOTALL).group(0)
+    body = re.sub(r'\\u[0-9a-fA-F]{0,3}$', "", body)
+    body = re.sub(r'\\u[dD][89abAB][0-9a-fA-F]{2}$', "", body)  # половина emoji без пари
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=5) as resp:
-                if resp.status != 200: return None
-                data = await resp.json()
-                return {
-                    "temp": data['current']['temperature_2m'],
-                    "rain": data['daily']['precipitation_probability_max'][0]
-                }
-    except Exception as e:
-        logger.error(f"Weather error: {e}")
+        return json.loads(f'"{body}"', strict=False)
+    except ValueError:
         return None
 
-async def create_backup():
-    """Створює копію бази даних"""
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def user_tz(name=None):
+    """Часовий пояс користувача (NULL або невідомий - config.TIMEZONE)"""
     try:
-        backup_name = f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
-        shutil.copyfile(DB_NAME, backup_name)
-        return backup_name
-    except Exception as e:
-        logger.error(f"Backup error: {e}")
+        return pytz.timezone(name or TIMEZONE)
+    except pytz.UnknownTimeZoneError:
+        return pytz.timezone(TIMEZONE)
+
+def local_now(tz_name=None):
+    """Поточний локальний час користувача без tzinfo (як у remind_time)"""
+    return datetime.now(user_tz(tz_name)).replace(tzinfo=None)
+
+def local_to_epoch(local_str, tz_name=None):
+    """'YYYY-MM-DD HH:MM:SS' у поясі користувача -> UTC unix time"""
+    return int(user_tz(tz_name).localize(datetime.strptime(local_str, TIME_FORMAT)).timestamp())
+
+def normalize_time(text_time):
+    """'18:00', '9.30', '9 30' -> 'HH:MM' або None"""
+    clean_time = text_time.replace('.', ':').replace(',', ':').replace(' ', ':')
+    if re.match(r"^\d{1,2}:\d{2}$", clean_time):
+        parts = clean_time.split(':')
+        h, m = int(parts[0]), int(parts[1])
+        if 0 <= h <= 23 and 0 <= m <= 59:
+            return f"{h:02d}:{m:02d}"
+    return None
+
+def normalize_datetime(value):
+    """Час нагадування від LLM ('2026-10-17 18:00', ISO з 'T') -> 'YYYY-MM-DD HH:MM:SS' або None"""
+    text = str(value or "").strip()
+    if not re.match(r"^\d{4}-\d{2}-\d{2}[ T]\d{1,2}:\d{2}", text):
+        return None  # без години - не нагадування
+    try:
+        return datetime.fromisoformat(text).replace(tzinfo=None, microsecond=0).strftime(TIME_FORMAT)
+    except ValueError:
         return None
 
+def estimate_tokens(text):
+    """Груба оцінка кількості токенів (~3 символи на токен для uk/en).
+    Та сама формула використовується в міграції контексту: (length + 2) / 3"""
+    return (len(text) + 2) // 3 if text else 0
+
 def get_youtube_id(url):
     """Витягує ID відео з посилання"""
     regex = r"(?:v=|\/)([0-9A-Za-z_-]{11}).*"
     match = re.search(regex, url)
     return match.group(1) if match else None
 
+def _fetch_transcript(video_id, languages):
+    # Синхронний HTTP усередині бібліотеки - тому викликається через asyncio.to_thread
+    return " ".join(snippet.text for snippet in YouTubeTranscriptApi().fetch(video_id, languages=languages))
+
 async def get_video_transcript(video_id, lang="uk"):
-    """Отримує текст субтитрів"""
+    """Отримує повний текст субтитрів (у потоці, не блокуючи бота)"""
     try:
         languages = ['uk', 'en'] if lang == 'uk' else ['en', 'uk']
-        transcript_list = await YouTubeTranscriptApi.get_transcript(video_id, languages=languages)
-        formatter = lambda x: " ".join([d['text'] for d in x])
-        # Виконуємо синхронну функцію в окремому потоці, щоб не блокувати бота
-        return formatter(transcript_list)[:15000]
+        return await asyncio.to_thread(_fetch_transcript, video_id, languages)
     except Exception as e:
         logger.error(f"YouTube error: {e}")
         return None
+
+def split_text(text, max_tokens):
+    """Ріже текст на шматки до max_tokens (за estimate_tokens) по межах слів"""
+    limit = max(1, max_tokens * 3 - 2)
+    chunks = []
+    while text:
+        if len(text) <= limit:
+            chunks.append(text)
+            break
+        cut = text.rfind(" ", 0, limit)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip()
+    return chunks
@@ -0,0 +1,140 @@
+"""Погода з Open-Meteo з кешем по клітинках сітки.
+
+Координати прив'язуються до сітки WEATHER_GRID градусів (0.1° ≈ 10 км), результат
+кешується на WEATHER_TTL секунд. Промахи кешу, що прийшли протягом WEATHER_BATCH_DELAY,
+йдуть одним запитом (Open-Meteo приймає latitude/longitude списком через кому,
+до WEATHER_BATCH_MAX точок). Одночасні запити тієї ж клітинки чекають один і той самий
+результат (single-flight).
+"""
+import time
+import asyncio
+import aiohttp
+from http_client import http
+from config import WEATHER_GRID, WEATHER_TTL, WEATHER_BATCH_DELAY, WEATHER_BATCH_MAX, logger
+
+API_URL = "https://api.open-meteo.com/v1/forecast"
+# Невдалий запит кешуємо ненадовго, щоб не довбати API при збоях
+ERROR_TTL = 60
+
+class WeatherService:
+    def __init__(self):
+        self.cache = {}      # клітинка -> (expires_at, {"temp", "rain", "timezone"} або None)
+        self.inflight = {}   # клітинка -> Future, поки запит не завершився
+        self.pending = []    # клітинки, що чекають на пакетний запит
+        self.flush_task = None
+        self.hits = 0
+        self.misses = 0
+        self.requests = 0
+
+    @staticmethod
+    def cell(lat, lon):
+        return (round(round(lat / WEATHER_GRID) * WEATHER_GRID, 4),
+                round(round(lon / WEATHER_GRID) * WEATHER_GRID, 4))
+
+    def _cached(self, cell):
+        entry = self.cache.get(cell)
+        if entry and entry[0] > time.monotonic():
+            return entry
+        return None
+
+    def peek(self, lat, lon):
+        """Погода з кешу без очікування; при промаху запускає фонове оновлення і повертає None"""
+        if not lat or not lon:
+            return None
+        cell = self.cell(lat, lon)
+        entry = self._cached(cell)
+        if entry:
+            self.hits += 1
+            return entry[1]
+        self._request(cell)
+        return None
+
+    async def get(self, lat, lon):
+        """Погода для координат (з кешу або пакетним запитом) або None"""
+        if not lat or not lon:
+            return None
+        return (await self.get_many([(lat, lon)])).get(self.cell(lat, lon))
+
+    async def get_many(self, coords):
+        """{клітинка: погода} для списку (lat, lon); ключі - WeatherService.cell()"""
+        result = {}
+        waiting = {}
+        for lat, lon in coords:
+            cell = self.cell(lat, lon)
+            if cell in result or cell in waiting:
+                continue
+            entry = self._cached(cell)
+            if entry:
+                self.hits += 1
+                result[cell] = entry[1]
+            else:
+                waiting[cell] = self._request(cell)
+        if waiting:
+            # shield: скасування одного з тих, хто чекає, не скасовує спільний запит
+            values = await asyncio.gather(*(asyncio.shield(f) for f in waiting.values()))
+            result.update(zip(waiting, values))
+        return result
+
+    def _request(self, cell):
+        fut = self.inflight.get(cell)
+        if fut is None:
+            self.misses += 1
+            fut = asyncio.get_running_loop().create_future()
+            self.inflight[cell] = fut
+            self.pending.append(cell)
+            if self.flush_task is None or self.flush_task.done():
+                self.flush_task = asyncio.create_task(self._flush())
+        return fut
+
+    async def _flush(self):
+        # Промахи, що прийшли під час запиту, підуть наступним пакетом у цьому ж циклі
+        while self.pending:
+            await asyncio.sleep(WEATHER_BATCH_DELAY)
+            cells, self.pending = self.pending, []
+            chunks = [cells[i:i + WEATHER_BATCH_MAX] for i in range(0, len(cells), WEATHER_BATCH_MAX)]
+            await asyncio.gather(*(self._fetch(chunk) for chunk in chunks))
+
+    async def _fetch(self, cells):
+        params = {
+            "latitude": ",".join(str(lat) for lat, _ in cells),
+            "longitude": ",".join(str(lon) for _, lon in cells),
+            "current": "temperature_2m",
+            "daily": "precipitation_probability_max",
+            "timezone": "auto",
+            "forecast_days": 1,
+        }
+        results = {}
+        try:
+            self.requests += 1
+            async with http.session.get(API_URL, params=params, timeout=aiohttp.ClientTimeout(total=10)) as resp:
+                if resp.status != 200:
+                    raise RuntimeError(f"HTTP {resp.status}")
+                data = await resp.json()
+            # Для однієї точки Open-Meteo повертає об'єкт, для кількох - список у тому ж порядку
+            items = data if isinstance(data, list) else [data]
+            for cell, item in zip(cells, items):
+                results[cell] = {
+                    "temp": item['current']['temperature_2m'],
+                    "rain": item['daily']['precipitation_probability_max'][0],
+                    # timezone=auto: Open-Meteo визначає пояс за координатами
+                    "timezone": item.get('timezone'),
+                }
+        except Exception as e:
+            logger.error(f"Weather error ({len(cells)} cells): {e}")
+        now = time.monotonic()
+        if len(self.cache) > 10000:
+            self.cache = {c: entry for c, entry in self.cache.items() if entry[0] > now}
+        expires = now + WEATHER_TTL
+        for cell in cells:
+            value = results.get(cell)
+            self.cache[cell] = (expires if value else now + ERROR_TTL, value)
+            fut = self.inflight.pop(cell, None)
+            if fut and not fut.done():
+                fut.set_result(value)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"cells": len(self.cache), "requests": self.requests,
+                "hit_rate": self.hits / total if total else 0.0}
+
+weather = WeatherService()